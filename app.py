@@ -1,17 +1,24 @@
-from fastapi import FastAPI, HTTPException, Depends, Request
+from fastapi import FastAPI, HTTPException, Depends, Request, Query
 from pydantic import BaseModel
 from typing import List, Optional
 # from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 # from jose import JWTError, jwt
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import HTMLResponse
+from fastapi.responses import HTMLResponse, StreamingResponse
+import json
 import os
 import dotenv
 
 # 导入自定义模块
 from db_utils.parking_graph_manager import ParkingGraphManager
 from db_utils.parking_graph_query import ParkingGraphQuery
+from db_utils.async_access import AsyncParkingDataAccess
+from db_utils.connection_provider import GraphConnectionProvider
+from db_utils.cache import TTLCache, SharedCache, VersionedResultCache
+from db_utils.embedding_store import EmbeddingStore
+from db_utils.spot_catalog import SpotCatalog, ensure_catalog
+from db_utils.spatial_index import parse_location
 
 # # 令牌配置
 # SECRET_KEY = "your_secret_key"
@@ -41,8 +48,67 @@ if load_status is False:
 URI = os.getenv("NEO4J_URI")
 AUTH = (os.getenv("NEO4J_USERNAME"), os.getenv("NEO4J_PASSWORD"))
 
-parking_graph_manager = ParkingGraphManager(URI, AUTH[0], AUTH[1])
-parking_graph_query = ParkingGraphQuery(URI, AUTH[0], AUTH[1])
+# 所有数据库访问共享同一个连接池，大小和超时可通过环境变量配置
+connection_provider = GraphConnectionProvider(URI, AUTH[0], AUTH[1],
+                                              max_size=int(os.getenv("NEO4J_POOL_MAX_SIZE", "16")),
+                                              acquire_timeout=float(os.getenv("NEO4J_POOL_ACQUIRE_TIMEOUT", "30")),
+                                              idle_timeout=float(os.getenv("NEO4J_POOL_IDLE_TIMEOUT", "300")))
+
+# 停车场和用户节点的查询缓存；设置 NODE_CACHE_REDIS_URL 后改用Redis，使多个工作进程共享缓存
+NODE_CACHE_TTL = float(os.getenv("NODE_CACHE_TTL", "60"))
+if os.getenv("NODE_CACHE_REDIS_URL"):
+    import redis
+
+    node_cache = SharedCache(redis.Redis.from_url(os.getenv("NODE_CACHE_REDIS_URL")), ttl=NODE_CACHE_TTL)
+else:
+    node_cache = TTLCache(max_size=int(os.getenv("NODE_CACHE_MAX_SIZE", "10000")), ttl=NODE_CACHE_TTL)
+
+# 推荐引擎每隔 RATING_RELOAD_INTERVAL 秒检查数据库中的评分，被其他工作进程或批量导入修改后重新加载
+# 推荐结果缓存：评分数据变化后，旧结果最多再返回 RECOMMENDATION_MAX_STALE 秒，期间在后台重新计算
+recommendation_cache = VersionedResultCache(max_size=int(os.getenv("RECOMMENDATION_CACHE_MAX_SIZE", "10000")),
+                                            max_stale=float(os.getenv("RECOMMENDATION_MAX_STALE", "300")))
+
+# 设置 EMBEDDING_STORE_PATH（model/main.py 的 --export_path）后，/recommendations/{user_id} 改用NGCF嵌入向量打分
+# EMBEDDING_ANN_LISTS 大于0时用IVF近似检索，EMBEDDING_ANN_PROBES 调节召回率与延迟
+embedding_store = EmbeddingStore(os.getenv("EMBEDDING_STORE_PATH"),
+                                 ann_lists=int(os.getenv("EMBEDDING_ANN_LISTS", "0")),
+                                 ann_probes=int(os.getenv("EMBEDDING_ANN_PROBES", "8"))) \
+    if os.getenv("EMBEDDING_STORE_PATH") else None
+
+# 设置 SPOT_CATALOG_PATH（db_utils/spot_catalog.py 的 --output）后，停车场查询和筛选读取内存映射的停车场快照；
+# 快照不存在时在启动时从数据库编译，之后通过 POST /parking/catalog/refresh 从数据库刷新
+SPOT_CATALOG_PATH = os.getenv("SPOT_CATALOG_PATH")
+if SPOT_CATALOG_PATH:
+    # 多个工作进程同时启动时由文件锁保证只有一个进程编译快照
+    ensure_catalog(SPOT_CATALOG_PATH, connection_provider.graph)
+spot_catalog = SpotCatalog(SPOT_CATALOG_PATH) if SPOT_CATALOG_PATH else None
+
+parking_graph_query = ParkingGraphQuery(connection_provider,
+                                        neighbor_index_path=os.getenv("NEIGHBOR_INDEX_PATH"),
+                                        node_cache=node_cache,
+                                        recommendation_cache=recommendation_cache,
+                                        embedding_store=embedding_store,
+                                        spot_catalog=spot_catalog,
+                                        rating_reload_interval=float(os.getenv("RATING_RELOAD_INTERVAL", "30")))
+parking_graph_manager = ParkingGraphManager(connection_provider,
+                                            recommendation_engine=parking_graph_query.recommendation_engine,
+                                            node_cache=node_cache)
+
+# 数据库调用在独立线程池中执行，线程池大小可通过环境变量配置
+data_access = AsyncParkingDataAccess(parking_graph_query, parking_graph_manager,
+                                     max_workers=int(os.getenv("DB_EXECUTOR_WORKERS", "16")))
+
+
+@app.on_event("shutdown")
+def shutdown_services():
+    """
+    服务关闭时等待进行中的数据库调用完成，并保存用户近邻索引
+    """
+    data_access.shutdown()
+    recommendation_cache.shutdown()
+    parking_graph_query.recommendation_engine.flush()
+    connection_provider.close()
+
 
 # Pydantic 模型定义
 class UserCreate(BaseModel):
@@ -72,8 +138,24 @@ class ParkingSpot(BaseModel):
 
 class ParkingRecommendationRequest(BaseModel):
     user_id: int
-    location: str
+    location: str  # 用户位置，"经度,纬度"
     time: str
+    radius: float = 3000  # 搜索半径（米）
+    # 可选的候选停车场筛选条件
+    parking_types: Optional[List[str]] = None
+    max_fee: Optional[float] = None
+    parking_difficulty: Optional[List[str]] = None
+    near_elevator: Optional[bool] = None
+    has_surveillance: Optional[bool] = None
+
+
+class BatchRecommendationRequest(BaseModel):
+    user_ids: List[int]  # 需要推荐的用户ID列表
+    k: int = 10  # 考虑的前k个最相似用户
+    parking_common: int = 3  # 评估相似用户时，至少共同打分的停车场数目
+    users_common: int = 2  # 被推荐的停车场至少要被几名相似用户打分
+    threshold_sim: float = 0.9  # 用户相似度的最小阈值
+    m: int = 5  # 每个用户返回的推荐停车场数量
 
 
 # # 密码验证函数
@@ -157,7 +239,7 @@ async def read_index(request: Request):
 
 @app.get("/user/{user_id}")
 async def get_user_preferences(user_id: int):
-    user_node, message = parking_graph_query.query_user_node(user_id)
+    user_node, message = await data_access.query_user_node(user_id)
     if not user_node:
         raise HTTPException(status_code=404, detail="未找到用户")
 
@@ -177,7 +259,7 @@ async def update_user_preferences(user_id: int, preferences: UserPreferences):
     update_data = preferences.dict()
 
     # 更新用户节点
-    result, message = parking_graph_manager.update_user_node(user_id, update_data)
+    result, message = await data_access.update_user_node(user_id, update_data)
     if not result:
         raise HTTPException(status_code=404, detail=message)
 
@@ -185,9 +267,26 @@ async def update_user_preferences(user_id: int, preferences: UserPreferences):
 
 
 # 获取停车位信息
+@app.get("/parking")
+async def filter_parking(parking_type: Optional[List[str]] = Query(None), max_fee: Optional[float] = None,
+                         parking_difficulty: Optional[List[str]] = Query(None), near_elevator: Optional[bool] = None,
+                         has_surveillance: Optional[bool] = None, limit: int = 100):
+    return await data_access.filter_parking_spots(parking_types=parking_type, max_fee=max_fee,
+                                                  parking_difficulty=parking_difficulty,
+                                                  near_elevator=near_elevator, has_surveillance=has_surveillance,
+                                                  limit=limit)
+
+
+@app.post("/parking/catalog/refresh")
+async def refresh_parking_catalog():
+    if spot_catalog is None:
+        raise HTTPException(status_code=404, detail="未配置停车场快照")
+    return {"n_spots": await data_access.refresh_spot_catalog()}
+
+
 @app.get("/parking/{parking_id}")
 async def get_parking(parking_id: int):
-    parking_node, message = parking_graph_query.query_park_node(parking_id)
+    parking_node, message = await data_access.query_park_node(parking_id)
     if not parking_node:
         raise HTTPException(status_code=404, detail=message)
     return dict(parking_node)
@@ -214,15 +313,58 @@ async def get_parking(parking_id: int):
 #         raise HTTPException(status_code=404, detail="未找到推荐")
 #     return recommendations
 
+# 获取数据库连接池指标
+@app.get("/metrics/pool")
+async def get_pool_metrics():
+    return connection_provider.metrics()
+
+
+# 获取节点查询缓存指标
+@app.get("/metrics/cache")
+async def get_cache_metrics():
+    return {"nodes": node_cache.stats(), "recommendations": recommendation_cache.stats()}
+
+
 # 获取停车推荐
 @app.get("/recommendations/{user_id}")
 async def get_recommendations(user_id: str):
-    recommendations = parking_graph_query.get_recommendations(user_id)
+    recommendations = await data_access.get_recommendations(user_id)
     if not recommendations:
         raise HTTPException(status_code=404, detail="未找到推荐")
     return recommendations
 
 
+# 获取用户位置附近的停车推荐
+@app.post("/recommendations")
+async def get_nearby_recommendations(request: ParkingRecommendationRequest):
+    try:
+        parse_location(request.location)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    filters = {field: getattr(request, field) for field in ("parking_types", "max_fee", "parking_difficulty",
+                                                             "near_elevator", "has_surveillance")
+               if getattr(request, field) is not None}
+    recommendations = await data_access.get_recommendations(request.user_id, location=request.location,
+                                                             radius=request.radius, filters=filters or None)
+    if not recommendations:
+        raise HTTPException(status_code=404, detail="未找到推荐")
+    return recommendations
+
+
+# 批量获取停车推荐，以NDJSON格式逐行返回每个用户的结果
+@app.post("/recommendations/batch")
+async def get_batch_recommendations(request: BatchRecommendationRequest):
+    params = request.dict()
+    user_ids = params.pop("user_ids")
+
+    async def generate():
+        async for user_id, recommendations in data_access.iter_recommendations_batch(user_ids, **params):
+            yield json.dumps({"user_id": user_id, "recommendations": recommendations}, ensure_ascii=False) + "\n"
+
+    return StreamingResponse(generate(), media_type="application/x-ndjson")
+
+
 if __name__ == "__main__":
     import uvicorn
 
@@ -0,0 +1,99 @@
+import numpy as np
+import scipy.sparse as sp
+
+"""
+停车场嵌入向量的近似最近邻（最大内积）检索：倒排文件索引（IVF），只对查询最相关的几个簇内的停车场打分
+"""
+
+
+class IVFIndex:
+    """
+    IVFIndex类用k-means把停车场向量划分为n_lists个簇，查询时按簇中心与用户向量的内积选出n_probes个簇，
+    只在这些簇的停车场中精确打分。n_probes越大召回率越高、延迟越大，等于n_lists时与全量打分结果相同。
+    """
+
+    def __init__(self, n_lists=100, n_probes=8, n_iter=20, seed=0):
+        """
+        初始化索引参数
+        :param n_lists: 簇的数量，一般取停车场数量的平方根左右
+        :param n_probes: 每次查询默认检查的簇数量
+        :param n_iter: k-means迭代次数
+        :param seed: 随机种子，保证相同的向量得到相同的索引
+        """
+        self.n_lists = n_lists
+        self.n_probes = n_probes
+        self.n_iter = n_iter
+        self.seed = seed
+
+        self.vectors = None
+        self.centroids = None
+        # 按簇排列的停车场行号，第i个簇为 rows[offsets[i]:offsets[i + 1]]
+        self.rows = None
+        self.offsets = None
+
+    def _assign(self, vectors, chunk_size=65536):
+        """
+        把向量分配到欧氏距离最近的簇中心
+        """
+        centroid_norms = (self.centroids ** 2).sum(axis=1)
+        labels = np.empty(len(vectors), dtype=np.int64)
+        for start in range(0, len(vectors), chunk_size):
+            chunk = np.asarray(vectors[start:start + chunk_size], dtype=np.float32)
+            labels[start:start + chunk_size] = np.argmin(centroid_norms - 2 * chunk @ self.centroids.T, axis=1)
+        return labels
+
+    def build(self, vectors):
+        """
+        对停车场向量做k-means聚类并建立倒排表
+        :param vectors: 停车场向量矩阵 (n_items, dim)，可以是numpy.memmap
+        :return: self
+        """
+        n_items = len(vectors)
+        n_lists = max(1, min(self.n_lists, n_items))
+        rng = np.random.RandomState(self.seed)
+
+        self.vectors = vectors
+        self.centroids = np.asarray(vectors[np.sort(rng.choice(n_items, n_lists, replace=False))], dtype=np.float32)
+        for _ in range(self.n_iter):
+            labels = self._assign(vectors)
+            counts = np.bincount(labels, minlength=n_lists)
+            membership = sp.csr_matrix((np.ones(n_items, dtype=np.float32), (labels, np.arange(n_items))),
+                                       shape=(n_lists, n_items))
+            sums = np.asarray(membership @ np.asarray(vectors, dtype=np.float32))
+            empty = counts == 0
+            self.centroids[~empty] = sums[~empty] / counts[~empty, None]
+            # 空簇重新取随机停车场作为中心
+            if empty.any():
+                self.centroids[empty] = np.asarray(vectors[rng.choice(n_items, int(empty.sum()))], dtype=np.float32)
+
+        labels = self._assign(vectors)
+        self.rows = np.argsort(labels, kind='stable')
+        self.offsets = np.concatenate([[0], np.cumsum(np.bincount(labels, minlength=n_lists))])
+        self.n_lists = n_lists
+        return self
+
+    def search(self, query, m, n_probes=None, exclude=None):
+        """
+        检索与查询向量内积最大的m个停车场
+        :param query: 用户向量 (dim,)
+        :param m: 返回数量
+        :param n_probes: 检查的簇数量，为None时使用初始化时的n_probes
+        :param exclude: 可选的需要排除的停车场行号集合（如训练集中已交互的停车场）
+        :return: (停车场行号数组, 得分数组)，按得分降序排列
+        """
+        query = np.asarray(query, dtype=np.float32)
+        n_probes = min(n_probes or self.n_probes, self.n_lists)
+        probes = np.argpartition(-(self.centroids @ query), n_probes - 1)[:n_probes]
+        candidates = np.concatenate([self.rows[self.offsets[p]:self.offsets[p + 1]] for p in probes])
+        if exclude is not None and len(exclude) > 0:
+            candidates = candidates[~np.isin(candidates, np.asarray(list(exclude)))]
+
+        m = min(m, len(candidates))
+        if m <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        # 按行号顺序读取，内存映射的文件按页顺序访问
+        candidates = np.sort(candidates)
+        scores = np.asarray(self.vectors[candidates] @ query)
+        top = np.argpartition(-scores, m - 1)[:m]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return candidates[top], scores[top]
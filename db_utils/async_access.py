@@ -0,0 +1,100 @@
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+异步数据访问层：在独立的线程池中执行同步的数据库查询，避免阻塞FastAPI的事件循环
+"""
+
+
+class AsyncParkingDataAccess:
+    """
+    AsyncParkingDataAccess类把ParkingGraphQuery和ParkingGraphManager的同步方法包装为可await的协程，
+    每次调用都提交到一个大小可配置的专用线程池中执行。
+    """
+
+    def __init__(self, graph_query, graph_manager, max_workers=16):
+        """
+        初始化线程池
+        :param graph_query: ParkingGraphQuery对象
+        :param graph_manager: ParkingGraphManager对象
+        :param max_workers: 线程池大小，即同时进行的数据库调用的最大数量
+        """
+        self.graph_query = graph_query
+        self.graph_manager = graph_manager
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='parking-db')
+
+    async def _run(self, func, *args, **kwargs):
+        """
+        在线程池中执行同步函数并等待结果
+        """
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, functools.partial(func, *args, **kwargs))
+
+    async def query_park_node(self, park_id):
+        """
+        查询停车场节点
+        :param park_id: 停车场的ID
+        :return: 匹配的停车场节点，如果未找到则返回消息
+        """
+        return await self._run(self.graph_query.query_park_node, park_id)
+
+    async def filter_parking_spots(self, **conditions):
+        """
+        按条件筛选停车场
+        :param conditions: 筛选条件，参数含义与 ParkingGraphQuery.filter_parking_spots 相同
+        :return: 停车场属性字典的列表
+        """
+        return await self._run(self.graph_query.filter_parking_spots, **conditions)
+
+    async def refresh_spot_catalog(self):
+        """
+        从数据库重新编译停车场快照
+        :return: 快照中的停车场数量
+        """
+        return await self._run(self.graph_query.refresh_spot_catalog)
+
+    async def query_user_node(self, user_id):
+        """
+        查询用户节点
+        :param user_id: 用户的ID
+        :return: 匹配的用户节点，如果未找到则返回消息
+        """
+        return await self._run(self.graph_query.query_user_node, user_id)
+
+    async def update_user_node(self, user_id, update_data):
+        """
+        更新用户节点
+        :param user_id: 用户ID
+        :param update_data: 需要更新的数据（字典形式）
+        :return: 更新结果和对应的消息
+        """
+        return await self._run(self.graph_manager.update_user_node, user_id, update_data)
+
+    async def get_recommendations(self, user_id, **kwargs):
+        """
+        获取停车场推荐列表，参数同 ParkingGraphQuery.get_recommendations
+        :param user_id: 用户的ID
+        :return: 推荐的停车场列表
+        """
+        return await self._run(self.graph_query.get_recommendations, user_id, **kwargs)
+
+    async def iter_recommendations_batch(self, user_ids, **kwargs):
+        """
+        批量获取停车场推荐，逐个用户产出结果，参数同 ParkingGraphQuery.get_recommendations_batch
+        :param user_ids: 用户ID列表
+        :return: 异步生成器，依次产出 (用户ID, 推荐的停车场列表)
+        """
+        results = self.graph_query.get_recommendations_batch(user_ids, **kwargs)
+        finished = object()
+        while True:
+            item = await self._run(next, results, finished)
+            if item is finished:
+                break
+            yield item
+
+    def shutdown(self):
+        """
+        关闭线程池，等待正在执行的调用完成
+        """
+        self.executor.shutdown(wait=True)
@@ -0,0 +1,274 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+"""
+进程内的LRU + TTL缓存，以及可在多个uvicorn工作进程间共享的缓存后端
+"""
+
+
+class TTLCache:
+    """
+    TTLCache类是有容量上限的进程内缓存：超过容量时淘汰最久未使用的条目，条目超过ttl秒后过期，
+    并统计命中、未命中、淘汰和过期次数。
+    """
+
+    def __init__(self, max_size=1024, ttl=60.0):
+        """
+        初始化缓存
+        :param max_size: 最多缓存的条目数
+        :param ttl: 条目的存活时间（秒）
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def get(self, key):
+        """
+        读取缓存
+        :param key: 键
+        :return: 缓存的值，未命中或已过期时返回None
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def set(self, key, value):
+        """
+        写入缓存
+        :param key: 键
+        :param value: 值
+        """
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def delete(self, key):
+        """
+        使某个键失效
+        :param key: 键
+        """
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        """
+        清空缓存
+        """
+        with self._lock:
+            self._data.clear()
+
+    def stats(self):
+        """
+        获取缓存统计信息
+        :return: 字典，包含条目数、命中、未命中、淘汰和过期次数
+        """
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SharedCache:
+    """
+    SharedCache类把缓存存放在外部的键值服务（如Redis）中，使多个工作进程看到一致的数据，
+    失效操作对所有进程立即生效。值以JSON形式保存，过期由外部服务负责。
+    """
+
+    def __init__(self, client, ttl=60.0, prefix='parking:'):
+        """
+        初始化共享缓存
+        :param client: 提供 get/set(ex=)/delete 方法的客户端，例如 redis.Redis
+        :param ttl: 条目的存活时间（秒）
+        :param prefix: 键前缀
+        """
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self._lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        """
+        读取缓存
+        :param key: 键
+        :return: 缓存的值，未命中时返回None
+        """
+        raw = self.client.get(self.prefix + key)
+        with self._lock:
+            if raw is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return json.loads(raw)
+
+    def set(self, key, value):
+        """
+        写入缓存
+        :param key: 键
+        :param value: 可JSON序列化的值
+        """
+        self.client.set(self.prefix + key, json.dumps(value, ensure_ascii=False), ex=max(int(self.ttl), 1))
+
+    def delete(self, key):
+        """
+        使某个键失效
+        :param key: 键
+        """
+        self.client.delete(self.prefix + key)
+
+    def stats(self):
+        """
+        获取本进程的缓存统计信息
+        :return: 字典，包含命中和未命中次数
+        """
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+
+def node_cache_key(label, node_id):
+    """
+    生成节点缓存的键
+    :param label: 节点标签
+    :param node_id: 节点ID
+    :return: 缓存键
+    """
+    return f"{label}:{int(node_id)}"
+
+
+class VersionedResultCache:
+    """
+    VersionedResultCache类缓存计算结果，并为每条结果记录计算时的数据版本号。
+    版本号变化后，在max_stale秒内仍先返回旧结果，同时在后台重新计算（stale-while-revalidate）。
+    """
+
+    def __init__(self, max_size=10000, max_stale=300.0, refresh_workers=2):
+        """
+        初始化结果缓存
+        :param max_size: 最多缓存的条目数
+        :param max_stale: 过期结果最多还能被返回的时间（秒），超过后同步重新计算
+        :param refresh_workers: 后台刷新线程数
+        """
+        self.max_size = max_size
+        self.max_stale = max_stale
+        self._data = OrderedDict()
+        self._refreshing = set()
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=refresh_workers, thread_name_prefix='result-refresh')
+
+        self.hits = 0
+        self.stale_hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.refreshes = 0
+
+    def get_or_compute(self, key, version, compute):
+        """
+        读取缓存结果，必要时计算
+        :param key: 键
+        :param version: 当前数据版本号，用于判断缓存结果是否过期
+        :param compute: 无参数的计算函数，返回 (计算时实际使用的数据版本号, 结果)；
+                        结果按该版本号缓存，计算期间数据发生变化时不会把旧数据算出的结果记为新版本
+        :return: 计算结果
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None:
+                value, cached_version, stale_since = item
+                self._data.move_to_end(key)
+                if cached_version == version:
+                    self.hits += 1
+                    return value
+                if stale_since is None:
+                    stale_since = time.monotonic()
+                    self._data[key] = (value, cached_version, stale_since)
+                if time.monotonic() - stale_since <= self.max_stale:
+                    self.stale_hits += 1
+                    if key not in self._refreshing:
+                        self._refreshing.add(key)
+                        self._executor.submit(self._refresh, key, version, compute)
+                    return value
+            self.misses += 1
+
+        computed_version, value = compute()
+        self._store(key, computed_version, value)
+        return value
+
+    def _refresh(self, key, version, compute):
+        """
+        后台重新计算一条结果
+        """
+        try:
+            self._store(key, *compute())
+            with self._lock:
+                self.refreshes += 1
+        except Exception as e:
+            print(f"后台刷新缓存结果失败: {str(e)}")
+        finally:
+            with self._lock:
+                self._refreshing.discard(key)
+
+    def _store(self, key, version, value):
+        """
+        写入一条结果，版本号不低于已有结果时才覆盖
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[1] > version:
+                return
+            self._data[key] = (value, version, None)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_size:
+                self._data.popitem(last=False)
+                self.evictions += 1
+
+    def stats(self):
+        """
+        获取缓存统计信息
+        :return: 字典，包含条目数、命中、过期命中、未命中、淘汰和后台刷新次数
+        """
+        with self._lock:
+            return {
+                "size": len(self._data),
+                "max_size": self.max_size,
+                "hits": self.hits,
+                "stale_hits": self.stale_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "refreshes": self.refreshes,
+            }
+
+    def shutdown(self):
+        """
+        关闭后台刷新线程池
+        """
+        self._executor.shutdown(wait=False)
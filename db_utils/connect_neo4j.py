@@ -1,4 +1,6 @@
+import argparse
 import csv
+import json
 import os
 import dotenv
 from neo4j import GraphDatabase
@@ -89,10 +91,148 @@ def insert_ratings(tx, ratings):
             MERGE (u:User {id: $user_id})
             MERGE (p:ParkingSpot {id: $parking_spot_id})
             MERGE (u)-[r:RATED]->(p)
-            SET r.grading = $rating
+            SET r.grading = $rating, r.ingested_at = timestamp()
         """, **rating)
 
 
+def create_constraints(session):
+    """
+    为 User.id 和 ParkingSpot.id 创建唯一性约束，使 MERGE 能够走索引查找，并为 RATED.ingested_at 创建索引。
+    :param session: 数据库会话
+    """
+    session.run("CREATE CONSTRAINT user_id_unique IF NOT EXISTS FOR (u:User) REQUIRE u.id IS UNIQUE")
+    session.run("CREATE CONSTRAINT parking_spot_id_unique IF NOT EXISTS FOR (p:ParkingSpot) REQUIRE p.id IS UNIQUE")
+    # 评分关系的写入时间，供 convert_ratings_to_train_format.py 的增量导出按范围查找
+    session.run("CREATE INDEX rated_ingested_at IF NOT EXISTS FOR ()-[r:RATED]-() ON (r.ingested_at)")
+
+
+def insert_parking_spots_batch(tx, rows):
+    """
+    使用 UNWIND 一次写入一批停车位数据。
+    :param tx: 数据库事务
+    :param rows: 一批停车位的数据列表
+    """
+    tx.run("""
+        UNWIND $rows AS row
+        MERGE (p:ParkingSpot {id: row.id})
+        SET p.drive_distance = row.drive_distance,
+            p.walk_distance = row.walk_distance,
+            p.search_time = row.search_time,
+            p.space_size = row.space_size,
+            p.difficulty = row.difficulty,
+            p.near_elevator = row.near_elevator,
+            p.has_surveillance = row.has_surveillance,
+            p.cost_per_hour = row.cost_per_hour
+    """, rows=rows)
+
+
+def insert_ratings_batch(tx, rows):
+    """
+    使用 UNWIND 一次写入一批评分数据，创建用户与停车位之间的 RATED 关系。
+    :param tx: 数据库事务
+    :param rows: 一批评分的数据列表
+    """
+    tx.run("""
+        UNWIND $rows AS row
+        MERGE (u:User {id: row.user_id})
+        MERGE (p:ParkingSpot {id: row.parking_spot_id})
+        MERGE (u)-[r:RATED]->(p)
+        SET r.grading = row.rating, r.ingested_at = timestamp()
+    """, rows=rows)
+
+
+def load_checkpoint(checkpoint_file):
+    """
+    读取断点文件，返回每个阶段已提交的行数。
+    :param checkpoint_file: 断点文件路径
+    """
+    if checkpoint_file and os.path.exists(checkpoint_file):
+        with open(checkpoint_file, 'r', encoding='utf-8') as file:
+            return json.load(file)
+    return {}
+
+
+def save_checkpoint(checkpoint_file, checkpoint):
+    """
+    原子地写入断点文件。
+    :param checkpoint_file: 断点文件路径
+    :param checkpoint: 每个阶段已提交的行数
+    """
+    if not checkpoint_file:
+        return
+    tmp_file = checkpoint_file + '.tmp'
+    with open(tmp_file, 'w', encoding='utf-8') as file:
+        json.dump(checkpoint, file)
+    os.replace(tmp_file, checkpoint_file)
+
+
+def insert_in_chunks(session, stage, work, rows, chunk_size, checkpoint_file, checkpoint):
+    """
+    按块写入数据，每块单独提交一个事务并记录断点，失败后可从上次提交的块继续。
+    :param session: 数据库会话
+    :param stage: 阶段名称，用作断点文件中的键
+    :param work: 写入一批数据的事务函数
+    :param rows: 全部数据
+    :param chunk_size: 每块的行数
+    :param checkpoint_file: 断点文件路径，为 None 时不记录断点
+    :param checkpoint: 已读取的断点信息
+    """
+    start = checkpoint.get(stage, 0)
+    if start:
+        print(f"Resuming {stage} from row {start}.")
+
+    with tqdm(total=len(rows), initial=start, desc=f"Inserting {stage}", unit="row") as progress:
+        for offset in range(start, len(rows), chunk_size):
+            chunk = rows[offset:offset + chunk_size]
+            session.execute_write(work, chunk)
+            checkpoint[stage] = offset + len(chunk)
+            save_checkpoint(checkpoint_file, checkpoint)
+            progress.update(len(chunk))
+
+
+def bulk_insert_data_into_neo4j(parking_spots_file, ratings_file, chunk_size=5000, checkpoint_file=None):
+    """
+    批量模式：先创建唯一性约束，再按块使用 UNWIND 写入停车位和评分数据，每块单独提交。
+    :param parking_spots_file: 停车位的 CSV 文件路径
+    :param ratings_file: 用户对停车位的评分 CSV 文件路径
+    :param chunk_size: 每个事务写入的行数
+    :param checkpoint_file: 断点文件路径，导入失败后重新运行会从上次提交的块继续
+    """
+    parking_spots = load_parking_spots(parking_spots_file)
+    ratings = load_ratings(ratings_file)
+    checkpoint = load_checkpoint(checkpoint_file)
+    # 断点只对同一组输入文件有效
+    sources = [os.path.abspath(parking_spots_file), os.path.abspath(ratings_file)]
+    if checkpoint.get('sources') != sources:
+        checkpoint = {'sources': sources}
+
+    try:
+        with driver.session() as session:
+            driver.verify_connectivity()
+            print("Connection established.")
+
+            create_constraints(session)
+
+            insert_in_chunks(session, 'parking_spots', insert_parking_spots_batch, parking_spots,
+                             chunk_size, checkpoint_file, checkpoint)
+            print(f"Inserted {len(parking_spots)} parking spots.")
+
+            insert_in_chunks(session, 'ratings', insert_ratings_batch, ratings,
+                             chunk_size, checkpoint_file, checkpoint)
+            print(f"Inserted {len(ratings)} ratings.")
+
+        # 全部导入完成后清除断点
+        if checkpoint_file and os.path.exists(checkpoint_file):
+            os.remove(checkpoint_file)
+
+    except Exception as e:
+        print(f"Failed to insert data into Neo4j: {e}")
+        if checkpoint_file:
+            print(f"Committed progress saved to {checkpoint_file}, rerun to resume.")
+    finally:
+        driver.close()
+
+
 def insert_data_into_neo4j(parking_spots_file, ratings_file):
     """
     从文件中读取数据并插入到 Neo4j 数据库。
@@ -125,9 +265,21 @@ def insert_data_into_neo4j(parking_spots_file, ratings_file):
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Load parking spots and ratings into Neo4j.")
+    parser.add_argument('--bulk', action='store_true',
+                        help='Use the chunked UNWIND bulk loader.')
+    parser.add_argument('--chunk_size', type=int, default=5000,
+                        help='Rows per transaction in bulk mode.')
+    parser.add_argument('--checkpoint', nargs='?', default='../data/neo4j_import.checkpoint',
+                        help='Checkpoint file used to resume a failed bulk load.')
+    args = parser.parse_args()
+
     # CSV 文件路径
     parking_spots_file = "../data/parking_spots_with_coords.csv"
     ratings_file = "../data/original_ratings.csv"
 
     # 插入数据到 Neo4j
-    insert_data_into_neo4j(parking_spots_file, ratings_file)
+    if args.bulk:
+        bulk_insert_data_into_neo4j(parking_spots_file, ratings_file, args.chunk_size, args.checkpoint)
+    else:
+        insert_data_into_neo4j(parking_spots_file, ratings_file)
@@ -0,0 +1,292 @@
+import threading
+import time
+from contextlib import contextmanager
+
+from py2neo import Graph
+from py2neo.cypher import Cursor
+
+"""
+数据库连接提供者：每个进程只持有一个可配置的连接池，供查询、管理和导出类通过注入共享
+"""
+
+
+class GraphConnectionProvider:
+    """
+    GraphConnectionProvider类持有唯一的py2neo Graph及其连接池，限制同时使用的连接数量，
+    支持获取超时、空闲后的存活检查和空闲连接回收，并统计连接池指标。
+    """
+
+    def __init__(self, uri, username, password, max_size=10, acquire_timeout=30.0,
+                 liveness_interval=60.0, idle_timeout=300.0, max_age=3600):
+        """
+        初始化数据库连接池
+        :param uri: 数据库URI
+        :param username: 数据库用户名
+        :param password: 数据库密码
+        :param max_size: 连接池中同时使用的最大连接数
+        :param acquire_timeout: 获取连接的最长等待时间（秒）
+        :param liveness_interval: 连接池闲置超过该时间（秒）后，下次使用前先执行存活检查
+        :param idle_timeout: 连接池闲置超过该时间（秒）后关闭所有空闲连接，为None时不回收
+        :param max_age: 单个连接的最长存活时间（秒）
+        """
+        try:
+            self._graph = Graph(uri, auth=(username, password), max_size=max_size, max_age=max_age)
+            print("Connected to the database.")
+        except Exception as e:
+            raise ConnectionError(f"数据库连接失败: {str(e)}")
+
+        self.max_size = max_size
+        self.acquire_timeout = acquire_timeout
+        self.liveness_interval = liveness_interval
+        self.idle_timeout = idle_timeout
+
+        self._slots = threading.BoundedSemaphore(max_size)
+        self._lock = threading.Lock()
+        self._last_used = time.monotonic()
+        self._closed = threading.Event()
+
+        self.in_use = 0
+        self.acquisitions = 0
+        self.acquisition_failures = 0
+        self.liveness_failures = 0
+        self.evictions = 0
+        self.wait_time_total = 0.
+        self.wait_time_max = 0.
+
+        self.graph = PooledGraph(self)
+
+        if idle_timeout:
+            self._reaper = threading.Thread(target=self._reap_idle, name='graph-pool-reaper', daemon=True)
+            self._reaper.start()
+
+    @contextmanager
+    def acquire(self):
+        """
+        从连接池获取一个连接，使用结束后自动归还
+        :return: py2neo的Graph对象
+        """
+        graph = self.acquire_slot()
+        try:
+            yield graph
+        finally:
+            self.release_slot()
+
+    def acquire_slot(self):
+        """
+        占用连接池中的一个名额，调用方负责在使用结束后调用release_slot归还
+        :return: py2neo的Graph对象
+        """
+        started = time.monotonic()
+        if not self._slots.acquire(timeout=self.acquire_timeout):
+            with self._lock:
+                self.acquisition_failures += 1
+            raise ConnectionError(f"获取数据库连接超时（{self.acquire_timeout}秒）")
+
+        waited = time.monotonic() - started
+        with self._lock:
+            self.in_use += 1
+            self.acquisitions += 1
+            self.wait_time_total += waited
+            self.wait_time_max = max(self.wait_time_max, waited)
+            idle_for = time.monotonic() - self._last_used
+
+        try:
+            if self.liveness_interval is not None and idle_for > self.liveness_interval:
+                self._check_liveness()
+        except Exception:
+            self.release_slot()
+            raise
+        return self._graph
+
+    def release_slot(self):
+        """
+        归还acquire_slot占用的名额
+        """
+        with self._lock:
+            self.in_use -= 1
+            self._last_used = time.monotonic()
+        self._slots.release()
+
+    @contextmanager
+    def transaction(self):
+        """
+        获取连接并开启一个显式事务，正常结束时提交，出现异常时回滚
+        :return: py2neo的Transaction对象
+        """
+        with self.acquire() as graph:
+            tx = graph.begin()
+            try:
+                yield tx
+            except Exception:
+                graph.rollback(tx)
+                raise
+            else:
+                graph.commit(tx)
+
+    def _check_liveness(self):
+        """
+        执行一次简单查询检查连接是否可用，失败时丢弃空闲连接后重试一次
+        """
+        try:
+            self._graph.run("RETURN 1")
+        except Exception:
+            with self._lock:
+                self.liveness_failures += 1
+            self._prune()
+            try:
+                self._graph.run("RETURN 1")
+            except Exception as e:
+                with self._lock:
+                    self.acquisition_failures += 1
+                raise ConnectionError(f"数据库连接不可用: {str(e)}")
+
+    def _prune(self):
+        """
+        关闭连接池中所有空闲和已损坏的连接
+        """
+        connector = self._graph.service.connector
+        connector.prune(connector.profile)
+
+    def _reap_idle(self):
+        """
+        后台线程：连接池闲置超过idle_timeout时回收空闲连接
+        """
+        while not self._closed.wait(self.idle_timeout / 2):
+            with self._lock:
+                idle = self.in_use == 0 and time.monotonic() - self._last_used > self.idle_timeout
+            if idle:
+                try:
+                    self._prune()
+                    with self._lock:
+                        self.evictions += 1
+                        self._last_used = time.monotonic()
+                except Exception as e:
+                    print(f"回收空闲连接失败: {str(e)}")
+
+    def metrics(self):
+        """
+        获取连接池指标
+        :return: 字典，包含使用中的连接数、获取次数、等待时间和失败次数等
+        """
+        with self._lock:
+            return {
+                "max_size": self.max_size,
+                "in_use": self.in_use,
+                "acquisitions": self.acquisitions,
+                "acquisition_failures": self.acquisition_failures,
+                "liveness_failures": self.liveness_failures,
+                "idle_evictions": self.evictions,
+                "wait_time_total": self.wait_time_total,
+                "wait_time_max": self.wait_time_max,
+                "wait_time_avg": self.wait_time_total / self.acquisitions if self.acquisitions else 0.,
+            }
+
+    def close(self):
+        """
+        停止回收线程并关闭所有连接
+        """
+        self._closed.set()
+        self._graph.service.connector.close()
+
+
+class PooledGraph:
+    """
+    PooledGraph是Graph的代理：每次方法调用都先从连接池获取连接，调用结束后归还，
+    因此可以直接传给NodeMatcher或替代原来的self.graph使用。
+    返回游标的调用（如run）由PooledCursor持有连接，直到结果读完或游标关闭后才归还。
+    """
+
+    def __init__(self, provider):
+        self._provider = provider
+
+    def __getattr__(self, name):
+        attr = getattr(self._provider._graph, name)
+        if not callable(attr):
+            return attr
+
+        def pooled_call(*args, **kwargs):
+            graph = self._provider.acquire_slot()
+            try:
+                result = getattr(graph, name)(*args, **kwargs)
+            except BaseException:
+                self._provider.release_slot()
+                raise
+            if isinstance(result, Cursor):
+                return PooledCursor(result, self._provider.release_slot)
+            self._provider.release_slot()
+            return result
+
+        return pooled_call
+
+
+class PooledCursor:
+    """
+    PooledCursor是py2neo Cursor的代理：逐条读取结果时一直占用连接池名额，
+    结果读完、调用一次性读取全部结果的方法（data、to_data_frame、evaluate等）或close之后归还名额。
+    """
+
+    # 调用后不再继续读取游标的方法
+    CONSUMING_METHODS = {'data', 'evaluate', 'to_table', 'to_subgraph', 'to_ndarray', 'to_series',
+                         'to_data_frame', 'to_matrix', 'stats', 'summary', 'plan', 'profile'}
+
+    def __init__(self, cursor, release):
+        """
+        :param cursor: py2neo的Cursor对象
+        :param release: 归还连接池名额的函数，只会被调用一次
+        """
+        self._cursor = cursor
+        self._release = release
+        self._release_lock = threading.Lock()
+
+    def close(self):
+        """
+        放弃未读取的结果并归还连接池名额
+        """
+        with self._release_lock:
+            release, self._release = self._release, None
+        if release is not None:
+            release()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        try:
+            return next(self._cursor)
+        except BaseException:
+            # 读完（StopIteration）或读取出错都归还名额
+            self.close()
+            raise
+
+    def forward(self, amount=1):
+        try:
+            moved = self._cursor.forward(amount)
+        except BaseException:
+            self.close()
+            raise
+        if moved < amount:
+            self.close()
+        return moved
+
+    def __getattr__(self, name):
+        attr = getattr(self._cursor, name)
+        if name not in self.CONSUMING_METHODS or not callable(attr):
+            return attr
+
+        def consume(*args, **kwargs):
+            try:
+                return attr(*args, **kwargs)
+            finally:
+                self.close()
+
+        return consume
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __del__(self):
+        # 未读完就被丢弃的游标（例如提前退出的for循环）在回收时归还名额
+        self.close()
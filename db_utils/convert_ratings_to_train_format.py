@@ -1,26 +1,67 @@
-from py2neo import Graph
+import argparse
+import json
 import os
+import sys
+import zlib
+
+if __package__ in (None, ''):
+    # 在 db_utils/ 目录下直接运行脚本时，把仓库根目录加入模块搜索路径，使 db_utils 包可以导入
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_utils.connection_provider import GraphConnectionProvider
+
+# 仓库的data目录，与脚本从哪个目录运行无关
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
 
 class ParkingDataConverter:
     """
     ParkingDataConverter类用于从Neo4j数据库中读取用户的停车场评分数据，并根据给定的评分阈值将其转换为训练数据集格式。
     """
 
-    def __init__(self, uri, username, password, rating_threshold=3.5):
+    def __init__(self, connection_provider, rating_threshold=3.5):
         """
-        初始化ParkingDataConverter类，连接Neo4j数据库，并设置评分阈值。
+        初始化ParkingDataConverter类，使用共享的数据库连接池，并设置评分阈值。
 
-        :param uri: Neo4j数据库URI
-        :param username: 数据库用户名
-        :param password: 数据库密码
+        :param connection_provider: GraphConnectionProvider对象，提供共享的数据库连接池
         :param rating_threshold: 用于定义正向互动的评分阈值，默认为3.5
         """
-        try:
-            self.graph = Graph(uri, auth=(username, password))
-            self.rating_threshold = rating_threshold
-            print(f"成功连接至Neo4j数据库: {uri}")
-        except Exception as e:
-            raise ConnectionError(f"数据库连接失败: {str(e)}")
+        self.connection_provider = connection_provider
+        self.graph = connection_provider.graph
+        self.rating_threshold = rating_threshold
+
+    def iter_user_interactions(self, chunk_size=10000):
+        """
+        分批从Neo4j数据库中流式读取用户的正向互动。评分阈值过滤和按用户聚合都在Cypher中完成，
+        每批按用户ID做键集分页，客户端内存只与批大小有关，与图的规模无关。
+        同一对用户和停车场有多条评分关系时，与增量导出一样以最后写入（ingested_at最大）的评分为准，
+        停车场ID不会重复；没有ingested_at的旧评分视为最早写入。
+
+        :param chunk_size: 每批查询的用户数量
+        :return: 生成器，按用户ID升序依次产出 (用户ID, 升序排列的停车场ID列表)
+        """
+        query = """
+        MATCH (u:User) WHERE u.id > $after
+        WITH u ORDER BY u.id LIMIT $limit
+        OPTIONAL MATCH (u)-[r:RATED]->(p:ParkingSpot)
+        WITH u, p, r ORDER BY coalesce(r.ingested_at, 0)
+        WITH u, p, collect(r.grading)[-1] AS rating
+        WITH u, p, rating ORDER BY p.id
+        RETURN u.id AS user_id, collect(CASE WHEN rating >= $threshold THEN p.id END) AS parking_spot_ids
+        ORDER BY user_id
+        """
+        after = -1
+        while True:
+            try:
+                records = self.graph.run(query, after=after, limit=chunk_size, threshold=self.rating_threshold).data()
+            except Exception as e:
+                raise Exception(f"查询用户-停车场互动数据失败: {str(e)}")
+            for record in records:
+                if record["parking_spot_ids"]:
+                    yield record["user_id"], record["parking_spot_ids"]
+            if len(records) < chunk_size:
+                break
+            after = records[-1]["user_id"]
 
     def fetch_user_interactions(self):
         """
@@ -28,79 +69,338 @@ class ParkingDataConverter:
 
         :return: 字典，键为用户ID，值为用户正向互动的停车场ID列表
         """
+        return dict(self.iter_user_interactions())
+
+    def save_to_file(self, user_interactions, output_file, chunk_size=10000):
+        """
+        将用户与停车场的正向互动数据保存为训练格式的文件，每积累chunk_size行写入一次。
+
+        :param user_interactions: 字典，或依次产出 (用户ID, 停车场ID列表) 的可迭代对象
+        :param output_file: 保存的文件路径
+        :param chunk_size: 每次写入的行数
+        """
+        if isinstance(user_interactions, dict):
+            user_interactions = user_interactions.items()
         try:
-            user_interactions = {}
+            with ChunkedLineWriter(output_file, chunk_size) as writer:
+                for user_id, parking_spots in user_interactions:
+                    writer.write(user_id, parking_spots)
 
-            # 定义在Neo4j中的Cypher查询 
-            query = """
-            MATCH (u:User)-[r:RATED]->(p:ParkingSpot)
-            RETURN u.id AS user_id, p.id AS parking_spot_id, r.grading AS rating
-            """
+            print(f"转换完成，数据已写入: {output_file}")
 
-            # 执行查询并获取结果
-            result = self.graph.run(query)
+        except Exception as e:
+            raise Exception(f"保存文件时出错: {str(e)}")
 
-            # 遍历查询结果，构建用户与正向评分的停车场ID列表
-            for record in result:
-                user_id = record["user_id"]
-                parking_spot_id = record["parking_spot_id"]
-                rating = record["rating"]
+    def save_train_test_split(self, user_interactions, train_file, test_file, test_ratio=0.2, seed=2019,
+                              chunk_size=10000):
+        """
+        将正向互动按确定性的规则划分为训练集和测试集并分别保存。
+        每条互动是否进入测试集只由 (seed, 用户ID, 停车场ID) 的哈希决定，与读取顺序和分批方式无关，
+        同一份数据多次导出得到相同的划分；每个用户至少保留一条训练互动。
 
-                # 如果评分大于等于阈值，记录此互动
-                if rating >= self.rating_threshold:
-                    if user_id not in user_interactions:
-                        user_interactions[user_id] = []
-                    user_interactions[user_id].append(parking_spot_id)
+        :param user_interactions: 字典，或依次产出 (用户ID, 停车场ID列表) 的可迭代对象
+        :param train_file: 训练集文件路径
+        :param test_file: 测试集文件路径
+        :param test_ratio: 进入测试集的互动比例
+        :param seed: 划分使用的随机种子
+        :param chunk_size: 每次写入的行数
+        """
+        if isinstance(user_interactions, dict):
+            user_interactions = user_interactions.items()
+        try:
+            with ChunkedLineWriter(train_file, chunk_size) as train_writer, \
+                    ChunkedLineWriter(test_file, chunk_size) as test_writer:
+                for user_id, parking_spots in user_interactions:
+                    train_spots, test_spots = split_interactions(user_id, parking_spots, test_ratio, seed)
+                    train_writer.write(user_id, train_spots)
+                    if test_spots:
+                        test_writer.write(user_id, test_spots)
 
-            return user_interactions
+            print(f"转换完成，训练集已写入: {train_file}，测试集已写入: {test_file}")
 
         except Exception as e:
-            raise Exception(f"查询用户-停车场互动数据失败: {str(e)}")
+            raise Exception(f"保存文件时出错: {str(e)}")
 
-    def save_to_file(self, user_interactions, output_file):
+    def convert_and_save(self, output_file, test_file=None, test_ratio=0.2, chunk_size=10000,
+                         watermark_file=None, lag_ms=60000):
         """
-        将用户与停车场的正向互动数据保存为训练格式的文件。
+        从Neo4j数据库中流式读取评分数据并保存为训练格式的文件，同时记录增量导出的水位线。
 
-        :param user_interactions: 字典，键为用户ID，值为用户正向互动的停车场ID列表
         :param output_file: 保存的文件路径
+        :param test_file: 可选的测试集文件路径，指定后按test_ratio确定性地划分训练集和测试集
+        :param test_ratio: 进入测试集的互动比例
+        :param chunk_size: 每批查询的用户数量和每次写入的行数
+        :param watermark_file: 水位线文件路径，默认为 output_file + '.watermark.json'
+        :param lag_ms: 水位线相对导出开始时间的回退量（毫秒），覆盖导出期间仍在提交的写入
         """
-        try:
-            # 确保输出目录存在
-            os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        # 导出开始前的数据库时间，之后写入的评分由下一次增量导出合并（合并是幂等的，重叠部分不影响结果）
+        watermark = self.server_timestamp() - lag_ms
 
-            # 将结果写入文件
-            with open(output_file, 'w') as outfile:
-                for user_id, parking_spots in user_interactions.items():
-                    parking_spots_str = ','.join(map(str, parking_spots))
-                    outfile.write(f"{user_id}\t{parking_spots_str}\n")
+        print("正在从数据库流式导出用户互动数据...")
+        user_interactions = self.iter_user_interactions(chunk_size)
+        if test_file is None:
+            self.save_to_file(user_interactions, output_file, chunk_size)
+        else:
+            self.save_train_test_split(user_interactions, output_file, test_file, test_ratio,
+                                       chunk_size=chunk_size)
+        save_watermark(watermark_file or output_file + '.watermark.json', watermark)
 
-            print(f"转换完成，数据已写入: {output_file}")
+    def server_timestamp(self):
+        """
+        获取数据库服务器的当前时间，与RATED关系的ingested_at使用同一时钟
 
+        :return: 毫秒时间戳
+        """
+        try:
+            return int(self.graph.run("RETURN timestamp() AS now").data()[0]["now"])
         except Exception as e:
-            raise Exception(f"保存文件时出错: {str(e)}")
+            raise Exception(f"获取数据库时间失败: {str(e)}")
 
-    def convert_and_save(self, output_file):
+    def fetch_rating_changes(self, after, upper):
         """
-        从Neo4j数据库中读取评分数据并保存为训练格式的文件。
+        查询 ingested_at 在 (after, upper] 范围内写入的评分关系，不做阈值过滤，以便识别跌破阈值的评分。
+        没有ingested_at属性的旧评分关系只会出现在全量导出中。
 
-        :param output_file: 保存的文件路径
+        :param after: 上一次导出的水位线（毫秒）
+        :param upper: 本次导出的上界（毫秒）
+        :return: 字典，键为用户ID，值为 {停车场ID: 是否为正向互动}；同一对用户和停车场以最后写入的评分为准
+        """
+        query = """
+        MATCH (u:User)-[r:RATED]->(p:ParkingSpot)
+        WHERE r.ingested_at > $after AND r.ingested_at <= $upper
+        RETURN u.id AS user_id, p.id AS parking_spot_id, r.grading AS rating
+        ORDER BY r.ingested_at
+        """
+        try:
+            changes = {}
+            for record in self.graph.run(query, after=after, upper=upper):
+                changes.setdefault(record["user_id"], {})[record["parking_spot_id"]] = \
+                    record["rating"] >= self.rating_threshold
+            return changes
+        except Exception as e:
+            raise Exception(f"查询新增评分数据失败: {str(e)}")
+
+    def export_delta(self, train_file, test_file=None, test_ratio=0.2, seed=2019, chunk_size=10000,
+                     watermark_file=None, lag_ms=60000):
+        """
+        增量导出：只查询水位线之后写入的评分，并合并到已有的训练集（和测试集）文件中。
+        新的正向互动按与全量导出相同的哈希规则划分到训练集或测试集，跌破阈值的评分从两个文件中删除。
+        已有文件逐行流式改写，内存只与新增评分的数量有关。
+
+        :param train_file: 已有的训练集文件路径
+        :param test_file: 可选的已有测试集文件路径
+        :param test_ratio: 进入测试集的互动比例，应与全量导出时一致
+        :param seed: 划分使用的随机种子，应与全量导出时一致
+        :param chunk_size: 每次写入的行数
+        :param watermark_file: 水位线文件路径，默认为 train_file + '.watermark.json'
+        :param lag_ms: 本次导出上界相对当前数据库时间的回退量（毫秒），避免遗漏尚未提交的写入
+        :return: 合并的评分数量
         """
-        print("正在从数据库获取用户互动数据...")
-        user_interactions = self.fetch_user_interactions()
+        watermark_file = watermark_file or train_file + '.watermark.json'
+        after = load_watermark(watermark_file)
+        if after is None:
+            raise Exception(f"未找到水位线文件 {watermark_file}，请先执行一次全量导出")
+        upper = self.server_timestamp() - lag_ms
+        if upper <= after:
+            return 0
+
+        print(f"正在导出 ({after}, {upper}] 之间写入的评分...")
+        changes = self.fetch_rating_changes(after, upper)
 
-        print("正在保存数据到文件...")
-        self.save_to_file(user_interactions, output_file)
+        try:
+            current = read_user_lines(train_file, changes)
+            current_test = read_user_lines(test_file, changes) if test_file else {}
+
+            merged_train, merged_test = {}, {}
+            for user_id, spots in changes.items():
+                train_spots = [spot for spot in current.get(user_id, []) if spots.get(spot, True)]
+                test_spots = [spot for spot in current_test.get(user_id, []) if spots.get(spot, True)]
+                existing = set(train_spots) | set(test_spots)
+                for spot_id, positive in spots.items():
+                    if not positive or spot_id in existing:
+                        continue
+                    if test_file and is_test_interaction(user_id, spot_id, test_ratio, seed):
+                        test_spots.append(spot_id)
+                    else:
+                        train_spots.append(spot_id)
+                if not train_spots and test_spots:
+                    train_spots.append(test_spots.pop(0))
+                merged_train[user_id], merged_test[user_id] = train_spots, test_spots
+
+            rewrite_user_lines(train_file, merged_train, chunk_size)
+            if test_file:
+                rewrite_user_lines(test_file, merged_test, chunk_size)
+        except Exception as e:
+            raise Exception(f"合并增量数据失败: {str(e)}")
+
+        save_watermark(watermark_file, upper)
+        n_changes = sum(len(spots) for spots in changes.values())
+        print(f"增量导出完成，合并了 {n_changes} 条评分，水位线更新为 {upper}")
+        return n_changes
+
+
+def is_test_interaction(user_id, spot_id, test_ratio, seed):
+    """
+    按 (seed, 用户ID, 停车场ID) 的哈希判断一条互动是否进入测试集
+    """
+    return zlib.crc32(f"{seed}:{user_id}:{spot_id}".encode()) < int(test_ratio * 0xFFFFFFFF)
+
+
+def parse_line(line):
+    """
+    解析训练格式的一行，兼容 "用户ID\t停车场ID,停车场ID" 和空格分隔两种格式
+
+    :return: (用户ID, 停车场ID列表)，空行返回None
+    """
+    values = line.replace(',', ' ').split()
+    if not values:
+        return None
+    return int(values[0]), [int(value) for value in values[1:]]
+
+
+def read_user_lines(file, user_ids):
+    """
+    流式读取文件，只保留指定用户的行
+
+    :return: 字典，键为用户ID，值为停车场ID列表
+    """
+    lines = {}
+    if not os.path.exists(file):
+        return lines
+    with open(file) as infile:
+        for line in infile:
+            parsed = parse_line(line)
+            if parsed is not None and parsed[0] in user_ids:
+                lines[parsed[0]] = parsed[1]
+    return lines
+
+
+def rewrite_user_lines(file, merged, chunk_size=10000):
+    """
+    流式改写文件：替换merged中用户的行（互动为空时删除该行），其余行保持不变，新用户追加在末尾
+    """
+    written = set()
+    with ChunkedLineWriter(file, chunk_size) as writer:
+        if os.path.exists(file):
+            with open(file) as infile:
+                for line in infile:
+                    parsed = parse_line(line)
+                    if parsed is None:
+                        continue
+                    user_id, spots = parsed
+                    if user_id in merged:
+                        if user_id in written:
+                            continue
+                        written.add(user_id)
+                        spots = merged[user_id]
+                    if spots:
+                        writer.write(user_id, spots)
+        for user_id, spots in merged.items():
+            if user_id not in written and spots:
+                writer.write(user_id, spots)
+
+
+def load_watermark(watermark_file):
+    """
+    读取增量导出的水位线
+
+    :return: 毫秒时间戳，文件不存在时返回None
+    """
+    if not os.path.exists(watermark_file):
+        return None
+    with open(watermark_file) as infile:
+        return json.load(infile)["ingested_at"]
+
+
+def save_watermark(watermark_file, watermark):
+    """
+    原子地写入增量导出的水位线
+    """
+    with open(watermark_file + '.tmp', 'w') as outfile:
+        json.dump({"ingested_at": int(watermark)}, outfile)
+    os.replace(watermark_file + '.tmp', watermark_file)
+
+
+def split_interactions(user_id, parking_spots, test_ratio, seed):
+    """
+    按 (seed, 用户ID, 停车场ID) 的哈希把一个用户的互动划分为训练部分和测试部分
+
+    :return: (训练停车场ID列表, 测试停车场ID列表)
+    """
+    train_spots, test_spots = [], []
+    for spot_id in parking_spots:
+        if is_test_interaction(user_id, spot_id, test_ratio, seed):
+            test_spots.append(spot_id)
+        else:
+            train_spots.append(spot_id)
+    if not train_spots and test_spots:
+        train_spots.append(test_spots.pop(0))
+    return train_spots, test_spots
+
+
+class ChunkedLineWriter:
+    """
+    ChunkedLineWriter类按 "用户ID\t停车场ID,停车场ID,..." 的训练格式缓冲写入行，每积累chunk_size行写入文件一次。
+    先写入临时文件，正常结束时再替换目标文件，避免中途失败留下不完整的训练数据。
+    """
+
+    def __init__(self, output_file, chunk_size=10000):
+        """
+        :param output_file: 输出文件路径
+        :param chunk_size: 每次写入的行数
+        """
+        self.output_file = output_file
+        self.chunk_size = chunk_size
+        self.lines = []
+        self.outfile = None
+
+    def __enter__(self):
+        directory = os.path.dirname(self.output_file)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.outfile = open(self.output_file + '.tmp', 'w')
+        return self
+
+    def write(self, user_id, parking_spots):
+        self.lines.append(f"{user_id}\t{','.join(map(str, parking_spots))}\n")
+        if len(self.lines) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        self.outfile.write(''.join(self.lines))
+        self.lines = []
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.flush()
+        self.outfile.close()
+        if exc_type is None:
+            os.replace(self.output_file + '.tmp', self.output_file)
+        else:
+            os.remove(self.output_file + '.tmp')
+        return False
 
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将评分数据导出为NGCF的训练集和测试集")
+    parser.add_argument('--delta', action='store_true',
+                        help="只导出上次导出之后写入的评分，并合并到已有的训练集和测试集中")
+    args = parser.parse_args()
+
     # 数据库连接配置
     uri = "neo4j://localhost:7687"
     username = "neo4j"
     password = "your_password"
     
     # 输出文件路径
-    output_file = '../data/train.txt'
+    output_file = os.path.join(DATA_DIR, 'train.txt')
+    test_file = os.path.join(DATA_DIR, 'test.txt')
     
     # 初始化并执行转换
-    converter = ParkingDataConverter(uri, username, password, rating_threshold=3.5)
-    converter.convert_and_save(output_file)
+    connection_provider = GraphConnectionProvider(uri, username, password, max_size=2)
+    converter = ParkingDataConverter(connection_provider, rating_threshold=3.5)
+    if args.delta:
+        converter.export_delta(output_file, test_file=test_file, test_ratio=0.2)
+    else:
+        converter.convert_and_save(output_file, test_file=test_file, test_ratio=0.2)
+    connection_provider.close()
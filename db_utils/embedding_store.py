@@ -0,0 +1,109 @@
+import json
+import os
+import threading
+
+import numpy as np
+
+from db_utils.ann_index import IVFIndex
+
+"""
+NGCF嵌入向量的只读服务存储：以内存映射方式读取 model/utility/export.py 导出的二进制文件，
+用用户向量与停车场向量的点积为用户打分，可选用IVF近似检索只对部分停车场打分
+"""
+
+
+class EmbeddingStore:
+    """
+    EmbeddingStore类读取 <path>.bin（float32的用户矩阵和停车场矩阵）与 <path>.json（形状、偏移和ID映射），
+    矩阵通过numpy.memmap映射，多个工作进程共享操作系统的页缓存；导出文件被替换后自动重新映射。
+    """
+
+    def __init__(self, path, ann_lists=0, ann_probes=8):
+        """
+        打开嵌入存储
+        :param path: 导出时使用的路径前缀，不含扩展名
+        :param ann_lists: 近似检索索引（IVFIndex）的簇数量，为0时对所有停车场精确打分
+        :param ann_probes: 近似检索时每次查询检查的簇数量，越大召回率越高、延迟越大
+        """
+        self.path = path
+        self.ann_lists = ann_lists
+        self.ann_probes = ann_probes
+        self.ann_index = None
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._load()
+
+    def _load(self):
+        """
+        读取元数据并映射二进制文件
+        """
+        try:
+            meta_path = self.path + '.json'
+            mtime = os.stat(meta_path).st_mtime_ns
+            with open(meta_path) as f:
+                meta = json.load(f)
+            dim, n_users, n_items = meta['dim'], meta['n_users'], meta['n_items']
+            user_embeddings = np.memmap(self.path + '.bin', dtype='<f4', mode='r',
+                                        offset=meta['user_offset'], shape=(n_users, dim))
+            item_embeddings = np.memmap(self.path + '.bin', dtype='<f4', mode='r',
+                                        offset=meta['item_offset'], shape=(n_items, dim))
+            ann_index = None
+            if self.ann_lists:
+                ann_index = IVFIndex(n_lists=self.ann_lists, n_probes=self.ann_probes).build(item_embeddings)
+        except Exception as e:
+            raise Exception(f"加载嵌入存储失败: {str(e)}")
+
+        with self._lock:
+            self.ann_index = ann_index
+            self.user_embeddings = user_embeddings
+            self.item_embeddings = item_embeddings
+            self.user_index = {int(uid): row for row, uid in enumerate(meta['user_ids'])}
+            self.item_ids = np.asarray(meta['item_ids'], dtype=np.int64)
+            self._mtime = mtime
+
+    def reload_if_changed(self):
+        """
+        导出文件被重新写入后重新映射
+        """
+        try:
+            mtime = os.stat(self.path + '.json').st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def __contains__(self, user_id):
+        return int(user_id) in self.user_index
+
+    def recommend(self, user_id, m=5, exclude=None):
+        """
+        为用户计算前m个得分最高的停车场
+        :param user_id: 用户ID
+        :param m: 返回的停车场数量
+        :param exclude: 可选的需要排除的停车场ID集合（如用户已经评分过的停车场）
+        :return: (停车场ID数组, 得分数组)，按得分降序排列；用户不在存储中时返回空数组
+        """
+        self.reload_if_changed()
+        with self._lock:
+            row = self.user_index.get(int(user_id))
+            if row is None:
+                return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+            user_embeddings, item_embeddings, item_ids = self.user_embeddings, self.item_embeddings, self.item_ids
+            ann_index = self.ann_index
+
+        excluded = np.empty(0, dtype=np.int64)
+        if exclude is not None and len(exclude) > 0:
+            excluded = np.flatnonzero(np.isin(item_ids, np.asarray(list(exclude), dtype=np.int64)))
+
+        if ann_index is not None:
+            top, scores = ann_index.search(user_embeddings[row], m, exclude=excluded)
+            return item_ids[top], scores
+
+        scores = item_embeddings @ np.asarray(user_embeddings[row])
+        scores[excluded] = -np.inf
+        m = min(m, len(scores) - len(excluded))
+        if m <= 0:
+            return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+        top = np.argpartition(-scores, m - 1)[:m]
+        top = top[np.argsort(-scores[top], kind='stable')]
+        return item_ids[top], scores[top]
@@ -1,21 +1,41 @@
-import pandas as pd
-import numpy as np
-import requests
+import argparse
+import os
 import random
-import time
+import sys
+
+import numpy as np
+import pandas as pd
+
+if __package__ in (None, ''):
+    # 在 db_utils/ 目录下直接运行脚本时，把仓库根目录加入模块搜索路径，使 db_utils 包可以导入
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
+from db_utils.poi_source import AmapPOISource, SnapshotPOISource, fetch_all
 
-def fetch_parking_lots(city, api_key):
+# 仓库的data目录，与脚本从哪个目录运行无关
+DATA_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'data')
+
+
+def fetch_parking_lots(city, api_key=None, source=None, cache_dir=os.path.join(DATA_DIR, 'poi_cache'), offline=False, max_workers=4):
     """
     使用高德地图API获取不同类型的停车场的位置信息。
+    每个类型代码的结果缓存在本地快照中，离线模式只读取快照；在线查询并发进行，由令牌桶限制请求速率。
 
     参数:
     city (str): 查询的城市名称或城市行政区划代码
-    api_key (str): 高德地图API的秘钥
+    api_key (str): 高德地图API的秘钥，离线模式或指定source时可以为None
+    source: 可选的POI数据源，需提供 fetch(city, code) 方法；默认为带本地快照的高德地图数据源
+    cache_dir (str): 快照目录
+    offline (bool): 是否只读取快照
+    max_workers (int): 并发查询的线程数
 
     返回:
     parking_lots (list): 停车场位置信息的列表，每一项是字典，包括名称、经纬度和类型。
     """
+    if source is None:
+        upstream = AmapPOISource(api_key) if api_key and not offline else None
+        source = SnapshotPOISource(cache_dir, upstream, offline=offline)
+
     parking_lots = []
 
     # 定义不同类型的停车场类型代码和对应的权重
@@ -35,33 +55,18 @@ def fetch_parking_lots(city, api_key):
     # 打乱请求顺序，避免每次顺序相同
     random.shuffle(weighted_requests)
 
-    # 遍历类型代码进行多次请求
+    # 每个类型代码只查询一次，按权重重复使用结果
+    pois_by_code = fetch_all(source, city, [code for _, codes in weighted_requests for code in codes], max_workers)
+
     for parking_type, codes in weighted_requests:
         for code in codes:
-            try:
-                url = (f"https://restapi.amap.com/v3/place/text?key={api_key}"
-                       f"&city={city}&types={code}&offset=20&page=1&extensions=base")
-
-                response = requests.get(url)
-                response.raise_for_status()  # 检查请求是否成功
-
-                data = response.json()
-
-                if data.get('status') == '1':
-                    # 遍历返回的停车场信息
-                    for poi in data.get('pois', []):
-                        parking_lots.append({
-                            'name': poi.get('name', '未知停车场'),
-                            'location': poi.get('location', '0,0'),
-                            'typecode': poi.get('typecode', '未知代码'),  # 获取 typecode 字段
-                            'type': parking_type  # 根据请求类型标记停车场类型
-                        })
-                else:
-                    print(f"Error fetching parking lots for type {code}: {data.get('info', 'Unknown error')}")
-            except requests.exceptions.RequestException as e:
-                print(f"Request failed for type {code}: {e}")
-
-            time.sleep(0.5)
+            for poi in pois_by_code[code]:
+                parking_lots.append({
+                    'name': poi['name'],
+                    'location': poi['location'],
+                    'typecode': poi['typecode'],  # 获取 typecode 字段
+                    'type': parking_type  # 根据请求类型标记停车场类型
+                })
 
     return parking_lots
 
@@ -260,30 +265,235 @@ def generate_parking_data(num_users, num_parking_spots, min_ratings_per_user, ma
     ratings_df = pd.DataFrame(ratings, columns=['停车位ID', '用户ID', '评分'])
 
     # 保存停车位数据和用户评分数据为CSV文件
-    parking_spots_df.to_csv('../data/parking_spots_with_coords.csv', index=False)
-    ratings_df.to_csv('../data/original_ratings.csv', index=False)
+    parking_spots_df.to_csv(os.path.join(DATA_DIR, 'parking_spots_with_coords.csv'), index=False)
+    ratings_df.to_csv(os.path.join(DATA_DIR, 'original_ratings.csv'), index=False)
 
     return parking_spots_df, ratings_df
 
 
-# 参数设置
-num_users = 100
-num_parking_spots = 200
-min_ratings_per_user = 20
-max_ratings_per_user = 40
+# 各类型停车场的属性取值范围：整数范围为 [low, high)，与 generate_parking_data 中的取值一致
+PARKING_TYPE_PROFILES = {
+    "交通枢纽": {'driving': (800, 2000), 'walking': (300, 1000), 'find_time': (10, 20), 'space': (4, 7),
+             'fee': (10, 20), 'elevator': 0.3, 'surveillance': 0.8, 'difficulty': (['困难'], [1.0])},
+    "商场": {'driving': (300, 1200), 'walking': (200, 800), 'find_time': (5, 15), 'space': (6, 8),
+           'fee': (8, 15), 'elevator': 0.5, 'surveillance': 0.7, 'difficulty': (['中等', '困难'], [0.5, 0.5])},
+    "地面停车场": {'driving': (50, 500), 'walking': (10, 400), 'find_time': (1, 5), 'space': (9, 10),
+              'fee': (2, 6), 'elevator': 0.0, 'surveillance': 0.4, 'difficulty': (['容易'], [1.0])},
+    "地下停车场": {'driving': (150, 800), 'walking': (50, 500), 'find_time': (3, 10), 'space': (7, 9),
+              'fee': (5, 10), 'elevator': 0.6, 'surveillance': 0.8, 'difficulty': (['容易', '中等'], [0.5, 0.5])},
+    "其他": {'driving': (50, 400), 'walking': (10, 300), 'find_time': (1, 5), 'space': (8, 10),
+           'fee': (3, 8), 'elevator': 0.3, 'surveillance': 0.5, 'difficulty': (['容易'], [1.0])},
+}
+
+
+def generate_parking_spots_vectorized(num_parking_spots, parking_lots, rng):
+    """
+    按停车场类型整批生成停车位属性，属性分布与 generate_parking_data 相同。
+
+    参数:
+    num_parking_spots (int): 停车位数量
+    parking_lots (list): 停车场位置信息列表
+    rng (RandomState): 随机数生成器
+
+    返回:
+    DataFrame: 与 parking_spots_with_coords.csv 列相同的停车位数据
+    """
+    # 每个停车场只解析一次坐标和类型
+    lot_types, lot_profiles, lot_coords = [], [], []
+    for lot in parking_lots:
+        try:
+            lot_coords.append(tuple(map(float, lot.get('location', '0,0').split(','))))
+        except ValueError:
+            lot_coords.append((0.0, 0.0))
+        lot_type = get_parking_type(lot['name'], lot['typecode'])
+        lot_types.append(lot_type)
+        # 未知停车场等其余类型按"其他"的范围生成
+        lot_profiles.append(lot_type if lot_type in PARKING_TYPE_PROFILES else "其他")
+    lot_types, lot_profiles = np.array(lot_types), np.array(lot_profiles)
+    lot_coords = np.array(lot_coords).reshape(-1, 2)
+
+    lots = rng.randint(0, len(parking_lots), size=num_parking_spots)
+    spot_types, spot_profiles = lot_types[lots], lot_profiles[lots]
+
+    columns = {
+        'Driving Distance (meters)': np.zeros(num_parking_spots, dtype=np.int64),
+        'Walking Distance (meters)': np.zeros(num_parking_spots, dtype=np.int64),
+        'Time to Find Parking (minutes)': np.zeros(num_parking_spots, dtype=np.int64),
+        'Parking Space Size (0-10)': np.zeros(num_parking_spots, dtype=np.int64),
+        'Parking Difficulty': np.empty(num_parking_spots, dtype=object),
+        'Near Elevator': np.empty(num_parking_spots, dtype=object),
+        'Has Surveillance': np.empty(num_parking_spots, dtype=object),
+        'Parking Fee (CNY/hour)': np.zeros(num_parking_spots),
+    }
+    for parking_type, profile in PARKING_TYPE_PROFILES.items():
+        mask = spot_profiles == parking_type
+        n = int(mask.sum())
+        if n == 0:
+            continue
+        columns['Driving Distance (meters)'][mask] = rng.randint(*profile['driving'], size=n)
+        columns['Walking Distance (meters)'][mask] = rng.randint(*profile['walking'], size=n)
+        columns['Time to Find Parking (minutes)'][mask] = rng.randint(*profile['find_time'], size=n)
+        columns['Parking Space Size (0-10)'][mask] = rng.randint(*profile['space'], size=n)
+        columns['Parking Fee (CNY/hour)'][mask] = np.round(rng.uniform(*profile['fee'], size=n), 2)
+        columns['Near Elevator'][mask] = np.where(rng.random_sample(n) < profile['elevator'], '是', '否')
+        columns['Has Surveillance'][mask] = np.where(rng.random_sample(n) < profile['surveillance'], '是', '否')
+        columns['Parking Difficulty'][mask] = rng.choice(profile['difficulty'][0], size=n, p=profile['difficulty'][1])
+
+    parking_spots_df = pd.DataFrame({'ID': np.arange(1, num_parking_spots + 1), **columns})
+    parking_spots_df['Parking Type'] = spot_types
+    parking_spots_df['Longitude'] = lot_coords[lots, 0]
+    parking_spots_df['Latitude'] = lot_coords[lots, 1]
+    return parking_spots_df
+
+
+def calculate_base_ratings(parking_spots_df):
+    """
+    向量化计算所有停车位的基础评分，规则与 generate_parking_data 中的 calculate_base_rating 相同。
+
+    参数:
+    parking_spots_df (DataFrame): 停车位信息数据
+
+    返回:
+    ndarray: 按行排列的基础评分
+    """
+    base_rating = np.full(len(parking_spots_df), 5.0)
+    base_rating += 0.5 * (parking_spots_df['Parking Space Size (0-10)'].to_numpy() > 8)
+    base_rating += 0.2 * (parking_spots_df['Near Elevator'].to_numpy() == '是')
+    base_rating += 0.2 * (parking_spots_df['Has Surveillance'].to_numpy() == '是')
+    base_rating += 0.5 * (parking_spots_df['Parking Difficulty'].to_numpy() == '容易')
+    base_rating -= 0.5 * (parking_spots_df['Driving Distance (meters)'].to_numpy() > 900)
+    base_rating -= 0.5 * (parking_spots_df['Walking Distance (meters)'].to_numpy() > 280)
+    base_rating -= 0.5 * (parking_spots_df['Parking Fee (CNY/hour)'].to_numpy() > 7)
+    return base_rating
+
+
+def generate_rating_chunks(num_users, parking_spot_ids, base_ratings, min_ratings_per_user, max_ratings_per_user,
+                           rng, chunk_users=100000):
+    """
+    按用户分块整批生成评分数据：每块一次性抽取所有用户的评分停车位（同一用户内不重复）和随机扰动。
 
-# 使用高德地图API获取停车场数据
-city = '福州'
-api_key = 'da2c7cf734d2af3112d39ad74a58e284'  # 需要替换为你自己的高德地图API Key
-parking_lots = fetch_parking_lots(city, api_key)
+    参数:
+    num_users (int): 用户数量
+    parking_spot_ids (ndarray): 停车位ID数组
+    base_ratings (ndarray): 与parking_spot_ids对应的基础评分
+    min_ratings_per_user (int): 每个用户评分的最少停车位数量
+    max_ratings_per_user (int): 每个用户评分数量的上界（不含）
+    rng (RandomState): 随机数生成器
+    chunk_users (int): 每块的用户数量
 
-# 生成带有实际坐标的停车位数据
-parking_spots, ratings_df = generate_parking_data(num_users, num_parking_spots, min_ratings_per_user,
-                                                  max_ratings_per_user, parking_lots)
+    返回:
+    生成器，依次产出列为 ['停车位ID', '用户ID', '评分'] 的DataFrame
+    """
+    num_spots = len(parking_spot_ids)
+    if max_ratings_per_user - 1 > num_spots:
+        raise ValueError("每个用户的评分数量不能超过停车位数量")
+
+    for start in range(1, num_users + 1, chunk_users):
+        user_ids = np.arange(start, min(start + chunk_users, num_users + 1), dtype=np.int64)
+        num_ratings = rng.randint(min_ratings_per_user, max_ratings_per_user, size=len(user_ids))
+        users = np.repeat(user_ids, num_ratings)
+
+        # 有放回地抽取停车位，再只对同一用户内重复的位置重新抽取，直到没有重复
+        spots = rng.randint(0, num_spots, size=len(users)).astype(np.int64)
+        while True:
+            order = np.lexsort((spots, users))
+            sorted_keys = users[order] * num_spots + spots[order]
+            duplicated = order[1:][sorted_keys[1:] == sorted_keys[:-1]]
+            if len(duplicated) == 0:
+                break
+            spots[duplicated] = rng.randint(0, num_spots, size=len(duplicated))
+
+        ratings = np.clip(base_ratings[spots] + rng.normal(0, 1.5, size=len(spots)), 1, 5)
+        yield pd.DataFrame({'停车位ID': parking_spot_ids[spots[order]], '用户ID': users[order],
+                            '评分': np.round(ratings[order], 1)})
+
+
+def generate_large_scale_data(num_users, num_parking_spots, min_ratings_per_user, max_ratings_per_user,
+                              parking_lots, output_dir, output_format='csv', chunk_users=100000, seed=42):
+    """
+    向量化生成大规模的停车位数据和用户评分数据，用于推荐系统的压力测试。评分数据按用户分块写出，内存只与块大小有关。
+
+    参数:
+    num_users (int): 用户数量
+    num_parking_spots (int): 停车位数量
+    min_ratings_per_user (int): 每个用户评分的最少停车位数量
+    max_ratings_per_user (int): 每个用户评分数量的上界（不含）
+    parking_lots (list): 停车场位置信息列表
+    output_dir (str): 输出目录
+    output_format (str): 'csv' 写出单个CSV文件；'parquet' 为每块写出一个Parquet文件（需要安装pyarrow）
+    chunk_users (int): 每块的用户数量
+    seed (int): 随机种子
+
+    返回:
+    (停车位数据文件路径, 评分数据文件或目录路径, 评分数量)
+    """
+    if output_format not in ('csv', 'parquet'):
+        raise ValueError(f"不支持的输出格式: {output_format}")
+    rng = np.random.RandomState(seed)
+    os.makedirs(output_dir, exist_ok=True)
+
+    parking_spots_df = generate_parking_spots_vectorized(num_parking_spots, parking_lots, rng)
+    base_ratings = calculate_base_ratings(parking_spots_df)
+    parking_spot_ids = parking_spots_df['ID'].to_numpy()
+
+    if output_format == 'csv':
+        spots_path = os.path.join(output_dir, 'parking_spots_with_coords.csv')
+        ratings_path = os.path.join(output_dir, 'original_ratings.csv')
+        parking_spots_df.to_csv(spots_path, index=False)
+    else:
+        spots_path = os.path.join(output_dir, 'parking_spots_with_coords.parquet')
+        ratings_path = os.path.join(output_dir, 'original_ratings')
+        parking_spots_df.to_parquet(spots_path, index=False)
+        os.makedirs(ratings_path, exist_ok=True)
+
+    num_ratings = 0
+    chunks = generate_rating_chunks(num_users, parking_spot_ids, base_ratings, min_ratings_per_user,
+                                    max_ratings_per_user, rng, chunk_users)
+    for i, chunk in enumerate(chunks):
+        if output_format == 'csv':
+            chunk.to_csv(ratings_path, mode='w' if i == 0 else 'a', header=i == 0, index=False)
+        else:
+            chunk.to_parquet(os.path.join(ratings_path, f'part-{i:05d}.parquet'), index=False)
+        num_ratings += len(chunk)
+        print(f"已生成 {min((i + 1) * chunk_users, num_users)}/{num_users} 个用户的评分")
+
+    return spots_path, ratings_path, num_ratings
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="生成停车位数据和用户评分数据")
+    parser.add_argument('--city', default='福州', help="查询的城市名称或城市行政区划代码")
+    parser.add_argument('--api_key', default=os.getenv('AMAP_API_KEY', 'da2c7cf734d2af3112d39ad74a58e284'),
+                        help="高德地图API Key，默认读取环境变量 AMAP_API_KEY")
+    parser.add_argument('--cache_dir', default=os.path.join(DATA_DIR, 'poi_cache'), help="POI快照目录")
+    parser.add_argument('--offline', action='store_true', help="只读取POI快照，不访问网络")
+    parser.add_argument('--num_users', type=int, default=100)
+    parser.add_argument('--num_parking_spots', type=int, default=200)
+    parser.add_argument('--min_ratings_per_user', type=int, default=20)
+    parser.add_argument('--max_ratings_per_user', type=int, default=40)
+    parser.add_argument('--large', action='store_true',
+                        help="使用向量化生成器分块写出大规模数据（写入--output_dir）")
+    parser.add_argument('--output_dir', default=os.path.join(DATA_DIR, 'large'), help="--large 模式的输出目录")
+    parser.add_argument('--format', default='csv', choices=['csv', 'parquet'], help="--large 模式的输出格式")
+    args = parser.parse_args()
+
+    # 使用高德地图API（或本地快照）获取停车场数据
+    parking_lots = fetch_parking_lots(args.city, args.api_key, cache_dir=args.cache_dir, offline=args.offline)
+
+    if args.large:
+        spots_path, ratings_path, num_ratings = generate_large_scale_data(
+            args.num_users, args.num_parking_spots, args.min_ratings_per_user, args.max_ratings_per_user,
+            parking_lots, args.output_dir, output_format=args.format)
+        print(f"停车位数据: {spots_path}，评分数据: {ratings_path}，共 {num_ratings} 条评分")
+    else:
+        # 生成带有实际坐标的停车位数据
+        parking_spots, ratings_df = generate_parking_data(args.num_users, args.num_parking_spots,
+                                                          args.min_ratings_per_user, args.max_ratings_per_user,
+                                                          parking_lots)
 
-# 显示生成的数据
-print("停车位信息:")
-print(parking_spots.head())
+        # 显示生成的数据
+        print("停车位信息:")
+        print(parking_spots.head())
 
-print("\n用户评分:")
-print(ratings_df.head())
+        print("\n用户评分:")
+        print(ratings_df.head())
@@ -0,0 +1,218 @@
+import hashlib
+import os
+import threading
+
+import numpy as np
+
+"""
+用户近邻索引：预先计算并保存每个用户的前k个相似用户，推荐时只需查表再加权汇总
+"""
+
+
+class UserNeighborIndex:
+    """
+    UserNeighborIndex类保存每个用户的前top_k个相似用户及其相似度和共同评分数，
+    评分变化时只刷新受影响用户及其共同评分用户的记录，并可持久化到npz文件。
+    """
+
+    def __init__(self, top_k=50, min_common=3, min_sim=0.0, path=None, chunk_size=1024):
+        """
+        初始化近邻索引
+        :param top_k: 每个用户保存的相似用户数量
+        :param min_common: 建立索引时要求的最少共同评分停车场数目
+        :param min_sim: 建立索引时要求的最小相似度（严格大于）
+        :param path: 索引持久化的npz文件路径，为None时只保存在内存中
+        :param chunk_size: 全量构建时每批计算的用户数量
+        """
+        self.top_k = top_k
+        self.min_common = min_common
+        self.min_sim = min_sim
+        self.path = path
+        self.chunk_size = chunk_size
+        self._lock = threading.RLock()
+        self._dirty = False
+        # 用户ID -> (相似用户ID数组, 相似度数组, 共同评分数数组)，按相似度降序排列
+        self.entries = {}
+
+    def covers(self, k, parking_common, threshold_sim):
+        """
+        判断索引能否精确回答一次查询
+        :param k: 查询需要的相似用户数量
+        :param parking_common: 查询要求的最少共同评分停车场数目
+        :param threshold_sim: 查询要求的最小相似度
+        :return: 是否可以直接使用索引
+        """
+        return k <= self.top_k and parking_common == self.min_common and threshold_sim >= self.min_sim
+
+    def neighbors(self, engine, user_id, k, threshold_sim):
+        """
+        查询用户的前k个相似用户
+        :param engine: RecommendationEngine对象，用于把用户ID转换为矩阵行号
+        :param user_id: 用户ID
+        :param k: 相似用户数量
+        :param threshold_sim: 最小相似度
+        :return: (相似用户行号数组, 相似度数组)
+        """
+        with self._lock:
+            neighbor_ids, sims, _ = self.entries.get(user_id, (np.empty(0, dtype=np.int64), np.empty(0), None))
+        keep = sims > threshold_sim
+        neighbor_ids, sims = neighbor_ids[keep][:k], sims[keep][:k]
+        rows = np.array([engine.user_index[int(uid)] for uid in neighbor_ids], dtype=np.int64)
+        return rows, sims
+
+    def attach(self, engine, previous=None):
+        """
+        与推荐引擎的评分矩阵关联：索引已经建立时只刷新评分发生变化的用户；
+        否则持久化文件与当前评分数据一致时直接加载，再否则全量构建
+        :param engine: RecommendationEngine对象
+        :param previous: 重新加载前的 (用户ID数组, 停车场ID数组, 评分矩阵, 0/1矩阵)，首次加载时为None
+        """
+        if previous is not None and self.entries:
+            self.reconcile(engine, *previous)
+            return
+        if self.path and os.path.exists(self.path) and self.load(self.path, engine):
+            print(f"已加载用户近邻索引: {self.path}")
+            return
+        self.build(engine)
+        if self.path:
+            self.save(self.path, engine)
+
+    def build(self, engine):
+        """
+        分批计算所有用户的相似用户，全量构建索引
+        :param engine: RecommendationEngine对象
+        """
+        entries = {}
+        n_users = len(engine.user_ids)
+        for start in range(0, n_users, self.chunk_size):
+            rows = np.arange(start, min(start + self.chunk_size, n_users))
+            entries.update(self._compute(engine, rows))
+        with self._lock:
+            self.entries = entries
+            self._dirty = True
+
+    def refresh(self, engine, rows):
+        """
+        增量刷新指定用户行的相似用户记录
+        :param engine: RecommendationEngine对象
+        :param rows: 需要刷新的用户行号数组
+        """
+        rows = np.unique(np.asarray(rows, dtype=np.int64))
+        entries = {}
+        for start in range(0, len(rows), self.chunk_size):
+            entries.update(self._compute(engine, rows[start:start + self.chunk_size]))
+        with self._lock:
+            self.entries.update(entries)
+            self._dirty = True
+
+    def reconcile(self, engine, user_ids, spot_ids, ratings, binary):
+        """
+        评分矩阵重新加载后，对比新旧评分找出评分发生变化的用户，只刷新在新旧矩阵中与他们有共同评分的用户，
+        其余用户的相似用户记录不受影响，原样保留
+        :param engine: 已加载新评分矩阵的RecommendationEngine对象
+        :param user_ids: 旧评分矩阵各行对应的用户ID数组
+        :param spot_ids: 旧评分矩阵各列对应的停车场ID数组
+        :param ratings: 旧评分矩阵
+        :param binary: 旧评分矩阵对应的0/1矩阵
+        """
+        old, new = ratings.tocoo(), engine.ratings.tocoo()
+        old_triples = np.rec.fromarrays([user_ids[old.row], spot_ids[old.col], old.data], names='user,spot,rating')
+        new_triples = np.rec.fromarrays([engine.user_ids[new.row], engine.spot_ids[new.col], new.data],
+                                        names='user,spot,rating')
+        changed = np.unique(np.setxor1d(old_triples, new_triples)['user'])
+        if len(changed) == 0:
+            return
+
+        # 用户之间的相似度只取决于两人的评分，只有与变化用户在新旧矩阵中有共同评分的用户记录需要刷新
+        old_rows = np.flatnonzero(np.isin(user_ids, changed))
+        affected = user_ids[np.unique((binary @ binary[old_rows].T).tocoo().row)]
+        new_rows = np.flatnonzero(np.isin(engine.user_ids, changed))
+        if len(new_rows):
+            affected = np.union1d(affected, engine.user_ids[engine.coraters(new_rows)])
+
+        with self._lock:
+            for uid in affected:
+                if int(uid) not in engine.user_index:
+                    self.entries.pop(int(uid), None)
+                    self._dirty = True
+        self.refresh(engine, [engine.user_index[int(uid)] for uid in affected if int(uid) in engine.user_index])
+
+    def _compute(self, engine, rows):
+        """
+        计算一批用户行的前top_k个相似用户
+        :return: 字典，用户ID -> (相似用户ID数组, 相似度数组, 共同评分数数组)
+        """
+        pos, col, sim, common = engine.similarity_rows(rows)
+        top = engine.top_neighbors(pos, col, sim, common, len(rows), self.top_k, self.min_common, self.min_sim)
+        return {int(engine.user_ids[row]): (engine.user_ids[cols], sims, commons)
+                for row, (cols, sims, commons) in zip(rows, top)}
+
+    def flush(self, engine):
+        """
+        如果索引在上次保存后有变化，则写回持久化文件
+        :param engine: RecommendationEngine对象
+        """
+        if self.path and self._dirty:
+            self.save(self.path, engine)
+
+    def save(self, path, engine):
+        """
+        将索引以CSR形式保存为npz文件，同时记录评分矩阵的签名用于判断是否过期
+        :param path: 保存路径
+        :param engine: RecommendationEngine对象
+        """
+        with self._lock:
+            user_ids = np.array(sorted(self.entries), dtype=np.int64)
+            parts = [self.entries[uid] for uid in user_ids]
+            lengths = np.array([len(part[0]) for part in parts], dtype=np.int64)
+            indptr = np.concatenate([[0], np.cumsum(lengths)]).astype(np.int64)
+            neighbor_ids = np.concatenate([part[0] for part in parts]) if parts else np.empty(0, dtype=np.int64)
+            sims = np.concatenate([part[1] for part in parts]) if parts else np.empty(0)
+            commons = np.concatenate([part[2] for part in parts]) if parts else np.empty(0, dtype=np.int64)
+            self._dirty = False
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        np.savez(path, user_ids=user_ids, indptr=indptr, neighbor_ids=neighbor_ids, sims=sims, commons=commons,
+                 params=np.array([self.top_k, self.min_common, self.min_sim]),
+                 signature=self._signature(engine))
+
+    def load(self, path, engine):
+        """
+        从npz文件加载索引
+        :param path: 文件路径
+        :param engine: RecommendationEngine对象
+        :return: 是否加载成功；参数或评分数据签名不一致时返回False
+        """
+        try:
+            data = np.load(path)
+            if not np.array_equal(data['params'], np.array([self.top_k, self.min_common, self.min_sim])) \
+                    or not np.array_equal(data['signature'], self._signature(engine)):
+                return False
+            indptr, neighbor_ids, sims, commons = data['indptr'], data['neighbor_ids'], data['sims'], data['commons']
+            entries = {}
+            for i, uid in enumerate(data['user_ids']):
+                start, end = indptr[i], indptr[i + 1]
+                entries[int(uid)] = (neighbor_ids[start:end], sims[start:end], commons[start:end])
+        except Exception as e:
+            print(f"加载用户近邻索引失败，将重新构建: {str(e)}")
+            return False
+
+        with self._lock:
+            self.entries = entries
+            self._dirty = False
+        return True
+
+    @staticmethod
+    def _signature(engine):
+        """
+        评分矩阵的签名：矩阵形状、行列对应的用户和停车场ID，以及矩阵内容的SHA-1摘要
+        """
+        ratings = engine.ratings.tocsr()
+        ratings.sort_indices()
+        h = hashlib.sha1(('%d,%d;' % ratings.shape).encode())
+        for part in (engine.user_ids, engine.spot_ids, ratings.indptr, ratings.indices):
+            h.update(np.ascontiguousarray(part, dtype=np.int64).tobytes())
+        h.update(np.ascontiguousarray(ratings.data, dtype=np.float64).tobytes())
+        return np.array(h.hexdigest())
@@ -1,6 +1,8 @@
-from py2neo import Graph, Node, Relationship, NodeMatcher
+from py2neo import Node, NodeMatcher
 import csv
 
+from db_utils.cache import node_cache_key
+
 """
 负责与停车场和用户节点的创建、关系的创建和更新相关的功能
 """
@@ -11,19 +13,18 @@ class ParkingGraphManager:
     ParkingGraphManager类负责管理停车场和用户节点的创建、更新以及关系的创建。
     """
 
-    def __init__(self, uri, username, password):
+    def __init__(self, connection_provider, recommendation_engine=None, node_cache=None):
         """
         初始化数据库连接
-        :param uri: 数据库URI
-        :param username: 数据库用户名
-        :param password: 数据库密码
+        :param connection_provider: GraphConnectionProvider对象，提供共享的数据库连接池
+        :param recommendation_engine: 可选的RecommendationEngine，写入评分后同步刷新其评分矩阵和近邻索引
+        :param node_cache: 可选的节点属性缓存，更新节点后使对应条目失效
         """
-        try:
-            self.graph = Graph(uri, auth=(username, password))
-            self.node_matcher = NodeMatcher(self.graph)
-            print("Connected to the database.")
-        except Exception as e:
-            raise ConnectionError(f"Failed to connect to the database: {str(e)}")
+        self.connection_provider = connection_provider
+        self.graph = connection_provider.graph
+        self.node_matcher = NodeMatcher(self.graph)
+        self.recommendation_engine = recommendation_engine
+        self.node_cache = node_cache
 
     def read_csv_file(self, file_path):
         """
@@ -51,26 +52,35 @@ class ParkingGraphManager:
             # 检查停车场节点是否存在
             re_value = self.node_matcher.match('ParkingSpot').where(id=int(attrs[0])).first()
             if re_value is None:
-                # 创建停车场节点，映射新的属性
-                node = Node('ParkingSpot',
-                            id=int(attrs[0]),  # ID
-                            driving_distance=int(attrs[1]),  # Driving Distance (meters)
-                            walking_distance=int(attrs[2]),  # Walking Distance (meters)
-                            found_time=int(attrs[3]),  # Time to Find Parking (minutes)
-                            parking_space_size=int(attrs[4]),  # Parking Space Size (0-10)
-                            parking_difficulty=attrs[5],  # Parking Difficulty
-                            near_elevator=attrs[6],  # Near Elevator
-                            has_surveillance=attrs[7],  # Has Surveillance
-                            fee=float(attrs[8]),  # Parking Fee (CNY/hour)
-                            parking_type=attrs[9],  # Parking Type
-                            longitude=float(attrs[10]),  # Longitude
-                            latitude=float(attrs[11]))  # Latitude
+                node = Node('ParkingSpot', **self.parking_properties(attrs))
                 self.graph.create(node)
                 return node
             return None
         except Exception as e:
             raise Exception(f"Failed to create parking node: {str(e)}")
 
+    @staticmethod
+    def parking_properties(attrs):
+        """
+        将停车场属性列表映射为节点属性字典
+        :param attrs: 节点属性列表
+        :return: 节点属性字典
+        """
+        return {
+            'id': int(attrs[0]),  # ID
+            'driving_distance': int(attrs[1]),  # Driving Distance (meters)
+            'walking_distance': int(attrs[2]),  # Walking Distance (meters)
+            'found_time': int(attrs[3]),  # Time to Find Parking (minutes)
+            'parking_space_size': int(attrs[4]),  # Parking Space Size (0-10)
+            'parking_difficulty': attrs[5],  # Parking Difficulty
+            'near_elevator': attrs[6],  # Near Elevator
+            'has_surveillance': attrs[7],  # Has Surveillance
+            'fee': float(attrs[8]),  # Parking Fee (CNY/hour)
+            'parking_type': attrs[9],  # Parking Type
+            'longitude': float(attrs[10]),  # Longitude
+            'latitude': float(attrs[11]),  # Latitude
+        }
+
     def create_user_node(self, attrs):
         """
         创建用户节点
@@ -98,12 +108,142 @@ class ParkingGraphManager:
             user_value = self.match_user_node(attrs)
             if park_value is None or user_value is None:
                 return False, "Either ParkingSpot or User node not found."
-            relation = Relationship(user_value, 'RATED', park_value, grading=float(attrs[2]))
-            self.graph.create(relation)
+            # ingested_at（毫秒时间戳）供训练数据的增量导出使用，取数据库服务器的timestamp()，
+            # 与导出水位线使用同一时钟，不受客户端时钟偏差影响
+            with self.connection_provider.transaction() as tx:
+                tx.run("""
+                    MATCH (u:User {id: $user_id})
+                    MATCH (p:ParkingSpot {id: $parking_spot_id})
+                    CREATE (u)-[:RATED {grading: $grading, ingested_at: timestamp()}]->(p)
+                """, user_id=user_value['id'], parking_spot_id=park_value['id'], grading=float(attrs[2]))
+            if self.recommendation_engine is not None:
+                self.recommendation_engine.update_rating(user_value['id'], park_value['id'], float(attrs[2]))
             return True, "Rating relation created successfully."
         except Exception as e:
             raise Exception(f"Failed to create rating relation: {str(e)}")
 
+    def create_indexes(self):
+        """
+        为停车场和用户节点的id属性创建索引，使批量接口中的 id IN $ids 查找走索引；
+        并为评分关系的ingested_at创建索引，供训练数据的增量导出按时间范围查找
+        """
+        try:
+            self.graph.run("CREATE INDEX parking_spot_id IF NOT EXISTS FOR (p:ParkingSpot) ON (p.id)")
+            self.graph.run("CREATE INDEX user_id IF NOT EXISTS FOR (u:User) ON (u.id)")
+            self.graph.run("CREATE INDEX rated_ingested_at IF NOT EXISTS FOR ()-[r:RATED]-() ON (r.ingested_at)")
+        except Exception as e:
+            raise Exception(f"Failed to create indexes: {str(e)}")
+
+    @staticmethod
+    def _batches(rows, batch_size):
+        """
+        将可迭代对象按批次切分
+        :param rows: 可迭代对象
+        :param batch_size: 每批的行数
+        """
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def _existing_ids(self, label, ids):
+        """
+        用一次查询找出数据库中已存在的节点id
+        :param label: 节点标签
+        :param ids: 待检查的id列表
+        :return: 已存在的id集合
+        """
+        result = self.graph.run(f"MATCH (n:{label}) WHERE n.id IN $ids RETURN n.id AS id", ids=list(ids))
+        return {record["id"] for record in result}
+
+    def create_parking_nodes(self, rows, batch_size=1000):
+        """
+        批量创建停车场节点，每批先用一次查询过滤已存在的id，再在一个事务中创建缺失的节点
+        :param rows: 可迭代对象，每个元素为停车场属性列表（同create_parking_node）
+        :param batch_size: 每批的行数
+        :return: 新创建的节点数量
+        """
+        try:
+            created = 0
+            for batch in self._batches(rows, batch_size):
+                properties = {}
+                for attrs in batch:
+                    node_properties = self.parking_properties(attrs)
+                    properties.setdefault(node_properties['id'], node_properties)
+                existing = self._existing_ids('ParkingSpot', properties.keys())
+                new_rows = [value for key, value in properties.items() if key not in existing]
+                if new_rows:
+                    with self.connection_provider.transaction() as tx:
+                        tx.run("UNWIND $rows AS row CREATE (p:ParkingSpot) SET p = row", rows=new_rows)
+                    created += len(new_rows)
+            return created
+        except Exception as e:
+            raise Exception(f"Failed to create parking nodes: {str(e)}")
+
+    def create_user_nodes(self, rows, batch_size=1000):
+        """
+        批量创建用户节点，每批先用一次查询过滤已存在的id，再在一个事务中创建缺失的节点
+        :param rows: 可迭代对象，每个元素为用户节点属性列表（同create_user_node）
+        :param batch_size: 每批的行数
+        :return: 新创建的节点数量
+        """
+        try:
+            created = 0
+            for batch in self._batches(rows, batch_size):
+                user_ids = list(dict.fromkeys(int(attrs[1]) for attrs in batch))
+                existing = self._existing_ids('User', user_ids)
+                new_ids = [user_id for user_id in user_ids if user_id not in existing]
+                if new_ids:
+                    with self.connection_provider.transaction() as tx:
+                        tx.run("UNWIND $ids AS id CREATE (:User {id: id})", ids=new_ids)
+                    created += len(new_ids)
+            return created
+        except Exception as e:
+            raise Exception(f"Failed to create user nodes: {str(e)}")
+
+    def create_rating_relations(self, rows, batch_size=1000):
+        """
+        批量为用户和停车场创建评分关系，每批用两次查询确认节点存在，再在一个事务中创建所有关系
+        :param rows: 可迭代对象，每个元素为关系属性列表（同create_rating_relation）
+        :param batch_size: 每批的行数
+        :return: 创建的关系数量和对应的消息
+        """
+        try:
+            created, skipped = 0, 0
+            for batch in self._batches(rows, batch_size):
+                ratings = [{'parking_spot_id': int(attrs[0]), 'user_id': int(attrs[1]), 'grading': float(attrs[2])}
+                           for attrs in batch]
+                park_ids = self._existing_ids('ParkingSpot', {rating['parking_spot_id'] for rating in ratings})
+                user_ids = self._existing_ids('User', {rating['user_id'] for rating in ratings})
+                valid = [rating for rating in ratings
+                         if rating['parking_spot_id'] in park_ids and rating['user_id'] in user_ids]
+                skipped += len(ratings) - len(valid)
+                if not valid:
+                    continue
+
+                with self.connection_provider.transaction() as tx:
+                    tx.run("""
+                        UNWIND $rows AS row
+                        MATCH (u:User {id: row.user_id})
+                        MATCH (p:ParkingSpot {id: row.parking_spot_id})
+                        CREATE (u)-[:RATED {grading: row.grading, ingested_at: timestamp()}]->(p)
+                    """, rows=valid)
+                created += len(valid)
+
+                if self.recommendation_engine is not None:
+                    self.recommendation_engine.update_ratings(
+                        (rating['user_id'], rating['parking_spot_id'], rating['grading']) for rating in valid)
+
+            if skipped:
+                return created, f"{skipped} ratings skipped: ParkingSpot or User node not found."
+            return created, "Rating relations created successfully."
+        except Exception as e:
+            raise Exception(f"Failed to create rating relations: {str(e)}")
+
     def match_park_node(self, attrs):
         """
         匹配停车场节点
@@ -143,6 +283,8 @@ class ParkingGraphManager:
                 user_node[key] = value
 
             self.graph.push(user_node)
+            if self.node_cache is not None:
+                self.node_cache.delete(node_cache_key('User', user_id))
             return True, "User updated successfully."
         except Exception as e:
             raise Exception(f"Failed to update user node: {str(e)}")
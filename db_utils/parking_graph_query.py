@@ -1,25 +1,65 @@
-from py2neo import Graph, NodeMatcher
+from py2neo import Node, NodeMatcher
+import functools
 import pandas as pd
 
+from db_utils.cache import node_cache_key
+from db_utils.neighbor_index import UserNeighborIndex
+from db_utils.recommendation_engine import RecommendationEngine, SPOT_FIELDS
+from db_utils.spatial_index import parse_location
+
 
 class ParkingGraphQuery:
     """
     ParkingGraphQuery类负责查询数据库中的节点信息，并提供基于用户评分的推荐功能。
     """
 
-    def __init__(self, uri, username, password):
+    def __init__(self, connection_provider, neighbor_index_path=None, node_cache=None, recommendation_cache=None,
+                 embedding_store=None, spot_catalog=None, rating_reload_interval=30.0):
         """
         初始化数据库连接
-        :param uri: 数据库URI
-        :param username: 数据库用户名
-        :param password: 数据库密码
+        :param connection_provider: GraphConnectionProvider对象，提供共享的数据库连接池
+        :param neighbor_index_path: 用户近邻索引的持久化文件路径，为None时索引只保存在内存中
+        :param node_cache: 可选的节点属性缓存（TTLCache或SharedCache），缓存停车场和用户节点的查询结果
+        :param recommendation_cache: 可选的VersionedResultCache，按评分数据版本缓存推荐结果
+        :param embedding_store: 可选的EmbeddingStore，指定后优先用训练好的NGCF嵌入向量为用户推荐
+        :param spot_catalog: 可选的SpotCatalog，指定后停车场查询和筛选优先读取内存映射的停车场快照
+        :param rating_reload_interval: 推荐引擎检查数据库评分是否变化的间隔（秒），为None时只在首次使用时加载
         """
-        try:
-            self.graph = Graph(uri, auth=(username, password))
-            self.node_matcher = NodeMatcher(self.graph)
-            print("Connected to the database.")
-        except Exception as e:
-            raise ConnectionError(f"数据库连接失败: {str(e)}")
+        self.connection_provider = connection_provider
+        self.node_cache = node_cache
+        self.recommendation_cache = recommendation_cache
+        self.embedding_store = embedding_store
+        self.spot_catalog = spot_catalog
+        self.graph = connection_provider.graph
+        self.node_matcher = NodeMatcher(self.graph)
+        self.recommendation_engine = RecommendationEngine(self.graph,
+                                                          UserNeighborIndex(path=neighbor_index_path),
+                                                          reload_interval=rating_reload_interval,
+                                                          spot_catalog=spot_catalog)
+
+    def _cached_node(self, label, node_id):
+        """
+        从缓存中读取节点属性并还原为节点对象
+        :param label: 节点标签
+        :param node_id: 节点ID
+        :return: 节点对象，未命中时返回None
+        """
+        if self.node_cache is None:
+            return None
+        properties = self.node_cache.get(node_cache_key(label, node_id))
+        if properties is None:
+            return None
+        return Node(label, **properties)
+
+    def _cache_node(self, label, node_id, node):
+        """
+        将节点属性写入缓存
+        :param label: 节点标签
+        :param node_id: 节点ID
+        :param node: 节点对象
+        """
+        if self.node_cache is not None:
+            self.node_cache.set(node_cache_key(label, node_id), dict(node))
 
     def query_park_node(self, park_id):
         """
@@ -29,15 +69,75 @@ class ParkingGraphQuery:
         """
         try:
             park_id = int(park_id)
+            if self.spot_catalog is not None:
+                spot = self.spot_catalog.get(park_id)
+                if spot is not None:
+                    return Node('ParkingSpot', **spot), None
+            cached_node = self._cached_node('ParkingSpot', park_id)
+            if cached_node is not None:
+                return cached_node, None
             # 尝试从数据库中查询停车场节点
             find_node = self.node_matcher.match('ParkingSpot').where(id=park_id).first()
             if find_node:
+                self._cache_node('ParkingSpot', park_id, find_node)
                 return find_node, None  # 返回节点对象
             else:
                 return None, f"未找到ID为 {park_id} 的停车场节点。"  # 没有找到节点
         except Exception as e:
             raise Exception(f"查询停车场节点失败: {str(e)}")
 
+    def filter_parking_spots(self, parking_types=None, max_fee=None, parking_difficulty=None, near_elevator=None,
+                             has_surveillance=None, limit=100):
+        """
+        按条件筛选停车场，条件为None时不参与筛选；有停车场快照时直接在快照上筛选，否则查询数据库
+        :param parking_types: 可接受的停车场类型列表
+        :param max_fee: 可接受的最高停车费用（元/小时）
+        :param parking_difficulty: 可接受的停车难度列表
+        :param near_elevator: 是否要求靠近电梯
+        :param has_surveillance: 是否要求有监控
+        :param limit: 最多返回的数量
+        :return: 停车场属性字典的列表，按ID升序排列
+        """
+        try:
+            if self.spot_catalog is not None:
+                spot_ids = self.spot_catalog.filter(parking_types=parking_types, max_fee=max_fee,
+                                                    parking_difficulty=parking_difficulty,
+                                                    near_elevator=near_elevator,
+                                                    has_surveillance=has_surveillance, limit=limit)
+                return [self.spot_catalog.get(spot_id) for spot_id in spot_ids]
+
+            # 数据库中的 near_elevator / has_surveillance 保存为 是/否
+            flags = {field: None if wanted is None else ('是' if wanted else '否')
+                     for field, wanted in (('near_elevator', near_elevator), ('has_surveillance', has_surveillance))}
+            conditions = []
+            if parking_types is not None:
+                conditions.append("p.parking_type IN $parking_types")
+            if max_fee is not None:
+                conditions.append("p.fee <= $max_fee")
+            if parking_difficulty is not None:
+                conditions.append("p.parking_difficulty IN $parking_difficulty")
+            conditions += [f"p.{field} = ${field}" for field, value in flags.items() if value is not None]
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            return self.graph.run(f"""
+                MATCH (p:ParkingSpot)
+                {where}
+                RETURN {', '.join(f'p.{field} AS {field}' for field in SPOT_FIELDS)}
+                ORDER BY p.id
+                LIMIT $limit
+            """, parking_types=parking_types, max_fee=max_fee, parking_difficulty=parking_difficulty,
+                                  limit=limit, **flags).data()
+        except Exception as e:
+            raise Exception(f"筛选停车场失败: {str(e)}")
+
+    def refresh_spot_catalog(self):
+        """
+        从数据库重新编译停车场快照，其他工作进程在下次读取时自动重新映射
+        :return: 快照中的停车场数量
+        """
+        if self.spot_catalog is None:
+            raise Exception("未配置停车场快照")
+        return self.spot_catalog.refresh(self.graph)
+
     def query_user_node(self, user_id):
         """
         查询用户节点
@@ -46,18 +146,23 @@ class ParkingGraphQuery:
         """
         try:
             user_id = int(user_id)
+            cached_node = self._cached_node('User', user_id)
+            if cached_node is not None:
+                return cached_node, None
             # 尝试从数据库中查询用户节点
             find_node = self.node_matcher.match('User', id=user_id).first()
             if find_node:
+                self._cache_node('User', user_id, find_node)
                 return find_node, None  # 返回节点对象
             else:
                 return None, f"未找到ID为 {user_id} 的用户节点。"  # 没有找到节点
         except Exception as e:
             raise Exception(f"查询用户节点失败: {str(e)}")
 
-    def get_recommendations(self, user_id, k=10, parking_common=3, users_common=2, threshold_sim=0.9, m=5):
+    def get_recommendations(self, user_id, k=10, parking_common=3, users_common=2, threshold_sim=0.9, m=5,
+                            location=None, radius=3000, filters=None):
         """
-        基于用户相似性获取停车场推荐列表
+        基于用户相似性获取停车场推荐列表，相似度与推荐结果由内存中的推荐引擎计算，不再写入SIMILARITY关系
 
         :param user_id: 用户的ID
         :param k: 考虑的前k个最相似用户
@@ -65,81 +170,70 @@ class ParkingGraphQuery:
         :param users_common: 被推荐的停车场至少要被几名相似用户打分
         :param threshold_sim: 用户相似度的最小阈值
         :param m: 返回的推荐停车场数量
+        :param location: 可选的用户位置，"经度,纬度" 格式；指定后只推荐radius米范围内的停车场
+        :param radius: 搜索半径（米）
+        :param filters: 可选的候选停车场筛选条件字典，键与 filter_parking_spots 的参数相同
 
         :return: 推荐的停车场列表（包含停车场的评分和相似用户的数量）
         """
         try:
-            # 1. 清除已有的用户相似性关系
-            user_id = int(user_id)
-            self.graph.run(f"""
-                MATCH (u1:User)-[s:SIMILARITY]-(u2:User)
-                DELETE s
-            """)
-
-            # 2. 计算所有用户之间的余弦相似度，并创建相似性关系
-            self.graph.run(f"""
-                MATCH (u1:User {{id : {user_id}}})-[r1:RATED]-(p:ParkingSpot)-[r2:RATED]-(u2:User)
-                WITH
-                    u1, u2,
-                    COUNT(p) AS parking_common,
-                    SUM(r1.grading * r2.grading)/(SQRT(SUM(r1.grading^2)) * SQRT(SUM(r2.grading^2))) AS sim
-                WHERE parking_common >= {parking_common} AND sim > {threshold_sim}
-                MERGE (u1)-[s:SIMILARITY]-(u2)
-                SET s.sim = sim
-            """)
-
-            # 3. 根据相似度获取推荐的停车场
-            query = f"""
-                MATCH (u1:User {{id : {user_id}}})-[s:SIMILARITY]-(u2:User)
-                WITH u1, u2, s
-                ORDER BY s.sim DESC LIMIT {k}
-                MATCH (p:ParkingSpot)-[r:RATED]-(u2)
-                WITH u1, u2, s, p, r
-                WITH
-                    p.id AS id,
-                    p.driving_distance AS driving_distance,
-                    p.walking_distance AS walking_distance,
-                    p.found_time AS found_time,
-                    p.parking_space_size AS parking_space_size,
-                    p.parking_difficulty AS parking_difficulty,
-                    p.near_elevator AS near_elevator,
-                    p.has_surveillance AS has_surveillance,
-                    p.fee AS fee,
-                    p.parking_type AS parking_type,
-                    p.longitude AS longitude,
-                    p.latitude AS latitude,
-                    SUM(r.grading * s.sim)/SUM(s.sim) AS grade,
-                    COUNT(u2) AS num
-                WHERE num >= {users_common}
-                RETURN id, driving_distance, walking_distance, found_time, parking_space_size, parking_difficulty, near_elevator, has_surveillance, fee, parking_type, longitude, latitude, grade, num
-                ORDER BY grade DESC, num DESC
-                LIMIT {m}
-            """
-
-            # 执行查询并获取推荐结果
-            result = self.graph.run(query)
-            recommendations = []
-
-            # 将查询结果转换为字典列表
-            for record in result:
-                recommendations.append({
-                    "id": record["id"],
-                    "driving_distance": record["driving_distance"],
-                    "walking_distance": record["walking_distance"],
-                    "found_time": record["found_time"],
-                    "parking_space_size": record["parking_space_size"],
-                    "parking_difficulty": record["parking_difficulty"],
-                    "near_elevator": record["near_elevator"],
-                    "has_surveillance": record["has_surveillance"],
-                    "fee": record["fee"],
-                    "parking_type": record["parking_type"],
-                    "longitude": record["longitude"],
-                    "latitude": record["latitude"],
-                    "grade": record["grade"],
-                    "num": record["num"],
-                })
-
-            return recommendations
+            engine = self.recommendation_engine
+            if location is None and not filters and self.embedding_store is not None \
+                    and user_id in self.embedding_store:
+                return self.get_embedding_recommendations(user_id, m)
+            if location is not None or filters:
+                # 按位置或条件过滤的结果随请求变化，不进入结果缓存
+                return engine.recommend(user_id, k=k, parking_common=parking_common, users_common=users_common,
+                                        threshold_sim=threshold_sim, m=m,
+                                        location=parse_location(location) if location is not None else None,
+                                        radius=radius, filters=filters)
+
+            compute = functools.partial(engine.recommend_versioned, user_id, k=k, parking_common=parking_common,
+                                        users_common=users_common, threshold_sim=threshold_sim, m=m)
+            if self.recommendation_cache is None:
+                return compute()[1]
 
+            # 结果按计算时的评分数据版本缓存，写入评分后版本号变化，旧结果在后台刷新期间仍可返回
+            engine.ensure_loaded()
+            key = (int(user_id), k, parking_common, users_common, threshold_sim, m)
+            return self.recommendation_cache.get_or_compute(key, engine.version, compute)
         except Exception as e:
             raise Exception(f"获取推荐停车场失败: {str(e)}")
+
+    def get_embedding_recommendations(self, user_id, m=5):
+        """
+        用NGCF嵌入向量的点积为用户打分，返回用户尚未评分的停车场中得分最高的m个，返回结构与 get_recommendations 相同
+
+        :param user_id: 用户的ID
+        :param m: 返回的推荐停车场数量
+        :return: 推荐的停车场列表，grade为嵌入向量的点积得分；没有相似用户参与打分，num为0
+        """
+        # 排除用户已经评分过的停车场；多取一些候选，跳过训练数据中存在但数据库里已不存在的停车场
+        rated = self.recommendation_engine.rated_spots(user_id)
+        spot_ids, scores = self.embedding_store.recommend(user_id, m + 10, exclude=rated)
+        recommendations = []
+        for spot_id, score in zip(spot_ids, scores):
+            spot, _ = self.query_park_node(int(spot_id))
+            if spot is None:
+                continue
+            item = {field: spot.get(field) for field in SPOT_FIELDS}
+            item["grade"] = float(score)
+            item["num"] = 0
+            recommendations.append(item)
+            if len(recommendations) == m:
+                break
+        return recommendations
+
+    def get_recommendations_batch(self, user_ids, k=10, parking_common=3, users_common=2, threshold_sim=0.9, m=5):
+        """
+        为多个用户批量获取停车场推荐，参数含义与 get_recommendations 相同
+
+        :param user_ids: 用户ID列表
+        :return: 生成器，依次产出 (用户ID, 推荐的停车场列表)
+        """
+        try:
+            yield from self.recommendation_engine.recommend_batch(user_ids, k=k, parking_common=parking_common,
+                                                                  users_common=users_common,
+                                                                  threshold_sim=threshold_sim, m=m)
+        except Exception as e:
+            raise Exception(f"批量获取推荐停车场失败: {str(e)}")
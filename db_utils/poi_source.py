@@ -0,0 +1,153 @@
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+"""
+停车场POI数据源：高德地图在线查询、按城市和类型代码缓存的本地快照，以及离线模式
+"""
+
+
+class TokenBucket:
+    """
+    TokenBucket类是线程安全的令牌桶限流器：每秒补充rate个令牌，最多积累capacity个，
+    每次请求取走一个令牌，令牌不足时等待。
+    """
+
+    def __init__(self, rate=2.0, capacity=1):
+        """
+        初始化令牌桶
+        :param rate: 每秒补充的令牌数，即长期的最大请求速率
+        :param capacity: 桶容量，即允许的最大突发请求数
+        """
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        """
+        取走一个令牌，必要时等待
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class AmapPOISource:
+    """
+    AmapPOISource类通过高德地图的关键字搜索API查询某个城市某个类型代码的POI，所有请求共享一个令牌桶限流器。
+    """
+
+    URL = "https://restapi.amap.com/v3/place/text"
+
+    def __init__(self, api_key, rate=2.0, burst=1, timeout=10):
+        """
+        初始化在线数据源
+        :param api_key: 高德地图API的秘钥
+        :param rate: 每秒最多发出的请求数
+        :param burst: 允许的最大突发请求数
+        :param timeout: 单次请求的超时时间（秒）
+        """
+        self.api_key = api_key
+        self.limiter = TokenBucket(rate, burst)
+        self.timeout = timeout
+
+    def fetch(self, city, code):
+        """
+        查询一个类型代码的POI
+        :param city: 城市名称或城市行政区划代码
+        :param code: POI类型代码
+        :return: POI列表，每一项包含name、location和typecode
+        """
+        self.limiter.acquire()
+        response = requests.get(self.URL, params={'key': self.api_key, 'city': city, 'types': code,
+                                                  'offset': 20, 'page': 1, 'extensions': 'base'},
+                                timeout=self.timeout)
+        response.raise_for_status()
+        data = response.json()
+        if data.get('status') != '1':
+            raise Exception(f"查询类型 {code} 的停车场失败: {data.get('info', 'Unknown error')}")
+        return [{'name': poi.get('name', '未知停车场'),
+                 'location': poi.get('location', '0,0'),
+                 'typecode': poi.get('typecode', '未知代码')}
+                for poi in data.get('pois', [])]
+
+
+class SnapshotPOISource:
+    """
+    SnapshotPOISource类把每个 (城市, 类型代码) 的查询结果保存为本地JSON快照。
+    快照存在时直接读取；不存在时向上游数据源查询并写入快照；离线模式只读取快照。
+    """
+
+    def __init__(self, cache_dir, upstream=None, offline=False):
+        """
+        初始化快照数据源
+        :param cache_dir: 快照目录
+        :param upstream: 在线数据源（如AmapPOISource），离线模式下可以为None
+        :param offline: 是否只读取快照
+        """
+        self.cache_dir = cache_dir
+        self.upstream = upstream
+        self.offline = offline
+
+    def path(self, city, code):
+        """
+        快照文件路径
+        """
+        return os.path.join(self.cache_dir, f"{city}_{code}.json")
+
+    def fetch(self, city, code):
+        """
+        查询一个类型代码的POI，优先读取快照
+        :param city: 城市名称或城市行政区划代码
+        :param code: POI类型代码
+        :return: POI列表
+        """
+        path = self.path(city, code)
+        if os.path.exists(path):
+            with open(path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        if self.offline or self.upstream is None:
+            raise FileNotFoundError(f"离线模式下未找到POI快照: {path}")
+
+        pois = self.upstream.fetch(city, code)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        with open(path + '.tmp', 'w', encoding='utf-8') as f:
+            json.dump(pois, f, ensure_ascii=False)
+        os.replace(path + '.tmp', path)
+        return pois
+
+
+def fetch_all(source, city, codes, max_workers=4):
+    """
+    并发查询多个类型代码，单个类型代码失败时打印错误并返回空列表
+    :param source: 数据源（AmapPOISource或SnapshotPOISource）
+    :param city: 城市名称或城市行政区划代码
+    :param codes: 类型代码列表
+    :param max_workers: 并发线程数，实际请求速率仍受数据源的限流器约束
+    :return: 字典，类型代码 -> POI列表
+    """
+    def fetch_one(code):
+        try:
+            return source.fetch(city, code)
+        except FileNotFoundError:
+            raise
+        except Exception as e:
+            print(f"Request failed for type {code}: {e}")
+            return []
+
+    codes = list(dict.fromkeys(codes))
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return dict(zip(codes, executor.map(fetch_one, codes)))
@@ -0,0 +1,493 @@
+import threading
+import time
+import warnings
+
+import numpy as np
+import scipy.sparse as sp
+
+from db_utils.spatial_index import SpatialGridIndex
+
+"""
+基于内存稀疏矩阵的协同过滤推荐引擎，替代在图数据库中反复写入SIMILARITY关系的推荐流程
+"""
+
+# 推荐结果中返回的停车场属性字段，与 /recommendations/{user_id} 的返回结构保持一致
+SPOT_FIELDS = ['id', 'driving_distance', 'walking_distance', 'found_time', 'parking_space_size',
+               'parking_difficulty', 'near_elevator', 'has_surveillance', 'fee', 'parking_type',
+               'longitude', 'latitude']
+
+
+def spot_matches(spot, parking_types=None, max_fee=None, parking_difficulty=None, near_elevator=None,
+                 has_surveillance=None, spot_ids=None, limit=None):
+    """
+    判断停车场属性是否满足筛选条件，条件含义与 SpotCatalog.filter 相同（limit在这里不起作用）
+    :param spot: 停车场属性字典
+    :param spot_ids: 可选的停车场ID集合（元素为int），由调用方预先构建，避免每个停车场重复构建
+    :return: 是否满足所有条件
+    """
+    if parking_types is not None and spot.get('parking_type') not in parking_types:
+        return False
+    if max_fee is not None and (spot.get('fee') is None or spot['fee'] > max_fee):
+        return False
+    if parking_difficulty is not None:
+        if isinstance(parking_difficulty, str):
+            parking_difficulty = [parking_difficulty]
+        if spot.get('parking_difficulty') not in parking_difficulty:
+            return False
+    for field, wanted in (('near_elevator', near_elevator), ('has_surveillance', has_surveillance)):
+        if wanted is not None and (spot.get(field) is None or (spot[field] in ('是', True)) != bool(wanted)):
+            return False
+    if spot_ids is not None and int(spot['id']) not in spot_ids:
+        return False
+    return True
+
+
+class RecommendationEngine:
+    """
+    RecommendationEngine类将所有RATED关系一次性加载为 用户×停车场 的稀疏评分矩阵，
+    在内存中用向量化的稀疏运算计算用户间的余弦相似度并生成推荐结果。
+    """
+
+    def __init__(self, graph, neighbor_index=None, reload_interval=30.0, spot_catalog=None):
+        """
+        初始化推荐引擎
+        :param graph: py2neo的Graph对象，用于加载评分关系和停车场属性
+        :param neighbor_index: 可选的UserNeighborIndex，用于缓存每个用户的前k个相似用户
+        :param reload_interval: 每隔多少秒检查一次数据库中的评分是否被其他进程修改，修改后重新加载；为None时只加载一次
+        :param spot_catalog: 可选的SpotCatalog，指定后按条件筛选候选停车场时在停车场快照上筛选
+        """
+        self.graph = graph
+        self.neighbor_index = neighbor_index
+        self.spot_catalog = spot_catalog
+        self.reload_interval = reload_interval
+        self._lock = threading.RLock()
+        self._loaded = False
+        # 加载时数据库中评分关系的 (数量, 最大ingested_at)，以及上次检查的时间
+        self._rating_signature = None
+        self._checked_at = 0.0
+        # 评分数据的版本号，每次加载或写入评分后递增，用于判断缓存的推荐结果是否过期
+        self.version = 0
+
+        self.user_ids = np.empty(0, dtype=np.int64)
+        self.spot_ids = np.empty(0, dtype=np.int64)
+        self.user_index = {}
+        self.spot_index = {}
+        self.spots = {}
+        self.spatial_index = SpatialGridIndex()
+
+        self.ratings = sp.csr_matrix((0, 0), dtype=np.float64)
+        self.binary = sp.csr_matrix((0, 0), dtype=np.float64)
+        self.squared = sp.csr_matrix((0, 0), dtype=np.float64)
+
+    def load(self):
+        """
+        从数据库中加载全部评分关系与停车场属性，构建稀疏评分矩阵
+        """
+        # 先读取签名再读取评分：加载期间写入的评分会让下一次检查时签名不一致，从而再次加载
+        signature = self.rating_signature()
+        try:
+            rating_records = self.graph.run("""
+                MATCH (u:User)-[r:RATED]->(p:ParkingSpot)
+                RETURN u.id AS user_id, p.id AS parking_spot_id, r.grading AS rating
+            """).data()
+            spot_records = self.graph.run(f"""
+                MATCH (p:ParkingSpot)
+                RETURN {', '.join(f'p.{field} AS {field}' for field in SPOT_FIELDS)}
+            """).data()
+        except Exception as e:
+            raise Exception(f"加载评分数据失败: {str(e)}")
+
+        user_col = np.array([record["user_id"] for record in rating_records], dtype=np.int64)
+        spot_col = np.array([record["parking_spot_id"] for record in rating_records], dtype=np.int64)
+        rating_col = np.array([record["rating"] for record in rating_records], dtype=np.float64)
+
+        with self._lock:
+            previous = (self.user_ids, self.spot_ids, self.ratings, self.binary) if self._loaded else None
+            self.spots = {record["id"]: record for record in spot_records}
+            self.spatial_index = SpatialGridIndex.from_spots(self.spots)
+            self._build_matrix(user_col, spot_col, rating_col)
+            if self.neighbor_index is not None:
+                self.neighbor_index.attach(self, previous)
+            self._loaded = True
+            self._rating_signature = signature
+            self._checked_at = time.monotonic()
+            self.version += 1
+
+    def rating_signature(self):
+        """
+        查询数据库中评分关系的数量和最大的ingested_at，用于低成本地判断评分是否被其他进程修改。
+        关系总数由Neo4j的计数存储直接给出，最大ingested_at通过 rated_ingested_at 索引倒序取第一条，
+        两个查询都不需要扫描全部评分关系。
+        :return: (评分关系数量, 最大ingested_at)
+        """
+        try:
+            count = self.graph.run("""
+                MATCH ()-[r:RATED]->()
+                RETURN count(r) AS n
+            """).data()
+            latest = self.graph.run("""
+                MATCH ()-[r:RATED]->()
+                WHERE r.ingested_at IS NOT NULL
+                RETURN r.ingested_at AS latest
+                ORDER BY r.ingested_at DESC
+                LIMIT 1
+            """).data()
+        except Exception as e:
+            raise Exception(f"查询评分数据版本失败: {str(e)}")
+        return (count[0]["n"] if count else 0, latest[0]["latest"] if latest else None)
+
+    def _build_matrix(self, user_col, spot_col, rating_col):
+        """
+        根据评分三元组构建稀疏矩阵，同一用户对同一停车场的重复评分只保留最后一条
+        :param user_col: 用户ID数组
+        :param spot_col: 停车场ID数组
+        :param rating_col: 评分数组
+        """
+        self.user_ids, user_rows = np.unique(user_col, return_inverse=True)
+        self.spot_ids, spot_cols = np.unique(spot_col, return_inverse=True)
+        self.user_index = {int(uid): row for row, uid in enumerate(self.user_ids)}
+        self.spot_index = {int(pid): col for col, pid in enumerate(self.spot_ids)}
+
+        # 按 (用户, 停车场) 去重，保留最后出现的评分
+        keys = user_rows.astype(np.int64) * max(len(self.spot_ids), 1) + spot_cols
+        _, last = np.unique(keys[::-1], return_index=True)
+        last = len(keys) - 1 - last
+
+        self.ratings = sp.csr_matrix((rating_col[last], (user_rows[last], spot_cols[last])),
+                                     shape=(len(self.user_ids), len(self.spot_ids)))
+        self._derive_matrices()
+
+    def _derive_matrices(self):
+        """
+        由评分矩阵派生出计算相似度所需的 0/1 矩阵与平方矩阵
+        """
+        self.ratings.sort_indices()
+        self.binary = self.ratings.copy()
+        self.binary.data = np.ones_like(self.binary.data)
+        self.squared = self.ratings.copy()
+        self.squared.data = self.squared.data ** 2
+
+    def ensure_loaded(self):
+        """
+        首次使用时加载评分矩阵；之后每隔reload_interval秒检查一次数据库中的评分，
+        被其他工作进程或批量导入修改后重新加载，版本号随之递增，使缓存的推荐结果失效
+        """
+        if not self._loaded:
+            with self._lock:
+                if not self._loaded:
+                    self.load()
+            return
+        if self.reload_interval is None:
+            return
+        with self._lock:
+            now = time.monotonic()
+            if now - self._checked_at < self.reload_interval:
+                return
+            # 同一时间只有一个线程检查，其他线程继续使用当前的评分矩阵
+            self._checked_at = now
+        if self.rating_signature() != self._rating_signature:
+            self.load()
+
+    def similarity_rows(self, rows):
+        """
+        计算给定用户行与所有用户之间基于共同评分停车场的余弦相似度，
+        与原Cypher查询一致：分母只在两位用户共同评分的停车场上求平方和。
+        :param rows: 用户在矩阵中的行号数组
+        :return: (行位置, 列用户行号, 相似度, 共同评分数)，行位置为rows中的下标
+        """
+        rows = np.asarray(rows, dtype=np.int64)
+        common = (self.binary[rows] @ self.binary.T).tocoo()
+        if common.nnz == 0:
+            empty = np.empty(0, dtype=np.int64)
+            return empty, empty, np.empty(0), empty
+
+        dot = (self.ratings[rows] @ self.ratings.T).tocsr()
+        norm_self = (self.squared[rows] @ self.binary.T).tocsr()
+        norm_other = (self.binary[rows] @ self.squared.T).tocsr()
+
+        pos, col = common.row, common.col
+        dot_values = np.asarray(dot[pos, col]).ravel()
+        denominator = np.sqrt(np.asarray(norm_self[pos, col]).ravel() * np.asarray(norm_other[pos, col]).ravel())
+        with np.errstate(divide='ignore', invalid='ignore'):
+            sim = np.where(denominator > 0, dot_values / denominator, 0.)
+
+        # 排除用户与自身的相似度
+        keep = col != rows[pos]
+        return pos[keep], col[keep], sim[keep], common.data[keep].astype(np.int64)
+
+    def top_neighbors(self, pos, col, sim, common, n_rows, k, parking_common, threshold_sim):
+        """
+        在相似度结果中为每个用户行筛选出前k个相似用户
+        :return: 列表，每个元素为 (相似用户行号数组, 相似度数组, 共同评分数数组)
+        """
+        keep = (common >= parking_common) & (sim > threshold_sim)
+        pos, col, sim, common = pos[keep], col[keep], sim[keep], common[keep]
+
+        # 先按行号、再按相似度降序排序，相似度相同时按用户ID升序
+        order = np.lexsort((self.user_ids[col], -sim, pos))
+        pos, col, sim, common = pos[order], col[order], sim[order], common[order]
+        bounds = np.searchsorted(pos, np.arange(n_rows + 1))
+
+        return [(col[bounds[i]:bounds[i + 1]][:k], sim[bounds[i]:bounds[i + 1]][:k],
+                 common[bounds[i]:bounds[i + 1]][:k]) for i in range(n_rows)]
+
+    def aggregate(self, neighbor_rows, neighbor_sims, users_common, m, spot_cols=None, distances=None):
+        """
+        根据相似用户的评分加权汇总停车场得分
+        :param neighbor_rows: 相似用户行号数组
+        :param neighbor_sims: 对应的相似度数组
+        :param users_common: 被推荐的停车场至少要被几名相似用户打分
+        :param m: 返回的推荐停车场数量
+        :param spot_cols: 可选的候选停车场列号数组，为None时考虑所有停车场
+        :param distances: 候选停车场到用户位置的距离数组（米），与spot_cols对应
+        :return: 推荐的停车场列表
+        """
+        if len(neighbor_rows) == 0:
+            return []
+
+        ratings = self.ratings[neighbor_rows]
+        binary = self.binary[neighbor_rows]
+        if spot_cols is None:
+            spot_cols = np.arange(len(self.spot_ids))
+        else:
+            ratings, binary = ratings[:, spot_cols], binary[:, spot_cols]
+        weighted = np.asarray(ratings.T @ neighbor_sims).ravel()
+        weight_sum = np.asarray(binary.T @ neighbor_sims).ravel()
+        num = np.asarray(binary.sum(axis=0)).ravel().astype(np.int64)
+
+        candidates = np.flatnonzero((num >= users_common) & (num > 0))
+        if len(candidates) == 0:
+            return []
+        grade = weighted[candidates] / weight_sum[candidates]
+        # 按得分、评分人数降序排序；指定位置时，得分和人数相同的停车场距离近的优先
+        keys = (-num[candidates], -grade) if distances is None else (distances[candidates], -num[candidates], -grade)
+        order = np.lexsort(keys)[:m]
+
+        recommendations = []
+        for idx in order:
+            spot_id = int(self.spot_ids[spot_cols[candidates[idx]]])
+            spot = self.spots.get(spot_id, {})
+            item = {field: spot.get(field) for field in SPOT_FIELDS}
+            item["id"] = spot_id
+            item["grade"] = float(grade[idx])
+            item["num"] = int(num[candidates[idx]])
+            if distances is not None:
+                item["distance"] = float(distances[candidates[idx]])
+            recommendations.append(item)
+        return recommendations
+
+    def nearby_spots(self, location, radius):
+        """
+        查询用户位置半径范围内且有评分数据的停车场
+        :param location: (经度, 纬度)
+        :param radius: 半径（米）
+        :return: (停车场列号数组, 距离数组)
+        """
+        spot_ids, distances = self.spatial_index.query_radius(location[0], location[1], radius)
+        keep = np.array([int(spot_id) in self.spot_index for spot_id in spot_ids], dtype=bool)
+        spot_cols = np.array([self.spot_index[int(spot_id)] for spot_id in spot_ids[keep]], dtype=np.int64)
+        return spot_cols, distances[keep]
+
+    def candidate_spots(self, filters):
+        """
+        按条件筛选有评分数据的候选停车场；有停车场快照时用 SpotCatalog.filter 筛选，否则在已加载的停车场属性上筛选
+        :param filters: 筛选条件字典，键与 SpotCatalog.filter 的参数相同
+        :return: 停车场列号数组
+        """
+        if self.spot_catalog is not None:
+            spot_ids = self.spot_catalog.filter(**filters)
+        else:
+            if filters.get('spot_ids') is not None:
+                filters = dict(filters, spot_ids={int(spot_id) for spot_id in filters['spot_ids']})
+            spot_ids = [spot_id for spot_id, spot in self.spots.items() if spot_matches(spot, **filters)]
+        return np.array(sorted(self.spot_index[int(spot_id)] for spot_id in spot_ids
+                               if int(spot_id) in self.spot_index), dtype=np.int64)
+
+    def recommend(self, user_id, k=10, parking_common=3, users_common=2, threshold_sim=0.9, m=5,
+                  location=None, radius=None, filters=None):
+        """
+        基于用户相似性获取停车场推荐列表，参数含义与 ParkingGraphQuery.get_recommendations 相同
+        :param location: 可选的用户位置 (经度, 纬度)，指定后只在radius米范围内的停车场中打分
+        :param radius: 搜索半径（米）
+        :param filters: 可选的候选停车场筛选条件，见 candidate_spots
+        :return: 推荐的停车场列表（包含停车场的评分和相似用户的数量）
+        """
+        self.ensure_loaded()
+        with self._lock:
+            row = self.user_index.get(int(user_id))
+            if row is None:
+                return []
+            if self.neighbor_index is not None and self.neighbor_index.covers(k, parking_common, threshold_sim):
+                # 预计算的近邻索引可以满足本次查询，直接查表
+                neighbor_rows, neighbor_sims = self.neighbor_index.neighbors(self, int(user_id), k, threshold_sim)
+            else:
+                pos, col, sim, common = self.similarity_rows([row])
+                neighbor_rows, neighbor_sims, _ = self.top_neighbors(pos, col, sim, common, 1, k,
+                                                                     parking_common, threshold_sim)[0]
+            if location is None and not filters:
+                return self.aggregate(neighbor_rows, neighbor_sims, users_common, m)
+
+            spot_cols, distances = None, None
+            if location is not None:
+                spot_cols, distances = self.nearby_spots(location, radius)
+            if filters:
+                candidates = self.candidate_spots(filters)
+                if spot_cols is None:
+                    spot_cols = candidates
+                else:
+                    keep = np.isin(spot_cols, candidates)
+                    spot_cols, distances = spot_cols[keep], distances[keep]
+            if len(spot_cols) == 0:
+                return []
+            return self.aggregate(neighbor_rows, neighbor_sims, users_common, m, spot_cols, distances)
+
+    def recommend_versioned(self, user_id, **kwargs):
+        """
+        与 recommend 相同，同时返回计算所用评分数据的版本号，用于按版本缓存推荐结果
+        :param user_id: 用户ID
+        :return: (版本号, 推荐的停车场列表)
+        """
+        self.ensure_loaded()
+        with self._lock:
+            return self.version, self.recommend(user_id, **kwargs)
+
+    def recommend_batch(self, user_ids, k=10, parking_common=3, users_common=2, threshold_sim=0.9, m=5,
+                        chunk_size=1024):
+        """
+        为多个用户批量生成推荐，每批用户的相似度只需一次稀疏矩阵乘法
+        :param user_ids: 用户ID列表
+        :param chunk_size: 每批计算的用户数量
+        :return: 生成器，依次产出 (用户ID, 推荐的停车场列表)
+        """
+        self.ensure_loaded()
+        user_ids = [int(user_id) for user_id in user_ids]
+        use_index = self.neighbor_index is not None and self.neighbor_index.covers(k, parking_common, threshold_sim)
+
+        for start in range(0, len(user_ids), chunk_size):
+            chunk = user_ids[start:start + chunk_size]
+            with self._lock:
+                known = [user_id for user_id in chunk if user_id in self.user_index]
+                neighbors = {}
+                if use_index:
+                    for user_id in known:
+                        neighbors[user_id] = self.neighbor_index.neighbors(self, user_id, k, threshold_sim)
+                elif known:
+                    rows = np.array([self.user_index[user_id] for user_id in known], dtype=np.int64)
+                    pos, col, sim, common = self.similarity_rows(rows)
+                    top = self.top_neighbors(pos, col, sim, common, len(rows), k, parking_common, threshold_sim)
+                    for user_id, (neighbor_rows, neighbor_sims, _) in zip(known, top):
+                        neighbors[user_id] = (neighbor_rows, neighbor_sims)
+
+                results = []
+                for user_id in chunk:
+                    if user_id in neighbors:
+                        neighbor_rows, neighbor_sims = neighbors[user_id]
+                        results.append((user_id, self.aggregate(neighbor_rows, neighbor_sims, users_common, m)))
+                    else:
+                        results.append((user_id, []))
+            yield from results
+
+    def rated_spots(self, user_id):
+        """
+        查询用户已经评分过的停车场
+        :param user_id: 用户ID
+        :return: 停车场ID数组，用户没有评分时为空数组
+        """
+        self.ensure_loaded()
+        with self._lock:
+            row = self.user_index.get(int(user_id))
+            if row is None:
+                return np.empty(0, dtype=np.int64)
+            return self.spot_ids[self.ratings[row].indices]
+
+    def coraters(self, rows):
+        """
+        查询与指定用户至少共同评分过一个停车场的所有用户（包含这些用户自身）
+        :param rows: 用户在矩阵中的行号或行号数组
+        :return: 用户行号数组
+        """
+        return np.unique((self.binary @ self.binary[rows].T).tocoo().row)
+
+    def update_rating(self, user_id, spot_id, grading):
+        """
+        新增或更新一条评分，同步更新评分矩阵，并增量刷新该用户及其共同评分用户在近邻索引中的记录
+        :param user_id: 用户ID
+        :param spot_id: 停车场ID
+        :param grading: 评分
+        """
+        self.update_ratings([(user_id, spot_id, grading)])
+
+    def update_ratings(self, ratings):
+        """
+        批量新增或更新评分，评分矩阵只重建一次，近邻索引只刷新受影响的用户
+        :param ratings: 可迭代对象，每个元素为 (用户ID, 停车场ID, 评分)，每个元素对应数据库中新写入的一条评分关系
+        """
+        if not self._loaded:
+            # 这里只需要首次加载：评分已经写入数据库，此时检查签名会把本次写入当作外部修改而重新加载
+            self.ensure_loaded()
+        ratings = list(ratings)
+        with self._lock:
+            # 同一 (用户, 停车场) 只保留最后一条评分
+            latest = {(int(user_id), int(spot_id)): float(grading) for user_id, spot_id, grading in ratings}
+            if not latest:
+                return
+
+            for user_id, spot_id in latest:
+                if user_id not in self.user_index:
+                    self.user_index[user_id] = len(self.user_ids)
+                    self.user_ids = np.append(self.user_ids, user_id)
+                if spot_id not in self.spot_index:
+                    self.spot_index[spot_id] = len(self.spot_ids)
+                    self.spot_ids = np.append(self.spot_ids, spot_id)
+                    self._load_spot(spot_id)
+
+            rows = np.array([self.user_index[user_id] for user_id, _ in latest], dtype=np.int64)
+            cols = np.array([self.spot_index[spot_id] for _, spot_id in latest], dtype=np.int64)
+            self.ratings.resize((len(self.user_ids), len(self.spot_ids)))
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore', sp.SparseEfficiencyWarning)
+                self.ratings[rows, cols] = np.array(list(latest.values()))
+            self._derive_matrices()
+            self.version += 1
+
+            if self.neighbor_index is not None:
+                self.neighbor_index.refresh(self, self.coraters(np.unique(rows)))
+            self._advance_signature(len(ratings))
+
+    def _advance_signature(self, n_written):
+        """
+        本进程写入评分并同步到矩阵后推进记录的评分签名，避免下一次检查时把自己的写入当作外部修改而全量重新加载。
+        只有数据库中评分关系的数量恰好增加了本次写入的条数时才推进；期间其他进程也写入了评分时保持原签名，
+        下一次检查仍会重新加载。
+        :param n_written: 本次写入数据库的评分关系数量
+        """
+        if self._rating_signature is None:
+            return
+        signature = self.rating_signature()
+        if signature[0] == self._rating_signature[0] + n_written:
+            self._rating_signature = signature
+
+    def flush(self):
+        """
+        将近邻索引中尚未保存的变化写回持久化文件
+        """
+        if self.neighbor_index is not None:
+            with self._lock:
+                self.neighbor_index.flush(self)
+
+    def _load_spot(self, spot_id):
+        """
+        从数据库中补充加载单个停车场的属性
+        :param spot_id: 停车场ID
+        """
+        try:
+            record = self.graph.run(f"""
+                MATCH (p:ParkingSpot {{id: $spot_id}})
+                RETURN {', '.join(f'p.{field} AS {field}' for field in SPOT_FIELDS)}
+            """, spot_id=spot_id).data()
+        except Exception as e:
+            raise Exception(f"加载停车场属性失败: {str(e)}")
+        if record:
+            self.spots[spot_id] = record[0]
+            if record[0].get("longitude") is not None and record[0].get("latitude") is not None:
+                self.spatial_index.insert(spot_id, record[0]["longitude"], record[0]["latitude"])
@@ -0,0 +1,111 @@
+import math
+
+import numpy as np
+
+"""
+停车场的空间网格索引：按经纬度把停车场划分到固定大小的网格中，用于快速查找某个位置附近的停车场
+"""
+
+EARTH_RADIUS = 6371000.0  # 地球平均半径（米）
+METERS_PER_DEGREE = 111320.0  # 每纬度对应的距离（米）
+
+
+def parse_location(location):
+    """
+    解析 "经度,纬度" 格式的位置字符串（与高德地图API的location字段格式一致）
+    :param location: 位置字符串
+    :return: (经度, 纬度)
+    """
+    try:
+        longitude, latitude = map(float, location.split(','))
+    except (AttributeError, ValueError):
+        raise ValueError(f"位置格式错误，应为 '经度,纬度': {location}")
+    return longitude, latitude
+
+
+def haversine(longitude, latitude, longitudes, latitudes):
+    """
+    计算一个位置到一组位置的球面距离
+    :param longitude: 起点经度
+    :param latitude: 起点纬度
+    :param longitudes: 终点经度数组
+    :param latitudes: 终点纬度数组
+    :return: 距离数组（米）
+    """
+    lon1, lat1 = math.radians(longitude), math.radians(latitude)
+    lon2, lat2 = np.radians(longitudes), np.radians(latitudes)
+    a = np.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.minimum(a, 1.)))
+
+
+class SpatialGridIndex:
+    """
+    SpatialGridIndex类把停车场按经纬度放入边长为cell_size米的网格，
+    半径查询时只检查与查询范围相交的网格，再用球面距离精确过滤。
+    """
+
+    def __init__(self, cell_size=1000.0):
+        """
+        初始化网格索引
+        :param cell_size: 网格边长（米）
+        """
+        self.cell_degrees = cell_size / METERS_PER_DEGREE
+        self.cells = {}
+        self.locations = {}
+
+    @classmethod
+    def from_spots(cls, spots, cell_size=1000.0):
+        """
+        由停车场属性字典构建索引，跳过没有坐标的停车场
+        :param spots: 字典，停车场ID -> 含longitude/latitude的属性字典
+        :param cell_size: 网格边长（米）
+        :return: SpatialGridIndex对象
+        """
+        index = cls(cell_size)
+        for spot_id, spot in spots.items():
+            if spot.get("longitude") is not None and spot.get("latitude") is not None:
+                index.insert(spot_id, spot["longitude"], spot["latitude"])
+        return index
+
+    def _cell(self, longitude, latitude):
+        return int(math.floor(longitude / self.cell_degrees)), int(math.floor(latitude / self.cell_degrees))
+
+    def insert(self, spot_id, longitude, latitude):
+        """
+        加入或移动一个停车场
+        :param spot_id: 停车场ID
+        :param longitude: 经度
+        :param latitude: 纬度
+        """
+        spot_id = int(spot_id)
+        if spot_id in self.locations:
+            self.cells[self._cell(*self.locations[spot_id])].discard(spot_id)
+        self.locations[spot_id] = (float(longitude), float(latitude))
+        self.cells.setdefault(self._cell(longitude, latitude), set()).add(spot_id)
+
+    def query_radius(self, longitude, latitude, radius):
+        """
+        查询半径范围内的停车场
+        :param longitude: 中心经度
+        :param latitude: 中心纬度
+        :param radius: 半径（米）
+        :return: (停车场ID数组, 距离数组)，按距离升序排列
+        """
+        lat_span = radius / METERS_PER_DEGREE
+        lon_span = radius / (METERS_PER_DEGREE * max(math.cos(math.radians(latitude)), 1e-6))
+        min_x, min_y = self._cell(longitude - lon_span, latitude - lat_span)
+        max_x, max_y = self._cell(longitude + lon_span, latitude + lat_span)
+
+        candidates = []
+        for x in range(min_x, max_x + 1):
+            for y in range(min_y, max_y + 1):
+                candidates.extend(self.cells.get((x, y), ()))
+        if not candidates:
+            return np.empty(0, dtype=np.int64), np.empty(0)
+
+        spot_ids = np.array(candidates, dtype=np.int64)
+        coords = np.array([self.locations[spot_id] for spot_id in candidates])
+        distances = haversine(longitude, latitude, coords[:, 0], coords[:, 1])
+        keep = distances <= radius
+        order = np.argsort(distances[keep], kind='stable')
+        return spot_ids[keep][order], distances[keep][order]
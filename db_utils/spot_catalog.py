@@ -0,0 +1,407 @@
+import argparse
+import json
+import os
+import sys
+import threading
+import uuid
+from contextlib import contextmanager
+
+import numpy as np
+import pandas as pd
+
+if __package__ in (None, ''):
+    # 在 db_utils/ 目录下直接运行脚本时，把仓库根目录加入模块搜索路径，使 db_utils 包可以导入
+    sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_utils.recommendation_engine import SPOT_FIELDS
+
+try:
+    import fcntl
+except ImportError:
+    # Windows下用msvcrt实现文件锁
+    fcntl = None
+    import msvcrt
+
+"""
+停车场属性的列式二进制快照：由 parking_spots_with_coords.csv、图数据库导出文件或图数据库本身编译而成，
+服务进程以内存映射方式读取，按ID查询停车场和按条件筛选候选停车场都不再访问数据库
+"""
+
+# 仓库根目录，命令行的默认路径都相对于它，与脚本从哪个目录运行无关
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 各字段在快照中的存储方式
+INT_FIELDS = ['driving_distance', 'walking_distance', 'found_time', 'parking_space_size']
+FLOAT_FIELDS = ['fee', 'longitude', 'latitude']
+CATEGORY_FIELDS = ['parking_difficulty', 'parking_type']
+FLAG_FIELDS = ['near_elevator', 'has_surveillance']
+# 整数字段缺失值的存储值
+INT_NULL = np.iinfo(np.int32).min
+
+# parking_spots_with_coords.csv 的列名与节点属性名的对应关系
+CSV_COLUMNS = {
+    'id': 'ID',
+    'driving_distance': 'Driving Distance (meters)',
+    'walking_distance': 'Walking Distance (meters)',
+    'found_time': 'Time to Find Parking (minutes)',
+    'parking_space_size': 'Parking Space Size (0-10)',
+    'parking_difficulty': 'Parking Difficulty',
+    'near_elevator': 'Near Elevator',
+    'has_surveillance': 'Has Surveillance',
+    'fee': 'Parking Fee (CNY/hour)',
+    'parking_type': 'Parking Type',
+    'longitude': 'Longitude',
+    'latitude': 'Latitude',
+}
+
+
+def records_from_csv(csv_path):
+    """
+    读取停车位CSV文件
+    :param csv_path: parking_spots_with_coords.csv 的路径
+    :return: 以节点属性名为列名的DataFrame
+    """
+    try:
+        df = pd.read_csv(csv_path, dtype={CSV_COLUMNS[field]: str for field in CATEGORY_FIELDS + FLAG_FIELDS})
+    except Exception as e:
+        raise Exception(f"读取停车位文件失败: {str(e)}")
+    return df.rename(columns={column: field for field, column in CSV_COLUMNS.items()})[SPOT_FIELDS]
+
+
+def records_from_dump(dump_path):
+    """
+    读取图数据库导出的停车场节点，每行一个JSON对象：节点属性字典，
+    或APOC导出格式 {"type": "node", "labels": [...], "properties": {...}}（只保留ParkingSpot节点）
+    :param dump_path: 导出文件路径
+    :return: 以节点属性名为列名的DataFrame
+    """
+    records = []
+    try:
+        with open(dump_path, 'r', encoding='utf-8') as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                record = json.loads(line)
+                if record.get('type') == 'node':
+                    if 'ParkingSpot' not in record.get('labels', []):
+                        continue
+                    record = record.get('properties', {})
+                records.append({field: record.get(field) for field in SPOT_FIELDS})
+    except Exception as e:
+        raise Exception(f"读取图数据库导出文件失败: {str(e)}")
+    return pd.DataFrame(records, columns=SPOT_FIELDS)
+
+
+def records_from_graph(graph):
+    """
+    从数据库中读取全部停车场节点的属性
+    :param graph: py2neo的Graph对象
+    :return: 以节点属性名为列名的DataFrame
+    """
+    try:
+        records = graph.run(f"""
+            MATCH (p:ParkingSpot)
+            RETURN {', '.join(f'p.{field} AS {field}' for field in SPOT_FIELDS)}
+        """).data()
+    except Exception as e:
+        raise Exception(f"加载停车场属性失败: {str(e)}")
+    return pd.DataFrame(records, columns=SPOT_FIELDS)
+
+
+@contextmanager
+def catalog_lock(path):
+    """
+    跨进程的快照写入锁（<path>.lock），保证同一时间只有一个进程编译或替换快照
+    :param path: 快照路径前缀，不含扩展名
+    """
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path + '.lock', 'a+b') as f:
+        if fcntl is not None:
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        else:
+            while True:
+                try:
+                    f.seek(0)
+                    msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    continue
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+
+
+def write_catalog(path, records):
+    """
+    将停车场属性编译为列式快照：<path>.json 保存元数据，并指向同目录下本次写入的数据文件 <path>.<版本>.bin。
+    数值字段保存为NumPy数组（整数缺失值为INT_NULL，浮点数缺失值为NaN），类别字段保存为字典编码
+    （uint8/uint16的编号和取值表），是/否 字段与其是否有值分别按位打包；所有行按ID排序以便二分查找，
+    同一ID出现多次时保留最后一条。
+    :param path: 快照路径前缀，不含扩展名
+    :param records: 以节点属性名为列名的DataFrame
+    :return: 写入的停车场数量
+    """
+    with catalog_lock(path):
+        return _write_catalog(path, records)
+
+
+def ensure_catalog(path, graph):
+    """
+    快照不存在时从数据库编译；多个工作进程同时启动时只有一个进程编译，其他进程等它完成后直接使用
+    :param path: 快照路径前缀，不含扩展名
+    :param graph: py2neo的Graph对象
+    :return: 是否编译了新的快照
+    """
+    if os.path.exists(path + '.json'):
+        return False
+    with catalog_lock(path):
+        if os.path.exists(path + '.json'):
+            return False
+        _write_catalog(path, records_from_graph(graph))
+        return True
+
+
+def _write_catalog(path, records):
+    """
+    write_catalog的实现，调用方需持有catalog_lock
+    """
+    try:
+        df = records.dropna(subset=['id']).drop_duplicates(subset='id', keep='last').sort_values('id')
+        arrays = {'id': df['id'].to_numpy(dtype='<i8')}
+        categories = {}
+        for field in INT_FIELDS:
+            values = pd.to_numeric(df[field]).to_numpy(dtype='<f8')
+            arrays[field] = np.where(np.isnan(values), INT_NULL, values).astype('<i4')
+        for field in FLOAT_FIELDS:
+            arrays[field] = pd.to_numeric(df[field]).to_numpy(dtype='<f8')
+        for field in CATEGORY_FIELDS:
+            values = [None if pd.isna(value) else value for value in df[field].tolist()]
+            categories[field] = list(dict.fromkeys(values))
+            dtype = '<u1' if len(categories[field]) <= 256 else '<u2'
+            codes = {value: code for code, value in enumerate(categories[field])}
+            arrays[field] = np.array([codes[value] for value in values], dtype=dtype)
+        for field in FLAG_FIELDS:
+            arrays[field] = np.packbits(df[field].isin(['是', True]).to_numpy())
+            arrays[field + '_present'] = np.packbits(df[field].notna().to_numpy())
+    except Exception as e:
+        raise Exception(f"编译停车场快照失败: {str(e)}")
+
+    data_file = f"{os.path.basename(path)}.{uuid.uuid4().hex[:12]}.bin"
+    meta = {'n_spots': len(df), 'data_file': data_file, 'columns': {}, 'categories': categories}
+    offset = 0
+    for field, array in arrays.items():
+        meta['columns'][field] = {'dtype': array.dtype.str, 'offset': offset, 'length': len(array)}
+        # 每列按8字节对齐，便于直接映射为对应类型的数组
+        offset += -(-array.nbytes // 8) * 8
+
+    directory = os.path.dirname(path)
+    # 数据文件每次使用新的文件名，元数据最后原子替换：读取方看到的元数据和数据文件总是同一次写入的
+    with open(os.path.join(directory, data_file), 'wb') as f:
+        for field, array in arrays.items():
+            f.seek(meta['columns'][field]['offset'])
+            f.write(array.tobytes())
+        f.truncate(max(offset, 1))
+    with open(f"{path}.json.{os.getpid()}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(meta, f, ensure_ascii=False)
+    os.replace(f"{path}.json.{os.getpid()}.tmp", path + '.json')
+
+    # 删除旧版本的数据文件；仍在映射旧文件的进程不受影响（Windows上删除失败时留到下次）
+    prefix = os.path.basename(path) + '.'
+    for name in os.listdir(directory or '.'):
+        if name.startswith(prefix) and name.endswith('.bin') and name != data_file \
+                and len(name) == len(data_file):
+            try:
+                os.remove(os.path.join(directory, name))
+            except OSError:
+                pass
+    return len(df)
+
+
+class SpotCatalog:
+    """
+    SpotCatalog类以内存映射方式读取 write_catalog 生成的停车场快照，多个工作进程共享操作系统的页缓存；
+    快照文件被替换后自动重新映射。快照只是数据库的副本，refresh 从数据库重新编译快照。
+    """
+
+    def __init__(self, path):
+        """
+        打开停车场快照
+        :param path: 快照路径前缀，不含扩展名
+        """
+        self.path = path
+        self._lock = threading.Lock()
+        self._mtime = None
+        self._load()
+
+    def _load(self):
+        """
+        读取元数据并映射各列
+        """
+        try:
+            meta_path = self.path + '.json'
+            mtime = os.stat(meta_path).st_mtime_ns
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+            data_path = os.path.join(os.path.dirname(self.path), meta['data_file'])
+            columns = {}
+            if meta['n_spots']:
+                for field, column in meta['columns'].items():
+                    columns[field] = np.memmap(data_path, dtype=column['dtype'], mode='r',
+                                               offset=column['offset'], shape=(column['length'],))
+            else:
+                for field, column in meta['columns'].items():
+                    columns[field] = np.empty(0, dtype=column['dtype'])
+        except Exception as e:
+            raise Exception(f"加载停车场快照失败: {str(e)}")
+
+        with self._lock:
+            self.n_spots = meta['n_spots']
+            self.columns = columns
+            self.categories = meta['categories']
+            self._mtime = mtime
+
+    def reload_if_changed(self):
+        """
+        快照文件被重新写入后重新映射
+        """
+        try:
+            mtime = os.stat(self.path + '.json').st_mtime_ns
+        except OSError:
+            return
+        if mtime != self._mtime:
+            self._load()
+
+    def refresh(self, graph):
+        """
+        从数据库重新编译快照并重新映射
+        :param graph: py2neo的Graph对象
+        :return: 快照中的停车场数量
+        """
+        n_spots = write_catalog(self.path, records_from_graph(graph))
+        self._load()
+        return n_spots
+
+    def _snapshot(self):
+        self.reload_if_changed()
+        with self._lock:
+            return self.n_spots, self.columns, self.categories
+
+    def __len__(self):
+        return self._snapshot()[0]
+
+    def __contains__(self, spot_id):
+        n_spots, columns, _ = self._snapshot()
+        return self._row(n_spots, columns, spot_id) is not None
+
+    @staticmethod
+    def _row(n_spots, columns, spot_id):
+        ids = columns['id']
+        row = int(np.searchsorted(ids, int(spot_id)))
+        if row < n_spots and ids[row] == int(spot_id):
+            return row
+        return None
+
+    def get(self, spot_id):
+        """
+        按ID查询停车场属性
+        :param spot_id: 停车场ID
+        :return: 属性字典（字段与数据库中的节点属性相同，缺失的属性为None），不在快照中时返回None
+        """
+        n_spots, columns, categories = self._snapshot()
+        row = self._row(n_spots, columns, spot_id)
+        if row is None:
+            return None
+        spot = {'id': int(columns['id'][row])}
+        for field in INT_FIELDS:
+            value = int(columns[field][row])
+            spot[field] = None if value == INT_NULL else value
+        for field in FLOAT_FIELDS:
+            value = float(columns[field][row])
+            spot[field] = None if np.isnan(value) else value
+        for field in CATEGORY_FIELDS:
+            spot[field] = categories[field][columns[field][row]]
+        for field in FLAG_FIELDS:
+            if not self._bit(columns[field + '_present'], row):
+                spot[field] = None
+            else:
+                spot[field] = '是' if self._bit(columns[field], row) else '否'
+        return {field: spot[field] for field in SPOT_FIELDS}
+
+    @staticmethod
+    def _bit(packed, row):
+        return bool((packed[row >> 3] >> (7 - (row & 7))) & 1)
+
+    def filter(self, parking_types=None, max_fee=None, parking_difficulty=None, near_elevator=None,
+               has_surveillance=None, spot_ids=None, limit=None):
+        """
+        按条件筛选候选停车场，所有条件之间为“与”的关系，为None的条件不参与筛选
+        :param parking_types: 可接受的停车场类型列表
+        :param max_fee: 可接受的最高停车费用（元/小时）
+        :param parking_difficulty: 可接受的停车难度，字符串或列表
+        :param near_elevator: 是否要求靠近电梯（True/False）
+        :param has_surveillance: 是否要求有监控（True/False）
+        :param spot_ids: 只在这些停车场ID中筛选
+        :param limit: 最多返回的数量
+        :return: 满足条件的停车场ID数组，按ID升序排列
+        """
+        n_spots, columns, categories = self._snapshot()
+        mask = np.ones(n_spots, dtype=bool)
+        if parking_types is not None:
+            mask &= self._category_mask(columns, categories, 'parking_type', parking_types)
+        if parking_difficulty is not None:
+            if isinstance(parking_difficulty, str):
+                parking_difficulty = [parking_difficulty]
+            mask &= self._category_mask(columns, categories, 'parking_difficulty', parking_difficulty)
+        if max_fee is not None:
+            mask &= columns['fee'] <= max_fee
+        for field, wanted in (('near_elevator', near_elevator), ('has_surveillance', has_surveillance)):
+            if wanted is not None:
+                present = np.unpackbits(columns[field + '_present'], count=n_spots).astype(bool)
+                mask &= present & (np.unpackbits(columns[field], count=n_spots).astype(bool) == bool(wanted))
+        if spot_ids is not None:
+            mask &= np.isin(columns['id'], np.asarray(list(spot_ids), dtype=np.int64))
+
+        result = columns['id'][np.flatnonzero(mask)]
+        if limit is not None:
+            result = result[:limit]
+        return np.asarray(result, dtype=np.int64)
+
+    @staticmethod
+    def _category_mask(columns, categories, field, values):
+        values = set(values)
+        codes = [code for code, value in enumerate(categories[field]) if value in values]
+        return np.isin(columns[field], codes)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="将停车场属性编译为列式二进制快照")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument('--csv', help="parking_spots_with_coords.csv 的路径")
+    source.add_argument('--dump', help="图数据库导出的停车场节点文件（JSON Lines）")
+    source.add_argument('--graph', action='store_true', help="直接从图数据库读取")
+    parser.add_argument('--output', default=os.path.join(REPO_ROOT, 'data', 'parking_catalog'), help="快照路径前缀，不含扩展名")
+    args = parser.parse_args()
+
+    if args.csv:
+        records = records_from_csv(args.csv)
+    elif args.dump:
+        records = records_from_dump(args.dump)
+    else:
+        import dotenv
+        from db_utils.connection_provider import GraphConnectionProvider
+
+        dotenv.load_dotenv(os.path.join(REPO_ROOT, "Neo4j-fe89fc25-Created-2024-09-29.txt"))
+        connection_provider = GraphConnectionProvider(os.getenv("NEO4J_URI"), os.getenv("NEO4J_USERNAME"),
+                                                      os.getenv("NEO4J_PASSWORD"), max_size=1)
+        records = records_from_graph(connection_provider.graph)
+        connection_provider.close()
+
+    n_spots = write_catalog(args.output, records)
+    print(f"已将 {n_spots} 个停车场写入 {args.output}.json")
@@ -28,11 +28,18 @@ class NGCF(nn.Module):
         """
         self.embedding_dict, self.weight_dict = self.init_weight()
 
+        # final propagated embeddings reused for evaluation and serving.
+        self._embedding_cache = None
+        self._embedding_cache_version = None
+
         """
         *********************************************************
         Get sparse adj.
         """
         self.sparse_norm_adj = self._convert_sp_mat_to_sp_tensor(self.norm_adj).to(self.device)
+        if getattr(args, 'sparse_layout', 'coo') == 'csr':
+            # CSR is the faster layout for sparse-dense matmul on CPU.
+            self.sparse_norm_adj = self.sparse_norm_adj.coalesce().to_sparse_csr()
 
     def init_weight(self):
         # xavier init
@@ -68,6 +75,13 @@ class NGCF(nn.Module):
         random_tensor = 1 - rate
         random_tensor += torch.rand(noise_shape).to(x.device)
         dropout_mask = torch.floor(random_tensor).type(torch.bool)
+
+        if x.layout == torch.sparse_csr:
+            # keep the CSR structure and zero the dropped values instead.
+            v = x.values() * dropout_mask
+            out = torch.sparse_csr_tensor(x.crow_indices(), x.col_indices(), v, x.shape)
+            return out * (1. / (1 - rate))
+
         i = x._indices()
         v = x._values()
 
@@ -96,8 +110,11 @@ class NGCF(nn.Module):
     def rating(self, u_g_embeddings, pos_i_g_embeddings):
         return torch.matmul(u_g_embeddings, pos_i_g_embeddings.t())
 
-    def forward(self, users, pos_items, neg_items, drop_flag=True):
-
+    def propagate(self, drop_flag=True, mess_dropout=True):
+        """
+        Run graph propagation over all users and items and return the final
+        (u_g_embeddings, i_g_embeddings) tables.
+        """
         A_hat = self.sparse_dropout(self.sparse_norm_adj,
                                     self.node_dropout,
                                     self.sparse_norm_adj._nnz()) if drop_flag else self.sparse_norm_adj
@@ -125,7 +142,8 @@ class NGCF(nn.Module):
             ego_embeddings = nn.LeakyReLU(negative_slope=0.2)(sum_embeddings + bi_embeddings)
 
             # message dropout.
-            ego_embeddings = nn.Dropout(self.mess_dropout[k])(ego_embeddings)
+            if mess_dropout:
+                ego_embeddings = nn.Dropout(self.mess_dropout[k])(ego_embeddings)
 
             # normalize the distribution of embeddings.
             norm_embeddings = F.normalize(ego_embeddings, p=2, dim=1)
@@ -136,6 +154,37 @@ class NGCF(nn.Module):
         u_g_embeddings = all_embeddings[:self.n_user, :]
         i_g_embeddings = all_embeddings[self.n_user:, :]
 
+        return u_g_embeddings, i_g_embeddings
+
+    def _weights_version(self):
+        # in-place optimizer steps and load_state_dict bump the parameter versions.
+        return tuple((id(p), p._version) for p in self.parameters())
+
+    def inference_embeddings(self):
+        """
+        Propagate once without dropout and cache the final embedding tables;
+        the cache is reused until any weight changes.
+        """
+        version = self._weights_version()
+        if self._embedding_cache is None or self._embedding_cache_version != version:
+            with torch.no_grad():
+                self._embedding_cache = self.propagate(drop_flag=False, mess_dropout=False)
+            self._embedding_cache_version = version
+        return self._embedding_cache
+
+    def inference_rating(self, users, items=None):
+        """
+        Score users against items (all items by default) with the cached embedding tables.
+        """
+        u_g_embeddings, i_g_embeddings = self.inference_embeddings()
+        if items is not None:
+            i_g_embeddings = i_g_embeddings[items, :]
+        return self.rating(u_g_embeddings[users, :], i_g_embeddings)
+
+    def forward(self, users, pos_items, neg_items, drop_flag=True):
+
+        u_g_embeddings, i_g_embeddings = self.propagate(drop_flag)
+
         """
         *********************************************************
         look up.
@@ -0,0 +1,73 @@
+'''
+Recall/latency report of the IVF item index (db_utils/ann_index.py) used to serve exported embeddings.
+
+The reference is the exact heapq.nlargest ranking of batch_test.ranklist_by_heapq; run from model/ like main.py:
+    PYTHONPATH=utility python evaluate_ann.py --dataset park --export_path ../embeddings/park --ann_probes [1,4,16]
+'''
+import os
+import sys
+from time import time
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from db_utils.ann_index import IVFIndex
+from utility.batch_test import *
+from utility.export import load_embeddings
+
+
+def evaluate_exact(user_embeddings, item_embeddings, users):
+    recall, t = np.zeros(len(Ks)), 0.
+    for u in users:
+        user_pos_test = data_generator.test_set[u]
+        test_items = list(set(range(ITEM_NUM)) - set(data_generator.train_items.get(u, [])))
+
+        t0 = time()
+        rating = np.asarray(item_embeddings @ user_embeddings[u])
+        r, _ = ranklist_by_heapq(user_pos_test, test_items, rating, Ks)
+        t += time() - t0
+
+        recall += [metrics.recall_at_k(r, K, len(user_pos_test)) for K in Ks]
+    return recall / len(users), t / len(users)
+
+
+def evaluate_ann(index, n_probes, user_embeddings, item_embeddings, users):
+    K_max = max(Ks)
+    recall, overlap, t = np.zeros(len(Ks)), np.zeros(len(Ks)), 0.
+    for u in users:
+        user_pos_test = data_generator.test_set[u]
+        training_items = data_generator.train_items.get(u, [])
+        test_items = list(set(range(ITEM_NUM)) - set(training_items))
+
+        t0 = time()
+        ann_items, _ = index.search(user_embeddings[u], K_max, n_probes=n_probes, exclude=training_items)
+        t += time() - t0
+
+        r = [1 if i in user_pos_test else 0 for i in ann_items]
+        r += [0] * (K_max - len(r))
+        recall += [metrics.recall_at_k(r, K, len(user_pos_test)) for K in Ks]
+
+        # recall@K against the exact ranking: the ANN top-K plays the role of the positives.
+        rating = np.asarray(item_embeddings @ user_embeddings[u])
+        for k_id, K in enumerate(Ks):
+            r_exact, _ = ranklist_by_heapq(set(ann_items[:K]), test_items, rating, Ks)
+            overlap[k_id] += metrics.recall_at_k(r_exact, K, min(K, len(test_items)))
+    return recall / len(users), overlap / len(users), t / len(users)
+
+
+if __name__ == '__main__':
+    user_embeddings, item_embeddings, _ = load_embeddings(args.export_path)
+    users = list(data_generator.test_set.keys())
+
+    n_lists = args.ann_lists or int(np.sqrt(ITEM_NUM))
+    t0 = time()
+    index = IVFIndex(n_lists=n_lists).build(item_embeddings)
+    print('build IVF index with %d lists over %d items in %.2fs' % (index.n_lists, ITEM_NUM, time() - t0))
+
+    recall, t = evaluate_exact(user_embeddings, item_embeddings, users)
+    print('exact       \t%.3fms/query\ttest recall=[%s]' % (t * 1000, '\t'.join(['%.5f' % r for r in recall])))
+
+    for n_probes in eval(args.ann_probes):
+        recall, overlap, t = evaluate_ann(index, n_probes, user_embeddings, item_embeddings, users)
+        print('n_probes=%-4d\t%.3fms/query\ttest recall=[%s]\trecall vs exact=[%s]' %
+              (n_probes, t * 1000, '\t'.join(['%.5f' % r for r in recall]),
+               '\t'.join(['%.5f' % r for r in overlap])))
@@ -3,18 +3,43 @@
 import torch
 import torch.optim as optim
 import numpy as np
+import sys
 from NGCF import NGCF
 from utility.helper import *
 from utility.batch_test import *
+from utility.export import export_embeddings
+from utility.loader import BatchLoader
 
 import warnings
 warnings.filterwarnings('ignore')
 from time import time
 
 
+def select_device(args):
+    """
+    Pick the training device from --device/--gpu_id, falling back to CPU when CUDA is unavailable,
+    and configure the CPU thread count and the sparse adjacency layout.
+    """
+    if args.device in ('auto', 'cuda') and torch.cuda.is_available():
+        gpu_id = args.gpu_id if args.gpu_id < torch.cuda.device_count() else 0
+        device = torch.device('cuda:%d' % gpu_id)
+    else:
+        if args.device == 'cuda':
+            print('CUDA is not available, falling back to CPU.')
+        device = torch.device('cpu')
+        if args.num_threads > 0:
+            torch.set_num_threads(args.num_threads)
+
+    if args.sparse_layout == 'auto':
+        args.sparse_layout = 'csr' if device.type == 'cpu' else 'coo'
+
+    print('device=%s, threads=%d, sparse_layout=%s' % (device, torch.get_num_threads(), args.sparse_layout))
+    return device
+
+
 if __name__ == '__main__':
 
-    args.device = torch.device('cuda:0')
+    args.device = select_device(args)
 
     plain_adj, norm_adj, mean_adj = data_generator.get_adj_mat()
 
@@ -26,6 +51,9 @@ if __name__ == '__main__':
                  norm_adj,
                  args).to(args.device)
 
+    loader = BatchLoader(data_generator, seed=args.seed, mode=args.sampling, num_workers=args.num_workers,
+                         prefetch=args.prefetch, pin_memory=args.device.type == 'cuda')
+
     t0 = time()
     """
     *********************************************************
@@ -38,10 +66,10 @@ if __name__ == '__main__':
     for epoch in range(args.epoch):
         t1 = time()
         loss, mf_loss, emb_loss = 0., 0., 0.
-        n_batch = data_generator.n_train // args.batch_size + 1
+        n_batch = loader.n_batch
 
-        for idx in range(n_batch):
-            users, pos_items, neg_items = data_generator.sample()
+        for batch in loader.epoch(epoch):
+            users, pos_items, neg_items = [x.to(args.device, non_blocking=True) for x in batch]
             u_g_embeddings, pos_i_g_embeddings, neg_i_g_embeddings = model(users,
                                                                            pos_items,
                                                                            neg_items,
@@ -58,6 +86,13 @@ if __name__ == '__main__':
             mf_loss += batch_mf_loss
             emb_loss += batch_emb_loss
 
+        if args.benchmark:
+            epoch_time = time() - t1
+            n_samples = len(loader.train_users) if args.sampling == 'epoch' else n_batch * args.batch_size
+            print('Epoch %d [%.1fs]: %d samples, %.1f samples/sec, train==[%.5f=%.5f + %.5f]' % (
+                epoch, epoch_time, n_samples, n_samples / epoch_time, loss, mf_loss, emb_loss))
+            continue
+
         if (epoch + 1) % 10 != 0:
             if args.verbose > 0 and epoch % args.verbose == 0:
                 perf_str = 'Epoch %d [%.1fs]: train==[%.5f=%.5f + %.5f]' % (
@@ -67,7 +102,10 @@ if __name__ == '__main__':
 
         t2 = time()
         users_to_test = list(data_generator.test_set.keys())
-        ret = test(model, users_to_test, drop_flag=False)
+        if args.test_flag == 'part':
+            ret = test_vectorized(model, users_to_test, drop_flag=False)
+        else:
+            ret = test(model, users_to_test, drop_flag=False)
 
         t3 = time()
 
@@ -99,6 +137,16 @@ if __name__ == '__main__':
             torch.save(model.state_dict(), args.weights_path + str(epoch) + '.pkl')
             print('save the weights in path: ', args.weights_path + str(epoch) + '.pkl')
 
+        # *********************************************************
+        # export the final user & item embeddings of the best model for serving.
+        if ret['recall'][0] == cur_best_pre_0 and args.export_path:
+            u_g_embeddings, i_g_embeddings = model.inference_embeddings()
+            export_embeddings(args.export_path, u_g_embeddings.cpu().numpy(), i_g_embeddings.cpu().numpy())
+
+    if args.benchmark:
+        print('Benchmark finished [%.1fs]' % (time() - t0))
+        sys.exit(0)
+
     recs = np.array(rec_loger)
     pres = np.array(pre_loger)
     ndcgs = np.array(ndcg_loger)
@@ -10,8 +10,9 @@ from parser import parse_args
 from load_data import *
 import multiprocessing
 import heapq
+import torch
 
-cores = multiprocessing.cpu_count() // 2
+cores = max(multiprocessing.cpu_count() // 2, 1)
 
 args = parse_args()
 Ks = eval(args.Ks)
@@ -142,11 +143,8 @@ def test(model, users_to_test, drop_flag=False, batch_test_flag=False):
                 item_batch = range(i_start, i_end)
 
                 if drop_flag == False:
-                    u_g_embeddings, pos_i_g_embeddings, _ = model(user_batch,
-                                                                  item_batch,
-                                                                  [],
-                                                                  drop_flag=False)
-                    i_rate_batch = model.rating(u_g_embeddings, pos_i_g_embeddings).detach().cpu()
+                    # propagated embeddings are cached across batches while the weights are unchanged.
+                    i_rate_batch = model.inference_rating(user_batch, item_batch).detach().cpu()
                 else:
                     u_g_embeddings, pos_i_g_embeddings, _ = model(user_batch,
                                                                   item_batch,
@@ -164,11 +162,7 @@ def test(model, users_to_test, drop_flag=False, batch_test_flag=False):
             item_batch = range(ITEM_NUM)
 
             if drop_flag == False:
-                u_g_embeddings, pos_i_g_embeddings, _ = model(user_batch,
-                                                              item_batch,
-                                                              [],
-                                                              drop_flag=False)
-                rate_batch = model.rating(u_g_embeddings, pos_i_g_embeddings).detach().cpu()
+                rate_batch = model.inference_rating(user_batch).detach().cpu()
             else:
                 u_g_embeddings, pos_i_g_embeddings, _ = model(user_batch,
                                                               item_batch,
@@ -191,3 +185,70 @@ def test(model, users_to_test, drop_flag=False, batch_test_flag=False):
     assert count == n_test_users
     pool.close()
     return result
+
+
+def get_test_keys():
+    # sorted unique (uid * ITEM_NUM + iid) keys of the test interactions, with per-user counts.
+    test_set = data_generator.test_set
+    users = np.repeat(np.arange(USR_NUM, dtype=np.int64), np.diff(test_set.indptr))
+    keys = np.unique(users * ITEM_NUM + test_set.indices)
+    n_pos = np.diff(test_set.indptr).astype(np.int64)
+    n_pos_unique = np.bincount(keys // ITEM_NUM, minlength=USR_NUM)
+    return keys, n_pos, n_pos_unique
+
+
+def rating_batch(model, user_batch, drop_flag=False, batch_test_flag=False):
+    if drop_flag == False:
+        return model.inference_rating(user_batch).detach().cpu()
+
+    if batch_test_flag:
+        i_batch_size = BATCH_SIZE
+        rate_batch = []
+        for i_start in range(0, ITEM_NUM, i_batch_size):
+            item_batch = range(i_start, min(i_start + i_batch_size, ITEM_NUM))
+            u_g_embeddings, pos_i_g_embeddings, _ = model(user_batch, item_batch, [], drop_flag=True)
+            rate_batch.append(model.rating(u_g_embeddings, pos_i_g_embeddings).detach().cpu())
+        return torch.cat(rate_batch, dim=1)
+
+    u_g_embeddings, pos_i_g_embeddings, _ = model(user_batch, range(ITEM_NUM), [], drop_flag=True)
+    return model.rating(u_g_embeddings, pos_i_g_embeddings).detach().cpu()
+
+
+def test_vectorized(model, users_to_test, drop_flag=False, batch_test_flag=False):
+    # same metrics as test() with test_flag='part' (auc is 0): training items are masked out of the score
+    # matrix, the top-K_max items of a whole user batch come from one torch.topk, and the metrics for all Ks
+    # come from metrics.batch_metrics on the hit matrix.
+    result = {'precision': np.zeros(len(Ks)), 'recall': np.zeros(len(Ks)), 'ndcg': np.zeros(len(Ks)),
+              'hit_ratio': np.zeros(len(Ks)), 'auc': 0.}
+
+    test_keys, n_pos_all, n_pos_unique_all = get_test_keys()
+    train_csr = data_generator.R.tocsr()
+    K_max = max(Ks)
+    k = min(K_max, ITEM_NUM)
+
+    test_users = np.asarray(users_to_test, dtype=np.int64)
+    n_test_users = len(test_users)
+    u_batch_size = BATCH_SIZE * 2
+
+    for start in range(0, n_test_users, u_batch_size):
+        user_batch = test_users[start: start + u_batch_size]
+        rate_batch = rating_batch(model, user_batch, drop_flag, batch_test_flag).float()
+
+        train = train_csr[user_batch]
+        rows = np.repeat(np.arange(len(user_batch)), np.diff(train.indptr))
+        rate_batch[torch.from_numpy(rows), torch.from_numpy(train.indices.astype(np.int64))] = -np.inf
+        n_candidates = ITEM_NUM - np.diff(train.indptr)
+
+        scores, top = torch.topk(rate_batch, k, dim=1)
+        top = top.numpy().astype(np.int64)
+        keys = user_batch[:, None] * ITEM_NUM + top
+        pos = np.minimum(np.searchsorted(test_keys, keys), len(test_keys) - 1)
+        hits = (test_keys[pos] == keys) & np.isfinite(scores.numpy())
+        hits = np.pad(hits, ((0, 0), (0, K_max - k)))
+
+        batch_result = metrics.batch_metrics(hits, Ks, n_pos_all[user_batch], n_pos_unique_all[user_batch],
+                                             n_candidates)
+        for key in ['precision', 'recall', 'ndcg', 'hit_ratio']:
+            result[key] += batch_result[key].sum(axis=0) / n_test_users
+
+    return result
@@ -0,0 +1,56 @@
+'''
+Export of trained NGCF embeddings to the serving store read by db_utils/embedding_store.py.
+
+Layout of <path>.bin: little-endian float32, the user matrix (n_users x dim) followed by
+the item matrix (n_items x dim), both row-major. <path>.json holds the shapes, the byte
+offsets and the id of every row.
+'''
+import json
+import os
+
+import numpy as np
+
+
+def export_embeddings(path, user_embeddings, item_embeddings, user_ids=None, item_ids=None):
+    user_embeddings = np.ascontiguousarray(user_embeddings, dtype='<f4')
+    item_embeddings = np.ascontiguousarray(item_embeddings, dtype='<f4')
+    assert user_embeddings.shape[1] == item_embeddings.shape[1]
+
+    if user_ids is None:
+        user_ids = range(user_embeddings.shape[0])
+    if item_ids is None:
+        item_ids = range(item_embeddings.shape[0])
+
+    meta = {
+        'dtype': 'float32',
+        'dim': int(user_embeddings.shape[1]),
+        'n_users': int(user_embeddings.shape[0]),
+        'n_items': int(item_embeddings.shape[0]),
+        'user_offset': 0,
+        'item_offset': int(user_embeddings.nbytes),
+        'user_ids': [int(i) for i in user_ids],
+        'item_ids': [int(i) for i in item_ids],
+    }
+
+    d = os.path.dirname(path)
+    if d and not os.path.exists(d):
+        os.makedirs(d)
+
+    # write to temporary files and rename, so readers never map a half-written store.
+    with open(path + '.bin.tmp', 'wb') as f:
+        f.write(user_embeddings.tobytes())
+        f.write(item_embeddings.tobytes())
+    with open(path + '.json.tmp', 'w') as f:
+        json.dump(meta, f)
+    os.replace(path + '.bin.tmp', path + '.bin')
+    os.replace(path + '.json.tmp', path + '.json')
+    print('export embeddings to', path + '.bin', user_embeddings.shape, item_embeddings.shape)
+
+
+def load_embeddings(path):
+    with open(path + '.json') as f:
+        meta = json.load(f)
+    dim, n_users, n_items = meta['dim'], meta['n_users'], meta['n_items']
+    user_embeddings = np.memmap(path + '.bin', dtype='<f4', mode='r', offset=meta['user_offset'], shape=(n_users, dim))
+    item_embeddings = np.memmap(path + '.bin', dtype='<f4', mode='r', offset=meta['item_offset'], shape=(n_items, dim))
+    return user_embeddings, item_embeddings, meta
@@ -5,11 +5,91 @@ Wang Xiang et al. Neural Graph Collaborative Filtering. In SIGIR 2019.
 
 @author: Xiang Wang (xiangwang@u.nus.edu)
 '''
+import hashlib
 import numpy as np
+from array import array
 import random as rd
 import scipy.sparse as sp
 from time import time
 
+def read_interactions(file):
+    # "uid item item ..." (space separated) or "uid\titem,item,..." (convert_ratings_to_train_format.py).
+    # returns the uid of every line, the number of items on it and all items, in file order.
+    uids, lengths, indices = array('i'), array('i'), array('i')
+    with open(file) as f:
+        for l in f:
+            values = l.replace(',', ' ').split()
+            if not values:
+                continue
+            try:
+                uid = int(values[0])
+                items = [int(i) for i in values[1:]]
+            except ValueError:
+                # malformed line: skip it whole, nothing of it reaches the CSR arrays.
+                continue
+            uids.append(uid)
+            lengths.append(len(items))
+            indices.extend(items)
+    return (np.frombuffer(uids, dtype=np.int32), np.frombuffer(lengths, dtype=np.int32),
+            np.frombuffer(indices, dtype=np.int32))
+
+
+class UserItems(object):
+    # per-user item lists as int32 CSR arrays (indptr, indices) indexed by uid; items[uid] is a view.
+    # supports the dict operations used on train_items/test_set: [], get, in, keys, items, len.
+    def __init__(self, n_users, uids, lengths, indices):
+        offsets = np.zeros(len(uids) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+
+        if np.any(np.diff(uids) <= 0):
+            # users out of order or repeated: keep the last line of every user, ordered by uid.
+            uids, last = np.unique(uids[::-1], return_index=True)
+            last = len(lengths) - 1 - last
+            starts, lengths = offsets[last], lengths[last]
+            new_offsets = np.zeros(len(uids) + 1, dtype=np.int64)
+            np.cumsum(lengths, out=new_offsets[1:])
+            indices = indices[np.arange(new_offsets[-1]) - np.repeat(new_offsets[:-1] - starts, lengths)]
+
+        self.users = uids
+        self.present = np.zeros(n_users, dtype=bool)
+        self.present[uids] = True
+
+        counts = np.zeros(n_users, dtype=np.int32)
+        counts[uids] = lengths
+        self.indptr = np.zeros(n_users + 1, dtype=np.int32)
+        np.cumsum(counts, out=self.indptr[1:])
+        self.indices = indices
+
+    def __getitem__(self, uid):
+        if not (0 <= uid < len(self.present) and self.present[uid]):
+            raise KeyError(uid)
+        return self.indices[self.indptr[uid]:self.indptr[uid + 1]]
+
+    def get(self, uid, default=None):
+        try:
+            return self[uid]
+        except KeyError:
+            return default
+
+    def __contains__(self, uid):
+        return 0 <= uid < len(self.present) and bool(self.present[uid])
+
+    def __len__(self):
+        return len(self.users)
+
+    def __iter__(self):
+        return iter(self.keys())
+
+    def keys(self):
+        return self.users.tolist()
+
+    def values(self):
+        return [self[uid] for uid in self.keys()]
+
+    def items(self):
+        return [(uid, self[uid]) for uid in self.keys()]
+
+
 class Data(object):
     def __init__(self, path, batch_size):
         self.path = path
@@ -23,103 +103,78 @@ class Data(object):
         self.n_train, self.n_test = 0, 0
         self.neg_pools = {}
 
-        self.exist_users = []
-
-        with open(train_file) as f:
-            for l in f.readlines():
-                if len(l) > 0:
-                    l = l.strip('\n').split(' ')
-                    items = [int(i) for i in l[1:]]
-                    uid = int(l[0])
-                    self.exist_users.append(uid)
-                    self.n_items = max(self.n_items, max(items))
-                    self.n_users = max(self.n_users, uid)
-                    self.n_train += len(items)
-
-        with open(test_file) as f:
-            for l in f.readlines():
-                if len(l) > 0:
-                    l = l.strip('\n')
-                    try:
-                        items = [int(i) for i in l.split(' ')[1:]]
-                    except Exception:
-                        continue
-                    self.n_items = max(self.n_items, max(items))
-                    self.n_test += len(items)
-        self.n_items += 1
-        self.n_users += 1
+        # one streaming pass over each file; items are kept as int32 CSR arrays.
+        train_uids, train_lengths, train_indices = read_interactions(train_file)
+        test_uids, test_lengths, test_indices = read_interactions(test_file)
 
-        self.print_statistics()
-
-        self.R = sp.dok_matrix((self.n_users, self.n_items), dtype=np.float32)
+        self.exist_users = train_uids.tolist()
+        self.n_train, self.n_test = len(train_indices), len(test_indices)
+        # python ints: n_users * n_items overflows int32 at large scale.
+        self.n_users = int(max(train_uids.max(initial=-1), test_uids.max(initial=-1))) + 1
+        self.n_items = int(max(train_indices.max(initial=-1), test_indices.max(initial=-1))) + 1
 
-        self.train_items, self.test_set = {}, {}
-        with open(train_file) as f_train:
-            with open(test_file) as f_test:
-                for l in f_train.readlines():
-                    if len(l) == 0:
-                        break
-                    l = l.strip('\n')
-                    items = [int(i) for i in l.split(' ')]
-                    uid, train_items = items[0], items[1:]
-
-                    for i in train_items:
-                        self.R[uid, i] = 1.
-                        # self.R[uid][i] = 1
+        self.print_statistics()
 
-                    self.train_items[uid] = train_items
+        self.train_items = UserItems(self.n_users, train_uids, train_lengths, train_indices)
+        self.test_set = UserItems(self.n_users, test_uids, test_lengths, test_indices)
 
-                for l in f_test.readlines():
-                    if len(l) == 0: break
-                    l = l.strip('\n')
-                    try:
-                        items = [int(i) for i in l.split(' ')]
-                    except Exception:
-                        continue
+        # build R in bulk from the CSR arrays; repeated interactions count once.
+        self.R = sp.csr_matrix((np.ones(len(self.train_items.indices), dtype=np.float32),
+                                self.train_items.indices, self.train_items.indptr),
+                               shape=(self.n_users, self.n_items), copy=True)
+        self.R.sum_duplicates()
+        self.R.data[:] = 1.
 
-                    uid, test_items = items[0], items[1:]
-                    self.test_set[uid] = test_items
+    def train_file_hash(self):
+        # the adjacency cache is keyed by the content of train.txt (and the matrix shape), so it can't go stale.
+        h = hashlib.sha1(('%d,%d;' % (self.n_users, self.n_items)).encode())
+        with open(self.path + '/train.txt', 'rb') as f:
+            for chunk in iter(lambda: f.read(1 << 20), b''):
+                h.update(chunk)
+        return h.hexdigest()[:16]
 
     def get_adj_mat(self):
+        key = self.train_file_hash()
+        adj_file, norm_adj_file, mean_adj_file = [self.path + '/s_%s_%s.npz' % (name, key)
+                                                  for name in ['adj_mat', 'norm_adj_mat', 'mean_adj_mat']]
         try:
             t1 = time()
-            adj_mat = sp.load_npz(self.path + '/s_adj_mat.npz')
-            norm_adj_mat = sp.load_npz(self.path + '/s_norm_adj_mat.npz')
-            mean_adj_mat = sp.load_npz(self.path + '/s_mean_adj_mat.npz')
+            adj_mat = sp.load_npz(adj_file)
+            norm_adj_mat = sp.load_npz(norm_adj_file)
+            mean_adj_mat = sp.load_npz(mean_adj_file)
             print('already load adj matrix', adj_mat.shape, time() - t1)
 
         except Exception:
             adj_mat, norm_adj_mat, mean_adj_mat = self.create_adj_mat()
-            sp.save_npz(self.path + '/s_adj_mat.npz', adj_mat)
-            sp.save_npz(self.path + '/s_norm_adj_mat.npz', norm_adj_mat)
-            sp.save_npz(self.path + '/s_mean_adj_mat.npz', mean_adj_mat)
+            sp.save_npz(adj_file, adj_mat)
+            sp.save_npz(norm_adj_file, norm_adj_mat)
+            sp.save_npz(mean_adj_file, mean_adj_mat)
         return adj_mat, norm_adj_mat, mean_adj_mat
 
     def create_adj_mat(self):
         t1 = time()
-        adj_mat = sp.dok_matrix((self.n_users + self.n_items, self.n_users + self.n_items), dtype=np.float32)
-        adj_mat = adj_mat.tolil()
-        R = self.R.tolil()
-
-        adj_mat[:self.n_users, self.n_users:] = R
-        adj_mat[self.n_users:, :self.n_users] = R.T
-        adj_mat = adj_mat.todok()
+        # [[0, R], [R^T, 0]] straight from the COO indices of R.
+        R = self.R.tocoo()
+        n_nodes = self.n_users + self.n_items
+        rows = np.concatenate([R.row, R.col + self.n_users])
+        cols = np.concatenate([R.col + self.n_users, R.row])
+        adj_mat = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(n_nodes, n_nodes))
         print('already create adjacency matrix', adj_mat.shape, time() - t1)
 
         t2 = time()
 
         def mean_adj_single(adj):
-            # D^-1 * A
-            rowsum = np.array(adj.sum(1))
+            # D^-1 * A, scaling the CSR values row by row with the degree vector.
+            adj = sp.csr_matrix(adj, dtype=np.float32)
+            rowsum = np.asarray(adj.sum(1)).flatten()
 
-            d_inv = np.power(rowsum, -1).flatten()
-            d_inv[np.isinf(d_inv)] = 0.
-            d_mat_inv = sp.diags(d_inv)
+            d_inv = np.zeros_like(rowsum)
+            np.divide(1., rowsum, out=d_inv, where=rowsum != 0)
 
-            norm_adj = d_mat_inv.dot(adj)
-            # norm_adj = adj.dot(d_mat_inv)
+            norm_adj = adj.copy()
+            norm_adj.data *= np.repeat(d_inv, np.diff(adj.indptr))
             print('generate single-normalized adjacency matrix.')
-            return norm_adj.tocoo()
+            return norm_adj
 
         def normalized_adj_single(adj):
             # D^-1/2 * A * D^-1/2
@@ -141,12 +196,12 @@ class Data(object):
             print('check normalized adjacency matrix whether equal to this laplacian matrix.')
             return temp
 
-        norm_adj_mat = mean_adj_single(adj_mat + sp.eye(adj_mat.shape[0]))
+        norm_adj_mat = mean_adj_single(adj_mat + sp.eye(adj_mat.shape[0], dtype=np.float32, format='csr'))
         # norm_adj_mat = normalized_adj_single(adj_mat + sp.eye(adj_mat.shape[0]))
         mean_adj_mat = mean_adj_single(adj_mat)
 
         print('already normalize adjacency matrix', time() - t2)
-        return adj_mat.tocsr(), norm_adj_mat.tocsr(), mean_adj_mat.tocsr()
+        return adj_mat, norm_adj_mat, mean_adj_mat
 
     def negative_pool(self):
         t1 = time()
@@ -199,6 +254,45 @@ class Data(object):
 
         return users, pos_items, neg_items
 
+    def init_sampler(self):
+        # CSR view of R and its sorted (uid * n_items + iid) keys for vectorized membership tests.
+        self.R_csr = self.R.tocsr()
+        self.R_csr.sort_indices()
+        self.R_keys = np.repeat(np.arange(self.n_users, dtype=np.int64), np.diff(self.R_csr.indptr)) * self.n_items \
+                      + self.R_csr.indices
+        self.exist_users_array = np.array(self.exist_users, dtype=np.int64)
+        self.exist_users_array = self.exist_users_array[np.diff(self.R_csr.indptr)[self.exist_users_array] > 0]
+
+    def is_train_item(self, users, items):
+        keys = users * self.n_items + items
+        pos = np.minimum(np.searchsorted(self.R_keys, keys), len(self.R_keys) - 1)
+        return self.R_keys[pos] == keys
+
+    def sample_vectorized(self, rng=np.random):
+        # same distribution as sample() with users drawn with replacement, one positive and one negative per user;
+        # colliding negatives are redrawn in bulk until none is a training item.
+        if not hasattr(self, 'R_keys'):
+            self.init_sampler()
+
+        users = self.exist_users_array[rng.randint(0, len(self.exist_users_array), size=self.batch_size)]
+
+        indptr, indices = self.R_csr.indptr, self.R_csr.indices
+        n_pos = indptr[users + 1] - indptr[users]
+        pos_items = indices[indptr[users] + (rng.random_sample(self.batch_size) * n_pos).astype(np.int64)]
+
+        return users, pos_items.astype(np.int64), self.sample_negatives(users, rng)
+
+    def sample_negatives(self, users, rng=np.random):
+        if not hasattr(self, 'R_keys'):
+            self.init_sampler()
+
+        neg_items = rng.randint(0, self.n_items, size=len(users)).astype(np.int64)
+        collide = np.flatnonzero(self.is_train_item(users, neg_items))
+        while len(collide) > 0:
+            neg_items[collide] = rng.randint(0, self.n_items, size=len(collide))
+            collide = collide[self.is_train_item(users[collide], neg_items[collide])]
+        return neg_items
+
     def get_num_users_items(self):
         return self.n_users, self.n_items
 
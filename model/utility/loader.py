@@ -0,0 +1,94 @@
+'''
+Background prefetching of BPR training batches from load_data.Data.
+'''
+import queue
+import threading
+
+import numpy as np
+import torch
+
+
+class BatchLoader(object):
+    '''
+    Produces the batches of an epoch in worker threads into bounded queues.
+
+    mode='sample': every batch draws its users with replacement, as Data.sample_vectorized does.
+    mode='epoch':  the training interactions are shuffled and each one is used exactly once per epoch.
+
+    Batch b of epoch e is built from its own RandomState seeded with (seed, e, b) and worker threads
+    hand batches back in order, so the sequence of batches only depends on the seed.
+    '''
+    def __init__(self, data, seed=0, mode='sample', num_workers=1, prefetch=4, pin_memory=False):
+        assert mode in ['sample', 'epoch']
+        self.data = data
+        self.seed = seed
+        self.mode = mode
+        self.num_workers = num_workers
+        self.prefetch = prefetch
+        self.pin_memory = pin_memory
+
+        data.init_sampler()
+        # (uid, iid) of every training interaction, in CSR order.
+        self.train_users = np.repeat(np.arange(data.n_users, dtype=np.int64), np.diff(data.R_csr.indptr))
+        self.train_pos_items = data.R_csr.indices.astype(np.int64)
+
+        if mode == 'epoch':
+            self.n_batch = (len(self.train_users) + data.batch_size - 1) // data.batch_size
+        else:
+            self.n_batch = data.n_train // data.batch_size + 1
+
+    def make_batch(self, epoch, batch_id, order=None):
+        rng = np.random.RandomState([self.seed, epoch, batch_id])
+        if order is None:
+            users, pos_items, neg_items = self.data.sample_vectorized(rng)
+        else:
+            idx = order[batch_id * self.data.batch_size: (batch_id + 1) * self.data.batch_size]
+            users, pos_items = self.train_users[idx], self.train_pos_items[idx]
+            neg_items = self.data.sample_negatives(users, rng)
+
+        batch = [torch.from_numpy(x) for x in (users, pos_items, neg_items)]
+        if self.pin_memory:
+            batch = [x.pin_memory() for x in batch]
+        return batch
+
+    def epoch(self, epoch):
+        order = None
+        if self.mode == 'epoch':
+            order = np.random.RandomState([self.seed, epoch]).permutation(len(self.train_users))
+
+        if self.num_workers <= 0:
+            for batch_id in range(self.n_batch):
+                yield self.make_batch(epoch, batch_id, order)
+            return
+
+        stop = threading.Event()
+        queues = [queue.Queue(maxsize=self.prefetch) for _ in range(self.num_workers)]
+
+        def work(worker_id):
+            for batch_id in range(worker_id, self.n_batch, self.num_workers):
+                try:
+                    item = self.make_batch(epoch, batch_id, order)
+                except Exception as e:
+                    item = e
+                while not stop.is_set():
+                    try:
+                        queues[worker_id].put(item, timeout=0.1)
+                        break
+                    except queue.Full:
+                        continue
+                if stop.is_set() or isinstance(item, Exception):
+                    return
+
+        workers = [threading.Thread(target=work, args=(i,), daemon=True) for i in range(self.num_workers)]
+        for w in workers:
+            w.start()
+        try:
+            for batch_id in range(self.n_batch):
+                item = queues[batch_id % self.num_workers].get()
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            stop.set()
+            for w in workers:
+                w.join()
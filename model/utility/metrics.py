@@ -32,13 +32,14 @@ def average_precision(r,cut):
     return np.sum(out)/float(min(cut, np.sum(r)))
 
 
-def mean_average_precision(rs):
+def mean_average_precision(rs, cut=None):
     """Score is mean average precision
     Relevance is binary (nonzero is relevant).
+    cut defaults to the length of each r.
     Returns:
         Mean average precision
     """
-    return np.mean([average_precision(r) for r in rs])
+    return np.mean([average_precision(r, len(r) if cut is None else cut) for r in rs])
 
 
 def dcg_at_k(r, k, method=1):
@@ -48,7 +49,7 @@ def dcg_at_k(r, k, method=1):
     Returns:
         Discounted cumulative gain
     """
-    r = np.asfarray(r)[:k]
+    r = np.asarray(r, dtype=float)[:k]
     if r.size:
         if method == 0:
             return r[0] + np.sum(r[1:] / np.log2(np.arange(2, r.size + 1)))
@@ -82,7 +83,7 @@ def ndcg_at_k(r, k, ground_truth, method=1):
 def recall_at_k(r, k, all_pos_num):
     # if all_pos_num == 0:
     #     return 0
-    r = np.asfarray(r)[:k]
+    r = np.asarray(r, dtype=float)[:k]
     return np.sum(r) / all_pos_num
 
 
@@ -104,4 +105,81 @@ def AUC(ground_truth, prediction):
         res = roc_auc_score(y_true=ground_truth, y_score=prediction)
     except Exception:
         res = 0.
-    return res
\ No newline at end of file
+    return res
+
+
+# ----------------------------------------------------------------------------------------------------
+# Batch versions: hits is a (n_users, K_max) binary matrix of the ranked top-K_max items of every user,
+# Ks the cut-offs; every function returns a (n_users, len(Ks)) array.
+
+_discounts = {}
+
+
+def discount_table(K_max):
+    """1 / log2(rank + 1) for rank 1..K_max and its cumulative sum (ideal DCG), cached per K_max.
+    """
+    if K_max not in _discounts:
+        discount = 1. / np.log2(np.arange(2, K_max + 2))
+        _discounts[K_max] = discount, np.concatenate([[0.], np.cumsum(discount)])
+    return _discounts[K_max]
+
+
+def _at(cumulative, Ks):
+    return cumulative[:, np.asarray(Ks) - 1]
+
+
+def precision_at_k_batch(hits, Ks, n_candidates=None):
+    """precision_at_k for all users and Ks; n_candidates (per user) caps K like a shorter r does.
+    """
+    Ks = np.asarray(Ks)
+    denominator = Ks[None, :] if n_candidates is None else np.minimum(Ks[None, :], np.asarray(n_candidates)[:, None])
+    return _at(np.cumsum(hits, axis=1), Ks) / denominator
+
+
+def recall_at_k_batch(hits, Ks, n_pos):
+    """recall_at_k for all users and Ks; users without positives get 0.
+    """
+    n_pos = np.asarray(n_pos, dtype=np.float64)[:, None]
+    hit_count = _at(np.cumsum(hits, axis=1), Ks).astype(np.float64)
+    return np.divide(hit_count, n_pos, out=np.zeros_like(hit_count), where=n_pos > 0)
+
+
+def ndcg_at_k_batch(hits, Ks, n_pos_unique):
+    """ndcg_at_k (method=1) for all users and Ks; n_pos_unique is len(set(ground_truth)) per user.
+    """
+    discount, idcg = discount_table(hits.shape[1])
+    dcg = _at(np.cumsum(hits * discount, axis=1), Ks)
+    ideal = idcg[np.minimum(np.asarray(n_pos_unique)[:, None], np.asarray(Ks)[None, :])]
+    return np.divide(dcg, ideal, out=np.zeros_like(dcg), where=ideal > 0)
+
+
+def hit_at_k_batch(hits, Ks):
+    """hit_at_k for all users and Ks.
+    """
+    return (_at(np.cumsum(hits, axis=1), Ks) > 0).astype(np.float64)
+
+
+def average_precision_batch(hits, Ks):
+    """average_precision(r, cut=K) for all users and Ks.
+    """
+    hit_count = np.cumsum(hits, axis=1)
+    precision = hit_count / np.arange(1, hits.shape[1] + 1)
+    numerator = _at(np.cumsum(precision * hits, axis=1), Ks)
+    denominator = np.minimum(np.asarray(Ks)[None, :], hit_count[:, -1:])
+    return np.divide(numerator, denominator, out=np.zeros_like(numerator), where=denominator > 0)
+
+
+def batch_metrics(hits, Ks, n_pos, n_pos_unique=None, n_candidates=None):
+    """All ranking metrics for all users and Ks in one call.
+    Returns:
+        dict of (n_users, len(Ks)) arrays: precision, recall, ndcg, hit_ratio, map
+    """
+    hits = np.asarray(hits, dtype=np.float64)
+    if n_pos_unique is None:
+        n_pos_unique = n_pos
+    return {'precision': precision_at_k_batch(hits, Ks, n_candidates),
+            'recall': recall_at_k_batch(hits, Ks, n_pos),
+            'ndcg': ndcg_at_k_batch(hits, Ks, n_pos_unique),
+            'hit_ratio': hit_at_k_batch(hits, Ks),
+            'map': average_precision_batch(hits, Ks)}
+
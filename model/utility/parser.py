@@ -43,6 +43,23 @@ def parse_args():
                         help='Specify the type of the adjacency (laplacian) matrix from {plain, norm, mean}.')
 
     parser.add_argument('--gpu_id', type=int, default=6)
+    parser.add_argument('--device', nargs='?', default='auto',
+                        help='Specify the device from {auto, cpu, cuda}. auto: use --gpu_id if CUDA is available, otherwise CPU.')
+    parser.add_argument('--num_threads', type=int, default=0,
+                        help='Number of intra-op threads on CPU. 0: keep the PyTorch default.')
+    parser.add_argument('--sparse_layout', nargs='?', default='auto',
+                        help='Specify the layout of the sparse adjacency from {auto, coo, csr}. auto: csr on CPU, coo on GPU.')
+    parser.add_argument('--benchmark', type=int, default=0,
+                        help='0: Disable benchmark mode, 1: Report training samples/sec per epoch and skip evaluation.')
+
+    parser.add_argument('--seed', type=int, default=2019,
+                        help='Random seed of the training batches.')
+    parser.add_argument('--sampling', nargs='?', default='sample',
+                        help='Specify the batch sampling from {sample, epoch}. sample: users with replacement, epoch: every training interaction once per epoch.')
+    parser.add_argument('--num_workers', type=int, default=1,
+                        help='Number of background threads building batches. 0: build batches in the training loop.')
+    parser.add_argument('--prefetch', type=int, default=4,
+                        help='Number of batches each worker prepares ahead.')
 
     parser.add_argument('--node_dropout_flag', type=int, default=1,
                         help='0: Disable node dropout, 1: Activate node dropout')
@@ -57,6 +74,14 @@ def parse_args():
     parser.add_argument('--save_flag', type=int, default=0,
                         help='0: Disable model saver, 1: Activate model saver')
 
+    parser.add_argument('--export_path', nargs='?', default='',
+                        help='Path prefix of the embedding serving store (<path>.bin + <path>.json). Empty: disable export.')
+
+    parser.add_argument('--ann_lists', type=int, default=0,
+                        help='Number of IVF lists for evaluate_ann.py. 0: sqrt(#items).')
+    parser.add_argument('--ann_probes', nargs='?', default='[1, 2, 4, 8, 16]',
+                        help='Numbers of probed IVF lists to evaluate in evaluate_ann.py.')
+
     parser.add_argument('--test_flag', nargs='?', default='part',
                         help='Specify the test type from {part, full}, indicating whether the reference is done in mini-batch')
 
@@ -0,0 +1,60 @@
+import csv
+import os
+import sys
+
+import pytest
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, REPO_ROOT)
+
+
+class FakeResult:
+    def __init__(self, records):
+        self.records = records
+
+    def data(self):
+        return list(self.records)
+
+    def __iter__(self):
+        return iter(self.records)
+
+
+class FakeRatingGraph:
+    """Answers the Cypher queries of RecommendationEngine from an in-memory list of RATED edges."""
+
+    def __init__(self, ratings, spots=None):
+        self.ratings = list(ratings)
+        self.spots = spots if spots is not None else {spot_id: {'id': spot_id} for spot_id in range(1, 201)}
+        self.rating_loads = 0
+
+    def add(self, user_id, spot_id, grading):
+        self.ratings.append({'user_id': user_id, 'parking_spot_id': spot_id, 'rating': grading})
+
+    def run(self, query, **parameters):
+        if 'count(r)' in query:
+            return FakeResult([{'n': len(self.ratings)}])
+        if 'LIMIT 1' in query:
+            return FakeResult([{'latest': len(self.ratings)}] if self.ratings else [])
+        if 'RATED' in query:
+            self.rating_loads += 1
+            return FakeResult(self.ratings)
+        if 'spot_id' in parameters:
+            return FakeResult([self.spots.get(parameters['spot_id'], {'id': parameters['spot_id']})])
+        return FakeResult(list(self.spots.values()))
+
+
+def load_original_ratings():
+    with open(os.path.join(REPO_ROOT, 'data', 'original_ratings.csv'), encoding='utf-8') as f:
+        return [{'user_id': int(row['用户ID']), 'parking_spot_id': int(row['停车位ID']), 'rating': float(row['评分'])}
+                for row in csv.DictReader(f)]
+
+
+def load_spot_coordinates():
+    with open(os.path.join(REPO_ROOT, 'data', 'parking_spots_with_coords.csv'), encoding='utf-8') as f:
+        return {int(row['ID']): {'id': int(row['ID']), 'longitude': float(row['Longitude']),
+                                 'latitude': float(row['Latitude'])} for row in csv.DictReader(f)}
+
+
+@pytest.fixture
+def rating_graph():
+    return FakeRatingGraph(load_original_ratings())
@@ -0,0 +1,66 @@
+import importlib
+import os
+import sys
+
+import numpy as np
+import pytest
+import torch
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model', 'utility'))
+
+KS = [1, 5, 10, 20]
+
+
+class FixedScoreModel(object):
+    # stands in for NGCF: every (user, item) score is fixed and distinct, so the top-K lists have no ties.
+    def __init__(self, n_users, n_items, seed=0):
+        self.scores = torch.from_numpy(np.random.RandomState(seed).permutation(n_users * n_items)
+                                       .reshape(n_users, n_items).astype(np.float32))
+
+    def inference_rating(self, users, items=None):
+        rating = self.scores[torch.as_tensor(np.asarray(users, dtype=np.int64))]
+        return rating if items is None else rating[:, list(items)]
+
+
+@pytest.fixture(scope='module')
+def batch_test(tmp_path_factory):
+    root = tmp_path_factory.mktemp('Data')
+    (root / 'park').mkdir()
+    rng = np.random.RandomState(0)
+    with open(root / 'park' / 'train.txt', 'w') as train, open(root / 'park' / 'test.txt', 'w') as test:
+        for uid in range(60):
+            items = rng.choice(50, size=rng.randint(3, 15), replace=False)
+            n_test = rng.randint(1, 3)
+            train.write('%d %s\n' % (uid, ' '.join(map(str, items[n_test:]))))
+            test.write('%d %s\n' % (uid, ' '.join(map(str, items[:n_test]))))
+
+    argv = sys.argv
+    sys.argv = ['batch_test', '--data_path', str(root) + '/', '--dataset', 'park', '--batch_size', '8',
+                '--Ks', str(KS), '--test_flag', 'part']
+    try:
+        sys.modules.pop('batch_test', None)
+        yield importlib.import_module('batch_test')
+    finally:
+        sys.argv = argv
+
+
+def test_vectorized_matches_per_user_test(batch_test):
+    model = FixedScoreModel(batch_test.USR_NUM, batch_test.ITEM_NUM)
+    users = list(batch_test.data_generator.test_set.keys())
+
+    expected = batch_test.test(model, users)
+    actual = batch_test.test_vectorized(model, users)
+
+    assert expected['recall'][-1] > 0
+    for key in ['precision', 'recall', 'ndcg', 'hit_ratio']:
+        np.testing.assert_allclose(actual[key], expected[key], rtol=0, atol=1e-9, err_msg=key)
+
+
+def test_vectorized_excludes_training_items(batch_test):
+    # a model that scores training items highest must not get credit for them
+    model = FixedScoreModel(batch_test.USR_NUM, batch_test.ITEM_NUM)
+    model.scores += torch.from_numpy(batch_test.data_generator.R.toarray()) * 1e6
+    users = list(batch_test.data_generator.test_set.keys())
+
+    np.testing.assert_allclose(batch_test.test_vectorized(model, users)['recall'],
+                               batch_test.test(model, users)['recall'], rtol=0, atol=1e-9)
@@ -0,0 +1,128 @@
+import pytest
+
+import db_utils.cache as cache_module
+from db_utils.cache import SharedCache, TTLCache, VersionedResultCache
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+
+class FakeClient:
+    def __init__(self):
+        self.data = {}
+
+    def get(self, key):
+        return self.data.get(key)
+
+    def set(self, key, value, ex=None):
+        self.data[key] = value
+
+    def delete(self, key):
+        self.data.pop(key, None)
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(cache_module, 'time', clock)
+    return clock
+
+
+def test_ttl_cache_expires_entries(clock):
+    cache = TTLCache(ttl=10)
+    cache.set('a', 1)
+    clock.now += 9
+    assert cache.get('a') == 1
+    clock.now += 2
+    assert cache.get('a') is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_ttl_cache_evicts_least_recently_used(clock):
+    cache = TTLCache(max_size=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert cache.get('b') is None
+    assert (cache.get('a'), cache.get('c')) == (1, 3)
+    assert cache.stats()['evictions'] == 1
+
+
+def test_ttl_cache_delete_invalidates(clock):
+    cache = TTLCache()
+    cache.set('a', 1)
+    cache.delete('a')
+    assert cache.get('a') is None
+
+
+def test_shared_cache_round_trips_json():
+    client = FakeClient()
+    cache = SharedCache(client, prefix='p:')
+    cache.set('spot:1', {'id': 1, 'fee': 3.5})
+    assert cache.get('spot:1') == {'id': 1, 'fee': 3.5}
+    cache.delete('spot:1')
+    assert cache.get('spot:1') is None
+    assert cache.stats() == {'hits': 1, 'misses': 1}
+
+
+def versioned(version, value, calls):
+    def compute():
+        calls.append(value)
+        return version, value
+    return compute
+
+
+def wait_for_refreshes(cache):
+    # a single refresh worker runs jobs in order, so a no-op job finishes after every pending refresh
+    cache._executor.submit(lambda: None).result()
+
+
+def test_versioned_cache_hits_same_version(clock):
+    cache, calls = VersionedResultCache(refresh_workers=1), []
+    assert cache.get_or_compute('u', 1, versioned(1, 'old', calls)) == 'old'
+    assert cache.get_or_compute('u', 1, versioned(1, 'new', calls)) == 'old'
+    assert calls == ['old']
+    assert cache.stats()['hits'] == 1
+
+
+def test_versioned_cache_serves_stale_while_revalidating(clock):
+    cache, calls = VersionedResultCache(max_stale=30, refresh_workers=1), []
+    cache.get_or_compute('u', 1, versioned(1, 'old', calls))
+
+    assert cache.get_or_compute('u', 2, versioned(2, 'new', calls)) == 'old'
+    wait_for_refreshes(cache)
+    assert cache.get_or_compute('u', 2, versioned(2, 'newer', calls)) == 'new'
+    assert calls == ['old', 'new']
+    assert cache.stats()['stale_hits'] == 1
+    assert cache.stats()['refreshes'] == 1
+
+
+def test_versioned_cache_recomputes_after_max_stale(clock):
+    cache, calls = VersionedResultCache(max_stale=30, refresh_workers=1), []
+    cache.get_or_compute('u', 1, versioned(1, 'old', calls))
+    cache._data['u'] = ('old', 1, clock.now - 31)
+
+    assert cache.get_or_compute('u', 2, versioned(2, 'new', calls)) == 'new'
+    assert calls == ['old', 'new']
+
+
+def test_versioned_cache_stores_the_version_compute_used(clock):
+    cache, calls = VersionedResultCache(refresh_workers=1), []
+    # compute saw version 1 although version 2 was current when the lookup started: keep it marked stale
+    cache.get_or_compute('u', 2, versioned(1, 'old', calls))
+    assert cache.get_or_compute('u', 2, versioned(2, 'new', calls)) == 'old'
+    wait_for_refreshes(cache)
+    assert cache._data['u'][:2] == ('new', 2)
+
+
+def test_versioned_cache_keeps_newer_results(clock):
+    cache, calls = VersionedResultCache(refresh_workers=1), []
+    cache.get_or_compute('u', 3, versioned(3, 'newer', calls))
+    cache._store('u', 2, 'older')
+    assert cache.get_or_compute('u', 3, versioned(3, 'again', calls)) == 'newer'
@@ -0,0 +1,176 @@
+import gc
+import time
+
+import pytest
+from py2neo.cypher import Cursor
+
+import db_utils.connection_provider as connection_provider
+from db_utils.connection_provider import GraphConnectionProvider
+
+
+class FakeCursor(Cursor):
+    def __init__(self, records):
+        self._records = list(records)
+
+    def __next__(self):
+        if not self._records:
+            raise StopIteration
+        return self._records.pop(0)
+
+    def forward(self, amount=1):
+        moved = min(amount, len(self._records))
+        del self._records[:moved]
+        return moved
+
+    def data(self):
+        records, self._records = self._records, []
+        return records
+
+
+class FakeConnector:
+    profile = 'profile'
+
+    def __init__(self):
+        self.prunes = 0
+
+    def prune(self, profile):
+        self.prunes += 1
+
+    def close(self):
+        pass
+
+
+class FakeService:
+    def __init__(self):
+        self.connector = FakeConnector()
+
+
+class FakeGraph:
+    def __init__(self, *args, **kwargs):
+        self.service = FakeService()
+        self.name = 'neo4j'
+        self.queries = []
+        self.fail_liveness = 0
+        self.committed, self.rolled_back = [], []
+
+    def run(self, query, **parameters):
+        self.queries.append(query)
+        if query == 'RETURN 1' and self.fail_liveness:
+            self.fail_liveness -= 1
+            raise OSError('connection reset')
+        return FakeCursor([{'n': 1}, {'n': 2}, {'n': 3}])
+
+    def evaluate(self, query):
+        return 42
+
+    def begin(self):
+        return object()
+
+    def commit(self, tx):
+        self.committed.append(tx)
+
+    def rollback(self, tx):
+        self.rolled_back.append(tx)
+
+
+@pytest.fixture
+def make_provider(monkeypatch):
+    monkeypatch.setattr(connection_provider, 'Graph', FakeGraph)
+    providers = []
+
+    def make(**kwargs):
+        kwargs.setdefault('idle_timeout', None)
+        kwargs.setdefault('liveness_interval', None)
+        provider = GraphConnectionProvider('bolt://test', 'neo4j', 'password', **kwargs)
+        providers.append(provider)
+        return provider
+
+    yield make
+    for provider in providers:
+        provider.close()
+
+
+def test_acquire_releases_the_slot(make_provider):
+    provider = make_provider(max_size=1)
+    with provider.acquire() as graph:
+        assert isinstance(graph, FakeGraph)
+        assert provider.metrics()['in_use'] == 1
+    assert provider.metrics()['in_use'] == 0
+    assert provider.metrics()['acquisitions'] == 1
+
+
+def test_acquire_times_out_when_the_pool_is_exhausted(make_provider):
+    provider = make_provider(max_size=1, acquire_timeout=0.01)
+    with provider.acquire():
+        with pytest.raises(ConnectionError):
+            provider.acquire_slot()
+    assert provider.metrics()['acquisition_failures'] == 1
+
+
+def test_liveness_failure_prunes_and_retries(make_provider):
+    provider = make_provider(liveness_interval=0)
+    provider._graph.fail_liveness = 1
+    time.sleep(0.001)
+    with provider.acquire():
+        pass
+    assert provider.metrics()['liveness_failures'] == 1
+    assert provider._graph.service.connector.prunes == 1
+    assert provider._graph.queries == ['RETURN 1', 'RETURN 1']
+
+
+def test_reaper_prunes_idle_connections(make_provider):
+    provider = make_provider(idle_timeout=0.02)
+    deadline = time.monotonic() + 2
+    while provider.metrics()['idle_evictions'] == 0 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert provider._graph.service.connector.prunes >= 1
+
+
+def test_transaction_commits_or_rolls_back(make_provider):
+    provider = make_provider()
+    with provider.transaction():
+        pass
+    with pytest.raises(ValueError):
+        with provider.transaction():
+            raise ValueError
+    assert len(provider._graph.committed) == 1
+    assert len(provider._graph.rolled_back) == 1
+    assert provider.metrics()['in_use'] == 0
+
+
+def test_pooled_graph_releases_after_plain_calls(make_provider):
+    provider = make_provider()
+    assert provider.graph.evaluate('RETURN 42') == 42
+    assert provider.graph.name == 'neo4j'
+    assert provider.metrics()['in_use'] == 0
+
+
+def test_pooled_cursor_holds_the_slot_until_exhausted(make_provider):
+    provider = make_provider()
+    cursor = provider.graph.run('MATCH (n) RETURN n')
+    assert provider.metrics()['in_use'] == 1
+    assert [record['n'] for record in cursor] == [1, 2, 3]
+    assert provider.metrics()['in_use'] == 0
+
+
+@pytest.mark.parametrize('consume', [
+    lambda cursor: cursor.data(),
+    lambda cursor: cursor.close(),
+    lambda cursor: cursor.forward(5),
+])
+def test_pooled_cursor_releases_once_consumed(make_provider, consume):
+    provider = make_provider()
+    cursor = provider.graph.run('MATCH (n) RETURN n')
+    consume(cursor)
+    cursor.close()
+    assert provider.metrics()['in_use'] == 0
+
+
+def test_abandoned_pooled_cursor_releases_when_collected(make_provider):
+    provider = make_provider(max_size=1, acquire_timeout=0.01)
+    for _ in provider.graph.run('MATCH (n) RETURN n'):
+        break
+    gc.collect()
+    assert provider.metrics()['in_use'] == 0
+    with provider.acquire():
+        pass
@@ -0,0 +1,162 @@
+from collections import defaultdict
+
+import pytest
+
+from db_utils.convert_ratings_to_train_format import (ChunkedLineWriter, ParkingDataConverter, is_test_interaction,
+                                                      load_watermark, parse_line, split_interactions)
+
+THRESHOLD = 3.5
+
+
+class FakeResult(list):
+    def data(self):
+        return list(self)
+
+
+class FakeExportGraph:
+    """Evaluates the converter's queries over in-memory (user, spot, grading, ingested_at) edges."""
+
+    def __init__(self, user_ids):
+        self.user_ids = sorted(user_ids)
+        self.edges = []
+        self.now = 1000
+
+    def rate(self, user_id, spot_id, grading):
+        self.now += 10
+        self.edges.append((user_id, spot_id, grading, self.now))
+
+    def run(self, query, **parameters):
+        if 'timestamp() AS now' in query:
+            return FakeResult([{'now': self.now}])
+        if 'u.id > $after' in query:
+            return FakeResult(self.user_page(parameters['after'], parameters['limit'], parameters['threshold']))
+        if 'r.ingested_at > $after' in query:
+            edges = sorted((edge for edge in self.edges if parameters['after'] < edge[3] <= parameters['upper']),
+                           key=lambda edge: edge[3])
+            return FakeResult({'user_id': user_id, 'parking_spot_id': spot_id, 'rating': grading}
+                              for user_id, spot_id, grading, _ in edges)
+        raise AssertionError(query)
+
+    def user_page(self, after, limit, threshold):
+        # latest edge per (user, spot) decides, like the ORDER BY ingested_at / collect(...)[-1] in the query
+        latest = {}
+        for user_id, spot_id, grading, ingested_at in sorted(self.edges, key=lambda edge: edge[3]):
+            latest[user_id, spot_id] = grading
+        page = [user_id for user_id in self.user_ids if user_id > after][:limit]
+        return [{'user_id': user_id,
+                 'parking_spot_ids': sorted(spot_id for (uid, spot_id), grading in latest.items()
+                                            if uid == user_id and grading >= threshold)}
+                for user_id in page]
+
+
+class FakeProvider:
+    def __init__(self, graph):
+        self.graph = graph
+
+
+def read_lines(path):
+    lines = {}
+    with open(path) as f:
+        for line in f:
+            user_id, spots = parse_line(line)
+            lines[user_id] = spots
+    return lines
+
+
+@pytest.fixture
+def graph():
+    graph = FakeExportGraph(range(1, 13))
+    for user_id in range(1, 11):
+        for spot_id in range(1, 9):
+            graph.rate(user_id, spot_id, 2.0 + (user_id * spot_id) % 4)
+    return graph
+
+
+def test_split_is_deterministic_and_keeps_a_training_item():
+    spots = list(range(100))
+    train, test = split_interactions(7, spots, 0.2, seed=2019)
+    assert split_interactions(7, spots[::-1], 0.2, seed=2019) == (train[::-1], test[::-1])
+    assert sorted(train + test) == spots
+    assert all(is_test_interaction(7, spot_id, 0.2, 2019) for spot_id in test)
+    assert 5 < len(test) < 40
+    assert split_interactions(7, [3], 1.0, seed=2019) == ([3], [])
+
+
+def test_iter_user_interactions_pages_over_users(graph):
+    converter = ParkingDataConverter(FakeProvider(graph), rating_threshold=THRESHOLD)
+    expected = {user_id: spots for user_id, spots in
+                ((page['user_id'], page['parking_spot_ids']) for page in graph.user_page(-1, 100, THRESHOLD))
+                if spots}
+
+    for chunk_size in (1, 3, 12, 50):
+        assert dict(converter.iter_user_interactions(chunk_size)) == expected
+
+
+def test_latest_rating_decides_in_full_export(graph):
+    converter = ParkingDataConverter(FakeProvider(graph), rating_threshold=THRESHOLD)
+    graph.rate(1, 1, 5.0)
+    graph.rate(1, 2, 5.0)
+    graph.rate(1, 2, 1.0)
+    spots = dict(converter.iter_user_interactions())[1]
+    assert spots.count(1) == 1
+    assert 2 not in spots
+
+
+def test_chunked_writer_keeps_the_old_file_on_failure(tmp_path):
+    path = str(tmp_path / 'train.txt')
+    with ChunkedLineWriter(path, chunk_size=1) as writer:
+        writer.write(1, [2, 3])
+    with pytest.raises(RuntimeError):
+        with ChunkedLineWriter(path, chunk_size=1) as writer:
+            writer.write(4, [5])
+            raise RuntimeError
+    assert read_lines(path) == {1: [2, 3]}
+    assert not (tmp_path / 'train.txt.tmp').exists()
+
+
+def test_delta_export_requires_a_watermark(graph, tmp_path):
+    converter = ParkingDataConverter(FakeProvider(graph), rating_threshold=THRESHOLD)
+    with pytest.raises(Exception):
+        converter.export_delta(str(tmp_path / 'train.txt'))
+
+
+def test_delta_export_matches_a_full_export(graph, tmp_path):
+    converter = ParkingDataConverter(FakeProvider(graph), rating_threshold=THRESHOLD)
+    train, test = str(tmp_path / 'train.txt'), str(tmp_path / 'test.txt')
+    converter.convert_and_save(train, test_file=test, lag_ms=0)
+    assert load_watermark(train + '.watermark.json') == graph.now
+
+    graph.rate(1, 9, 5.0)     # new positive
+    graph.rate(2, 1, 1.0)     # re-rated below the threshold
+    graph.rate(11, 3, 4.0)    # new user
+    graph.rate(12, 4, 2.0)    # new user with only a negative rating
+    graph.now += 1000
+    assert converter.export_delta(train, test_file=test, lag_ms=0) == 4
+    assert load_watermark(train + '.watermark.json') == graph.now
+    assert converter.export_delta(train, test_file=test, lag_ms=0) == 0
+
+    fresh_train, fresh_test = str(tmp_path / 'fresh_train.txt'), str(tmp_path / 'fresh_test.txt')
+    converter.convert_and_save(fresh_train, test_file=fresh_test, lag_ms=0)
+
+    merged, fresh = defaultdict(set), defaultdict(set)
+    for path, target in ((train, merged), (test, merged), (fresh_train, fresh), (fresh_test, fresh)):
+        for user_id, spots in read_lines(path).items():
+            target[user_id].update(spots)
+    assert merged == fresh
+    assert 9 in merged[1] and 1 not in merged[2] and merged[11] == {3} and 12 not in merged
+    for user_id, spots in read_lines(test).items():
+        assert all(is_test_interaction(user_id, spot_id, 0.2, 2019) for spot_id in spots)
+
+
+def test_delta_export_leaves_recent_writes_for_the_next_run(graph, tmp_path):
+    converter = ParkingDataConverter(FakeProvider(graph), rating_threshold=THRESHOLD)
+    train = str(tmp_path / 'train.txt')
+    converter.convert_and_save(train, lag_ms=0)
+
+    graph.rate(1, 9, 5.0)
+    assert converter.export_delta(train, lag_ms=100) == 0
+    assert 9 not in read_lines(train)[1]
+
+    graph.now += 100
+    assert converter.export_delta(train, lag_ms=100) == 1
+    assert 9 in read_lines(train)[1]
@@ -0,0 +1,103 @@
+import os
+import sys
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model', 'utility'))
+
+from load_data import Data, UserItems, read_interactions
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_malformed_first_line_is_skipped(tmp_path):
+    uids, lengths, indices = read_interactions(write(tmp_path / 'train.txt', 'x 1 2\n0 3 4\n1 5\n'))
+    assert uids.tolist() == [0, 1]
+    assert lengths.tolist() == [2, 1]
+    assert indices.tolist() == [3, 4, 5]
+
+
+def test_malformed_middle_line_keeps_previous_user(tmp_path):
+    uids, lengths, indices = read_interactions(write(tmp_path / 'train.txt', '0 1 2\n1 3 oops 4\n2\t5,6\n'))
+    assert uids.tolist() == [0, 2]
+    assert lengths.tolist() == [2, 2]
+    assert indices.tolist() == [1, 2, 5, 6]
+
+    items = UserItems(3, uids, lengths, indices)
+    assert items[0].tolist() == [1, 2]
+    assert items[2].tolist() == [5, 6]
+    assert 1 not in items
+
+
+def test_sizes_are_python_ints(tmp_path):
+    write(tmp_path / 'train.txt', '0 1 2\n1 3\n')
+    write(tmp_path / 'test.txt', '0 3\n1 1\n')
+    data = Data(str(tmp_path), batch_size=2)
+    assert type(data.n_users) is int and type(data.n_items) is int
+    assert (data.n_users, data.n_items) == (2, 4)
+    assert np.array_equal(data.R.toarray(), [[0, 1, 1, 0], [0, 0, 0, 1]])
+
+
+def random_dataset(path, n_users=40, n_items=60, seed=0):
+    rng = np.random.RandomState(seed)
+    train, test = [], []
+    for uid in range(n_users):
+        items = rng.choice(n_items, size=rng.randint(2, 12), replace=False)
+        train.append('%d %s' % (uid, ' '.join(map(str, items[1:]))))
+        test.append('%d %d' % (uid, items[0]))
+    write(path / 'train.txt', '\n'.join(train) + '\n')
+    write(path / 'test.txt', '\n'.join(test) + '\n')
+    return Data(str(path), batch_size=64)
+
+
+def test_sample_vectorized_draws_valid_triples(tmp_path):
+    data = random_dataset(tmp_path)
+    R = data.R.toarray()
+    for _ in range(20):
+        users, pos_items, neg_items = data.sample_vectorized(np.random.RandomState(1))
+        assert len(users) == len(pos_items) == len(neg_items) == data.batch_size
+        assert np.all(R[users, pos_items] == 1)
+        assert np.all(R[users, neg_items] == 0)
+
+
+def test_sample_vectorized_is_deterministic_for_a_seed(tmp_path):
+    data = random_dataset(tmp_path)
+    first = data.sample_vectorized(np.random.RandomState(7))
+    second = data.sample_vectorized(np.random.RandomState(7))
+    other = data.sample_vectorized(np.random.RandomState(8))
+    assert all(np.array_equal(a, b) for a, b in zip(first, second))
+    assert not all(np.array_equal(a, b) for a, b in zip(first, other))
+
+
+def test_sample_negatives_covers_every_non_train_item(tmp_path):
+    data = random_dataset(tmp_path)
+    users = np.zeros(20000, dtype=np.int64)
+    neg_items = data.sample_negatives(users, np.random.RandomState(0))
+    assert set(neg_items.tolist()) == set(range(data.n_items)) - set(data.train_items[0].tolist())
+
+
+def test_create_adj_mat_matches_dense_normalization(tmp_path):
+    data = random_dataset(tmp_path)
+    adj_mat, norm_adj_mat, mean_adj_mat = data.create_adj_mat()
+
+    R = data.R.toarray()
+    A = np.block([[np.zeros((data.n_users, data.n_users)), R], [R.T, np.zeros((data.n_items, data.n_items))]])
+
+    def row_normalize(matrix):
+        degree = matrix.sum(axis=1, keepdims=True)
+        return np.divide(matrix, degree, out=np.zeros_like(matrix), where=degree > 0)
+
+    np.testing.assert_array_equal(adj_mat.toarray(), A)
+    np.testing.assert_allclose(norm_adj_mat.toarray(), row_normalize(A + np.eye(len(A))), rtol=1e-6)
+    np.testing.assert_allclose(mean_adj_mat.toarray(), row_normalize(A), rtol=1e-6)
+
+
+def test_repeated_interactions_count_once(tmp_path):
+    write(tmp_path / 'train.txt', '0 1 1 2\n1 2\n')
+    write(tmp_path / 'test.txt', '0 0\n')
+    adj_mat, _, _ = Data(str(tmp_path), batch_size=2).create_adj_mat()
+    assert adj_mat.max() == 1
+    assert adj_mat.nnz == 6
@@ -0,0 +1,63 @@
+import os
+import sys
+import threading
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model', 'utility'))
+
+from load_data import Data
+from loader import BatchLoader
+
+
+@pytest.fixture
+def data(tmp_path):
+    rng = np.random.RandomState(0)
+    with open(tmp_path / 'train.txt', 'w') as train, open(tmp_path / 'test.txt', 'w') as test:
+        for uid in range(50):
+            items = rng.choice(80, size=rng.randint(2, 10), replace=False)
+            train.write('%d %s\n' % (uid, ' '.join(map(str, items[1:]))))
+            test.write('%d %d\n' % (uid, items[0]))
+    return Data(str(tmp_path), batch_size=32)
+
+
+def collect(loader, epoch):
+    return [[x.numpy() for x in batch] for batch in loader.epoch(epoch)]
+
+
+def assert_same_batches(first, second):
+    assert len(first) == len(second)
+    for a, b in zip(first, second):
+        assert all(np.array_equal(x, y) for x, y in zip(a, b))
+
+
+@pytest.mark.parametrize('mode', ['sample', 'epoch'])
+def test_batches_only_depend_on_the_seed(data, mode):
+    reference = collect(BatchLoader(data, seed=3, mode=mode, num_workers=0), epoch=1)
+    for num_workers in (1, 3):
+        assert_same_batches(collect(BatchLoader(data, seed=3, mode=mode, num_workers=num_workers), epoch=1),
+                            reference)
+
+    other_epoch = collect(BatchLoader(data, seed=3, mode=mode, num_workers=0), epoch=2)
+    assert not all(np.array_equal(a[0], b[0]) for a, b in zip(reference, other_epoch))
+
+
+def test_epoch_mode_uses_every_interaction_once(data):
+    loader = BatchLoader(data, seed=0, mode='epoch', num_workers=2)
+    batches = collect(loader, epoch=0)
+    users = np.concatenate([batch[0] for batch in batches])
+    pos_items = np.concatenate([batch[1] for batch in batches])
+    neg_items = np.concatenate([batch[2] for batch in batches])
+
+    assert sorted(zip(users.tolist(), pos_items.tolist())) == \
+        sorted(zip(loader.train_users.tolist(), loader.train_pos_items.tolist()))
+    assert not data.is_train_item(users, neg_items).any()
+
+
+def test_abandoned_epoch_stops_the_workers(data):
+    before = threading.active_count()
+    batches = BatchLoader(data, seed=0, num_workers=2, prefetch=1).epoch(0)
+    next(batches)
+    batches.close()
+    assert threading.active_count() == before
@@ -0,0 +1,47 @@
+import os
+import sys
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'model', 'utility'))
+
+from metrics import (average_precision, average_precision_batch, batch_metrics, hit_at_k, mean_average_precision,
+                     ndcg_at_k, precision_at_k, recall_at_k)
+
+KS = [1, 5, 10, 20, 50]
+
+
+@pytest.fixture
+def ranked():
+    rng = np.random.RandomState(2019)
+    hits = (rng.random_sample((500, max(KS))) < 0.1).astype(np.float64)
+    n_pos = hits.sum(axis=1).astype(np.int64) + rng.randint(0, 5, size=len(hits))
+    return hits, n_pos
+
+
+def test_batch_metrics_match_scalar_metrics(ranked):
+    hits, n_pos = ranked
+    batch = batch_metrics(hits, KS, n_pos)
+    scalar = {'precision': [], 'recall': [], 'ndcg': [], 'hit_ratio': [], 'map': []}
+    for r, n in zip(hits, n_pos):
+        ground_truth = list(range(n))
+        scalar['precision'].append([precision_at_k(r, K) for K in KS])
+        scalar['recall'].append([recall_at_k(r, K, n) if n else 0. for K in KS])
+        scalar['ndcg'].append([ndcg_at_k(r, K, ground_truth) for K in KS])
+        scalar['hit_ratio'].append([hit_at_k(r, K) for K in KS])
+        scalar['map'].append([average_precision(r, K) for K in KS])
+
+    for name, values in scalar.items():
+        np.testing.assert_allclose(batch[name], np.array(values), rtol=0, atol=1e-9, err_msg=name)
+
+
+def test_average_precision_batch_matches_mean_average_precision(ranked):
+    hits, _ = ranked
+    assert np.isclose(mean_average_precision(hits), average_precision_batch(hits, [max(KS)])[:, 0].mean())
+
+
+def test_precision_is_capped_by_number_of_candidates():
+    hits = np.array([[1., 1., 0., 0.]])
+    precision = batch_metrics(hits, [4], n_pos=[2], n_candidates=[2])['precision']
+    assert precision.tolist() == [[1.]]
@@ -0,0 +1,72 @@
+import numpy as np
+
+from db_utils.neighbor_index import UserNeighborIndex
+from db_utils.recommendation_engine import RecommendationEngine
+
+
+def assert_same_entries(index, expected):
+    assert set(index.entries) == set(expected.entries)
+    for user_id, (neighbor_ids, sims, commons) in expected.entries.items():
+        actual_ids, actual_sims, actual_commons = index.entries[user_id]
+        np.testing.assert_array_equal(actual_ids, neighbor_ids)
+        np.testing.assert_allclose(actual_sims, sims)
+        np.testing.assert_array_equal(actual_commons, commons)
+
+
+def rebuilt(engine, index):
+    expected = UserNeighborIndex(top_k=index.top_k, min_common=index.min_common, min_sim=index.min_sim)
+    expected.build(engine)
+    return expected
+
+
+class CountingIndex(UserNeighborIndex):
+    builds = 0
+
+    def build(self, engine):
+        self.builds += 1
+        super().build(engine)
+
+
+def test_local_writes_refresh_to_the_same_entries_as_a_rebuild(rating_graph):
+    index = CountingIndex(top_k=10, min_common=2)
+    engine = RecommendationEngine(rating_graph, neighbor_index=index, reload_interval=None)
+    engine.ensure_loaded()
+
+    engine.update_ratings([(1, 5, 1.0), (2, 5, 5.0), (999999, 5, 4.0), (999999, 7, 3.5)])
+
+    assert index.builds == 1
+    assert_same_entries(index, rebuilt(engine, index))
+
+
+def test_reload_keeps_entries_and_refreshes_changed_users(rating_graph):
+    index = CountingIndex(top_k=10, min_common=2)
+    engine = RecommendationEngine(rating_graph, neighbor_index=index, reload_interval=0)
+    engine.ensure_loaded()
+
+    # another worker removes one user's ratings, changes one rating and adds a new user
+    removed = rating_graph.ratings[0]['user_id']
+    rating_graph.ratings = [rating for rating in rating_graph.ratings if rating['user_id'] != removed]
+    rating_graph.ratings[5] = dict(rating_graph.ratings[5], rating=1.0)
+    rating_graph.add(999999, rating_graph.ratings[0]['parking_spot_id'], 5.0)
+    rating_graph.add(999999, rating_graph.ratings[1]['parking_spot_id'], 4.0)
+    engine.ensure_loaded()
+
+    assert rating_graph.rating_loads == 2
+    assert index.builds == 1
+    assert removed not in index.entries
+    assert_same_entries(index, rebuilt(engine, index))
+
+
+def test_saved_index_is_reused_only_for_the_same_ratings(rating_graph, tmp_path):
+    path = str(tmp_path / 'neighbors.npz')
+    engine = RecommendationEngine(rating_graph, neighbor_index=UserNeighborIndex(path=path), reload_interval=None)
+    engine.ensure_loaded()
+
+    index = UserNeighborIndex(path=path)
+    assert index.load(path, engine)
+    assert_same_entries(index, engine.neighbor_index)
+
+    rating_graph.add(1, 5, 1.0)
+    changed = RecommendationEngine(rating_graph, reload_interval=None)
+    changed.ensure_loaded()
+    assert not UserNeighborIndex(path=path).load(path, changed)
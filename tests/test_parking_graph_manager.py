@@ -0,0 +1,90 @@
+from contextlib import contextmanager
+
+from db_utils.parking_graph_manager import ParkingGraphManager
+
+
+class FakeGraph:
+    def __init__(self, parking_ids=(), user_ids=()):
+        self.ids = {'ParkingSpot': set(parking_ids), 'User': set(user_ids)}
+        self.lookups = []
+
+    def run(self, query, ids=()):
+        label = 'ParkingSpot' if ':ParkingSpot' in query else 'User'
+        self.lookups.append((label, sorted(ids)))
+        return [{'id': node_id} for node_id in ids if node_id in self.ids[label]]
+
+
+class FakeTransaction:
+    def __init__(self, graph, writes):
+        self.graph = graph
+        self.writes = writes
+
+    def run(self, query, **parameters):
+        self.writes.append((' '.join(query.split()), parameters))
+        if ':ParkingSpot) SET' in query:
+            self.graph.ids['ParkingSpot'].update(row['id'] for row in parameters['rows'])
+        elif ':User {id: id}' in query:
+            self.graph.ids['User'].update(parameters['ids'])
+
+
+class FakeProvider:
+    def __init__(self, graph):
+        self.graph = graph
+        self.transactions = []
+
+    @contextmanager
+    def transaction(self):
+        writes = []
+        yield FakeTransaction(self.graph, writes)
+        self.transactions.append(writes)
+
+
+class FakeEngine:
+    def __init__(self):
+        self.updates = []
+
+    def update_ratings(self, ratings):
+        self.updates.append(list(ratings))
+
+
+def parking_row(spot_id):
+    return [spot_id, 100, 50, 3, 5, '容易', '是', '否', 4.5, '商场', 118.9, 25.8]
+
+
+def test_create_parking_nodes_skips_existing_and_duplicate_ids():
+    provider = FakeProvider(FakeGraph(parking_ids={2}))
+    manager = ParkingGraphManager(provider)
+
+    created = manager.create_parking_nodes([parking_row(i) for i in (1, 2, 3, 1, 4)], batch_size=3)
+
+    assert created == 3
+    assert provider.graph.lookups == [('ParkingSpot', [1, 2, 3]), ('ParkingSpot', [1, 4])]
+    # one transaction per batch; spot 1 was created by the first batch, so the second only creates spot 4
+    assert [[row['id'] for row in writes[0][1]['rows']] for writes in provider.transactions] == [[1, 3], [4]]
+
+
+def test_create_user_nodes_batches_lookups():
+    provider = FakeProvider(FakeGraph(user_ids={10}))
+    manager = ParkingGraphManager(provider)
+
+    created = manager.create_user_nodes([[1, 10], [2, 11], [3, 11], [4, 12]], batch_size=10)
+
+    assert created == 2
+    assert provider.graph.lookups == [('User', [10, 11, 12])]
+    assert provider.transactions == [[('UNWIND $ids AS id CREATE (:User {id: id})', {'ids': [11, 12]})]]
+
+
+def test_create_rating_relations_skips_missing_nodes_and_updates_engine():
+    provider = FakeProvider(FakeGraph(parking_ids={1, 2}, user_ids={10}))
+    engine = FakeEngine()
+    manager = ParkingGraphManager(provider, recommendation_engine=engine)
+
+    created, message = manager.create_rating_relations([[1, 10, 4.5], [2, 10, '3'], [3, 10, 5], [1, 11, 2]])
+
+    assert created == 2
+    assert message.startswith('2 ratings skipped')
+    (query, parameters), = provider.transactions[0]
+    assert 'ingested_at: timestamp()' in query
+    assert parameters['rows'] == [{'parking_spot_id': 1, 'user_id': 10, 'grading': 4.5},
+                                  {'parking_spot_id': 2, 'user_id': 10, 'grading': 3.0}]
+    assert engine.updates == [[(10, 1, 4.5), (10, 2, 3.0)]]
@@ -0,0 +1,114 @@
+import math
+from collections import defaultdict
+
+import pytest
+
+from db_utils.neighbor_index import UserNeighborIndex
+from db_utils.recommendation_engine import RecommendationEngine
+
+
+def cypher_recommend(ratings, user_id, k=10, parking_common=3, users_common=2, threshold_sim=0.9, m=5):
+    """Straight re-implementation of the Cypher similarity pipeline the engine replaced."""
+    by_user = defaultdict(dict)
+    for rating in ratings:
+        by_user[rating['user_id']][rating['parking_spot_id']] = rating['rating']
+
+    mine, similar = by_user[user_id], []
+    for other, theirs in by_user.items():
+        common = set(mine) & set(theirs)
+        if other == user_id or len(common) < parking_common:
+            continue
+        sim = sum(mine[p] * theirs[p] for p in common) / (
+            math.sqrt(sum(mine[p] ** 2 for p in common)) * math.sqrt(sum(theirs[p] ** 2 for p in common)))
+        if sim > threshold_sim:
+            similar.append((sim, other))
+    similar.sort(key=lambda item: (-item[0], item[1]))
+
+    totals = defaultdict(lambda: [0., 0., 0])
+    for sim, other in similar[:k]:
+        for spot_id, grading in by_user[other].items():
+            total = totals[spot_id]
+            total[0] += grading * sim
+            total[1] += sim
+            total[2] += 1
+    results = [(spot_id, weighted / sim_sum, num) for spot_id, (weighted, sim_sum, num) in totals.items()
+               if num >= users_common]
+    results.sort(key=lambda item: (-item[1], -item[2]))
+    return results[:m]
+
+
+def as_triples(recommendations):
+    return [(item['id'], item['grade'], item['num']) for item in recommendations]
+
+
+def test_recommend_matches_cypher_semantics(rating_graph):
+    engine = RecommendationEngine(rating_graph, reload_interval=None)
+    # m larger than any candidate list, so ties at the cut-off cannot make the comparison ambiguous
+    for user_id in range(1, 101):
+        expected = cypher_recommend(rating_graph.ratings, user_id, k=1000, threshold_sim=0.8, m=1000)
+        actual = as_triples(engine.recommend(user_id, k=1000, threshold_sim=0.8, m=1000))
+        actual_sorted, expected_sorted = sorted(actual), sorted(expected)
+        assert [(spot_id, num) for spot_id, _, num in actual_sorted] == \
+            [(spot_id, num) for spot_id, _, num in expected_sorted]
+        assert [grade for _, grade, _ in actual_sorted] == pytest.approx([grade for _, grade, _ in expected_sorted])
+        assert [(-grade, -num) for _, grade, num in actual] == sorted((-grade, -num) for _, grade, num in actual)
+
+
+def test_recommend_with_default_parameters(rating_graph):
+    engine = RecommendationEngine(rating_graph, reload_interval=None)
+    for user_id in (1, 3, 17, 42):
+        expected = cypher_recommend(rating_graph.ratings, user_id)
+        actual = as_triples(engine.recommend(user_id))
+        assert [grade for _, grade, _ in actual] == pytest.approx([grade for _, grade, _ in expected])
+
+
+def test_unknown_user_gets_no_recommendations(rating_graph):
+    assert RecommendationEngine(rating_graph, reload_interval=None).recommend(999999) == []
+
+
+def test_local_write_does_not_reload(rating_graph):
+    engine = RecommendationEngine(rating_graph, reload_interval=0)
+    engine.ensure_loaded()
+    version = engine.version
+
+    rating_graph.add(1, 5, 4.0)
+    engine.update_rating(1, 5, 4.0)
+    engine.ensure_loaded()
+
+    assert rating_graph.rating_loads == 1
+    assert engine.version == version + 1
+    assert engine.ratings[engine.user_index[1], engine.spot_index[5]] == 4.0
+
+
+def test_foreign_write_triggers_reload(rating_graph):
+    engine = RecommendationEngine(rating_graph, reload_interval=0)
+    engine.ensure_loaded()
+    version = engine.version
+
+    rating_graph.add(999999, 5, 4.0)
+    engine.ensure_loaded()
+
+    assert rating_graph.rating_loads == 2
+    assert engine.version == version + 1
+    assert 999999 in engine.user_index
+
+
+def test_reload_interval_none_loads_once(rating_graph):
+    engine = RecommendationEngine(rating_graph, reload_interval=None)
+    engine.ensure_loaded()
+    rating_graph.add(999999, 5, 4.0)
+    engine.ensure_loaded()
+    assert rating_graph.rating_loads == 1
+
+
+@pytest.mark.parametrize('use_index', [False, True])
+def test_recommend_batch_matches_recommend(rating_graph, use_index):
+    neighbor_index = UserNeighborIndex(top_k=10, min_common=3) if use_index else None
+    engine = RecommendationEngine(rating_graph, neighbor_index=neighbor_index, reload_interval=None)
+    user_ids = list(range(1, 60)) + [999999]
+
+    batch = dict(engine.recommend_batch(user_ids, chunk_size=16))
+
+    assert list(batch) == user_ids
+    for user_id in user_ids:
+        assert batch[user_id] == engine.recommend(user_id)
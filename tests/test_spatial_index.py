@@ -0,0 +1,57 @@
+import numpy as np
+import pytest
+
+from conftest import FakeRatingGraph, load_original_ratings, load_spot_coordinates
+from db_utils.recommendation_engine import RecommendationEngine
+from db_utils.spatial_index import SpatialGridIndex, haversine, parse_location
+
+
+def brute_force(spots, longitude, latitude, radius):
+    ids = np.array(list(spots), dtype=np.int64)
+    coords = np.array([(spot['longitude'], spot['latitude']) for spot in spots.values()])
+    distances = haversine(longitude, latitude, coords[:, 0], coords[:, 1])
+    return set(ids[distances <= radius].tolist())
+
+
+@pytest.mark.parametrize('radius', [300, 1000, 3000, 20000])
+@pytest.mark.parametrize('cell_size', [250.0, 1000.0])
+def test_query_radius_matches_brute_force(radius, cell_size):
+    spots = load_spot_coordinates()
+    index = SpatialGridIndex.from_spots(spots, cell_size=cell_size)
+    rng = np.random.RandomState(0)
+    for spot_id in rng.choice(list(spots), size=10, replace=False):
+        longitude, latitude = spots[int(spot_id)]['longitude'], spots[int(spot_id)]['latitude']
+        spot_ids, distances = index.query_radius(longitude, latitude, radius)
+
+        assert set(spot_ids.tolist()) == brute_force(spots, longitude, latitude, radius)
+        assert np.all(np.diff(distances) >= 0)
+        assert np.all(distances <= radius)
+
+
+def test_insert_moves_an_existing_spot():
+    index = SpatialGridIndex()
+    index.insert(1, 119.28, 26.04)
+    index.insert(1, 119.50, 26.30)
+    assert index.query_radius(119.28, 26.04, 500)[0].tolist() == []
+    assert index.query_radius(119.50, 26.30, 500)[0].tolist() == [1]
+
+
+def test_parse_location():
+    assert parse_location('119.28,26.04') == (119.28, 26.04)
+    with pytest.raises(ValueError):
+        parse_location('119.28')
+
+
+def test_recommendations_stay_within_radius():
+    spots = load_spot_coordinates()
+    engine = RecommendationEngine(FakeRatingGraph(load_original_ratings(), spots), reload_interval=None)
+    center = (spots[1]['longitude'], spots[1]['latitude'])
+    nearby = brute_force(spots, center[0], center[1], 5000)
+
+    found = False
+    for user_id in range(1, 30):
+        recommendations = engine.recommend(user_id, threshold_sim=0.8, m=10, location=center, radius=5000)
+        found = found or bool(recommendations)
+        assert {item['id'] for item in recommendations} <= nearby
+        assert all(item['distance'] <= 5000 for item in recommendations)
+    assert found
@@ -0,0 +1,133 @@
+import csv
+import json
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from conftest import REPO_ROOT, FakeRatingGraph, load_original_ratings
+from db_utils.parking_graph_manager import ParkingGraphManager
+from db_utils.recommendation_engine import SPOT_FIELDS, RecommendationEngine
+from db_utils.spot_catalog import SpotCatalog, ensure_catalog, records_from_csv, records_from_dump, write_catalog
+
+CSV_PATH = os.path.join(REPO_ROOT, 'data', 'parking_spots_with_coords.csv')
+
+FILTERS = [
+    {},
+    {'parking_types': ['商场']},
+    {'max_fee': 10},
+    {'parking_difficulty': '容易', 'near_elevator': True},
+    {'has_surveillance': False, 'parking_types': ['停车场', '机场'], 'max_fee': 8},
+    {'spot_ids': [1, 5, 300]},
+]
+
+
+@pytest.fixture(scope='module')
+def spots():
+    with open(CSV_PATH, encoding='utf-8') as f:
+        rows = list(csv.reader(f))[1:]
+    return {int(row[0]): ParkingGraphManager.parking_properties(row) for row in rows}
+
+
+@pytest.fixture
+def catalog(tmp_path):
+    write_catalog(str(tmp_path / 'spots'), records_from_csv(CSV_PATH))
+    return SpotCatalog(str(tmp_path / 'spots'))
+
+
+def reference_filter(spots, parking_types=None, max_fee=None, parking_difficulty=None, near_elevator=None,
+                     has_surveillance=None, spot_ids=None):
+    df = pd.DataFrame(spots.values())
+    mask = np.ones(len(df), dtype=bool)
+    if parking_types is not None:
+        mask &= df.parking_type.isin(parking_types)
+    if max_fee is not None:
+        mask &= df.fee <= max_fee
+    if parking_difficulty is not None:
+        mask &= df.parking_difficulty == parking_difficulty
+    if near_elevator is not None:
+        mask &= (df.near_elevator == '是') == near_elevator
+    if has_surveillance is not None:
+        mask &= (df.has_surveillance == '是') == has_surveillance
+    if spot_ids is not None:
+        mask &= df.id.isin(spot_ids)
+    return sorted(df.id[mask])
+
+
+def test_round_trip_matches_node_properties(catalog, spots):
+    assert len(catalog) == len(spots)
+    for spot_id, expected in spots.items():
+        actual = catalog.get(spot_id)
+        assert actual == expected
+        assert [type(actual[key]) for key in expected] == [type(value) for value in expected.values()]
+    assert catalog.get(99999) is None
+    assert 5 in catalog and 0 not in catalog
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_filter_matches_reference(catalog, spots, filters):
+    assert list(catalog.filter(**filters)) == reference_filter(spots, **filters)
+
+
+def test_filter_limit(catalog):
+    assert len(catalog.filter(limit=3)) == 3
+
+
+def test_missing_values_stay_missing(tmp_path):
+    records = pd.DataFrame([{'id': 1, 'fee': None, 'driving_distance': None, 'parking_type': None,
+                             'near_elevator': None}, {'id': 2, 'fee': 3.0, 'near_elevator': '否'}],
+                           columns=SPOT_FIELDS)
+    write_catalog(str(tmp_path / 'spots'), records)
+    catalog = SpotCatalog(str(tmp_path / 'spots'))
+
+    empty = dict.fromkeys(SPOT_FIELDS)
+    assert catalog.get(1) == dict(empty, id=1)
+    assert catalog.get(2) == dict(empty, id=2, fee=3.0, near_elevator='否')
+    assert list(catalog.filter(max_fee=5)) == [2]
+    assert list(catalog.filter(near_elevator=False)) == [2]
+
+
+def test_rewrite_is_picked_up_and_old_data_is_removed(tmp_path, spots):
+    path = str(tmp_path / 'spots')
+    write_catalog(path, records_from_csv(CSV_PATH))
+    catalog = SpotCatalog(path)
+
+    dump = tmp_path / 'dump.jsonl'
+    with open(dump, 'w', encoding='utf-8') as f:
+        for spot in list(spots.values())[:50]:
+            node = {'type': 'node', 'labels': ['ParkingSpot'], 'properties': spot}
+            f.write(json.dumps(node, ensure_ascii=False) + '\n')
+        f.write(json.dumps({'type': 'node', 'labels': ['User'], 'properties': {'id': 1}}) + '\n')
+    # the rewrite must change the metadata mtime even on filesystems with a coarse timestamp resolution
+    os.utime(path + '.json', ns=(0, 0))
+    write_catalog(path, records_from_dump(str(dump)))
+
+    assert len(catalog) == 50
+    assert catalog.get(50) == spots[50] and catalog.get(51) is None
+    assert len([name for name in os.listdir(tmp_path) if name.endswith('.bin')]) == 1
+
+
+def test_ensure_catalog_builds_only_once(tmp_path, spots):
+    class Graph:
+        calls = 0
+
+        def run(self, query):
+            Graph.calls += 1
+            return FakeRatingGraph([], spots).run(query)
+
+    path = str(tmp_path / 'spots')
+    assert ensure_catalog(path, Graph())
+    assert not ensure_catalog(path, Graph())
+    assert Graph.calls == 1
+    assert SpotCatalog(path).get(7) == spots[7]
+
+
+@pytest.mark.parametrize('filters', FILTERS)
+def test_engine_filters_agree_with_and_without_catalog(catalog, spots, filters):
+    with_catalog = RecommendationEngine(FakeRatingGraph(load_original_ratings(), spots), reload_interval=None,
+                                        spot_catalog=catalog)
+    without_catalog = RecommendationEngine(FakeRatingGraph(load_original_ratings(), spots), reload_interval=None)
+    with_catalog.ensure_loaded()
+    without_catalog.ensure_loaded()
+    np.testing.assert_array_equal(with_catalog.candidate_spots(filters), without_catalog.candidate_spots(filters))